@@ -15,6 +15,51 @@ import {
     Command,
     window
 } from "vscode";
+import { alternativeStore, AlternativeSession } from "./alternatives";
+import { logger } from "./logger";
+
+/**
+ * A function of a document, as the document symbol provider returns it
+ */
+export type FunctionSymbol = DocumentSymbol & SymbolInformation;
+
+/**
+ * Finds the functions of a document, including nested functions and
+ *  methods, in the order they appear.
+ * @param document
+ * @returns the functions' symbols
+ */
+export async function getFunctionSymbols(document: TextDocument): Promise<FunctionSymbol[]> {
+    const functions: FunctionSymbol[] = [];
+    // Get all of the DocumentSymbols from this document
+    const symbols = await commands.executeCommand<FunctionSymbol[]>(
+        "vscode.executeDocumentSymbolProvider",
+        document.uri
+    );
+    if (symbols !== undefined) {
+        for (const symbol of symbols) {
+            collectFunctionSymbols(functions, symbol);
+        }
+    }
+    return functions;
+}
+
+/**
+ * (Recursive) Adds the symbol if it is a function, and the functions among
+ *  its children - called in getFunctionSymbols
+ * @param functions
+ * @param symbol
+ */
+function collectFunctionSymbols(functions: FunctionSymbol[], symbol: any): void {
+    if (symbol.kind === SymbolKind.Function) {
+        functions.push(symbol);
+    }
+
+    // Recursively call this function on all of the children
+    for (const child of symbol.children) {
+        collectFunctionSymbols(functions, child);
+    }
+}
 
 /**
  * 'Generate Docstring' CodeLens
@@ -29,20 +74,32 @@ export class DocstringCodeLens extends CodeLens {
     }
 }
 
+/**
+ * CodeLens of a docstring's alternatives
+ */
+class AlternativeCodeLens extends CodeLens {
+    constructor(
+        public readonly session: AlternativeSession,
+        range: Range,
+    ) {
+        super(range);
+    }
+}
+
 /**
  * 'Previous' CodeLens
  */
-export class PreviousCodeLens extends CodeLens {}
+export class PreviousCodeLens extends AlternativeCodeLens {}
 
 /**
  * 'Next' CodeLens
  */
-export class NextCodeLens extends CodeLens {}
+export class NextCodeLens extends AlternativeCodeLens {}
 
 /**
  * 'Accept' CodeLens
  */
-export class AcceptCodeLens extends CodeLens {}
+export class AcceptCodeLens extends AlternativeCodeLens {}
 
 /**
  * 'Change' CodeLens
@@ -62,9 +119,11 @@ export class DoxideCodeLensProvider implements CodeLensProvider {
     constructor() {
         // Reload the CodeLenses when the config has changed
         workspace.onDidChangeConfiguration((_) => {
-            console.log("Config was changed - reloading codelens provider");
+            logger.debug("DoxideCodeLensProvider", "Config was changed - reloading codelens provider");
             this._onDidChangeCodeLensesEmitter.fire();
         });
+        // Show or hide the alternatives of generated docstrings
+        alternativeStore.onDidChange(() => this._onDidChangeCodeLensesEmitter.fire());
     }
 
     /**
@@ -89,43 +148,33 @@ export class DoxideCodeLensProvider implements CodeLensProvider {
             return [];
         }
 
-        // Get all of the DocumentSymbols from this document
-        let symbols = await commands.executeCommand<DocumentSymbol[]>(
-            "vscode.executeDocumentSymbolProvider",
-            document.uri
-        );
-
-        if (symbols !== undefined) {
-            // Loop through all of the DocumentSymbols
-            for (const symbol of symbols) {
-                this.provideCodeLensHelper(lenses, document, symbol);
-            }
+        // Loop through all of the functions of this document
+        for (const symbol of await getFunctionSymbols(document)) {
+            this.provideCodeLensHelper(lenses, document, symbol);
         }
-        console.log(`Rendering ${lenses.length} CodeLenses!`);
+        logger.trace("DoxideCodeLensProvider", () => `Rendering ${lenses.length} CodeLenses!`);
         return lenses;
     }
 
     /**
-     * (Recursive) Individual CodeLens Provider - called in provideCodeLenses
+     * Individual CodeLens Provider - called in provideCodeLenses
      * @param lenses
      * @param document
-     * @param symbol
+     * @param symbol - a function
      */
     private provideCodeLensHelper(
         lenses: CodeLens[],
         document: TextDocument,
-        symbol: any
+        symbol: FunctionSymbol
     ): void {
-        // Check if the symbol is a function and add DocstringCodeLens
-        if (symbol.kind === SymbolKind.Function) {
-            // console.log(`  Function found: ${JSON.stringify(symbol, null, 2)} | symbol.selectionrange: ${symbol.selectionrange} | symbol.selection_range: ${symbol.selection_range}`);
-            lenses.push(new DocstringCodeLens(symbol.range, symbol.location.range));
-        }
-
-        // Recursively call this function on all of the children
-        for (const child of symbol.children) {
-            // console.log(`    Symbol has children!`);
-            this.provideCodeLensHelper(lenses, document, child);
+        lenses.push(new DocstringCodeLens(symbol.range, symbol.location.range));
+        const session = alternativeStore.find(document.uri, symbol.location.range.start.line);
+        if (session) {
+            lenses.push(
+                new PreviousCodeLens(session, symbol.location.range),
+                new NextCodeLens(session, symbol.location.range),
+                new AcceptCodeLens(session, symbol.location.range)
+            );
         }
     }
 
@@ -185,7 +234,7 @@ export class DoxideCodeLensProvider implements CodeLensProvider {
             title: "Previous",
             tooltip: "View previous alternative.",
             command: "doxide.previousAlternative",
-            arguments: [],
+            arguments: [lens.session.key],
         };
         return lens;
     }
@@ -198,7 +247,7 @@ export class DoxideCodeLensProvider implements CodeLensProvider {
             title: "Next",
             tooltip: "View next alternative.",
             command: "doxide.nextAlternative",
-            arguments: [],
+            arguments: [lens.session.key],
         };
         return lens;
     }
@@ -208,10 +257,10 @@ export class DoxideCodeLensProvider implements CodeLensProvider {
         _token: CancellationToken
     ): CodeLens {
         lens.command = {
-            title: "Accept",
+            title: `Accept (${lens.session.index + 1}/${lens.session.alternatives.length})`,
             tooltip: "Accept current alternative",
             command: "doxide.acceptAlternative",
-            arguments: [],
+            arguments: [lens.session.key],
         };
         return lens;
     }
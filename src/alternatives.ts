@@ -0,0 +1,145 @@
+import { Disposable, EventEmitter, Range, Uri, window, workspace, WorkspaceEdit } from "vscode";
+import { applyOwnEdit, isOwnChange } from "./anchor";
+
+/**
+ * The completions of one docstring request, kept so that the user can cycle
+ *  through them in place.
+ */
+export interface AlternativeSession {
+    key: string;
+    uri: Uri;
+    /** where the shown alternative is in the document */
+    range: Range;
+    /** the alternatives as they are inserted, with indentation and tokens */
+    alternatives: string[];
+    index: number;
+}
+
+/**
+ * Session store of the alternatives of the docstrings that were just
+ *  generated, per function. Sessions end when an alternative is accepted or
+ *  the document is changed by anything but switching alternatives.
+ */
+export class AlternativeStore {
+    private readonly sessions = new Map<string, AlternativeSession>();
+    private readonly changed = new EventEmitter<void>();
+    public readonly onDidChange = this.changed.event;
+
+    /**
+     * Starts a session for a docstring whose first alternative is shown.
+     * @param uri - of the document
+     * @param range - of the shown docstring
+     * @param alternatives - the formatted alternatives, the shown one first
+     */
+    public start(uri: Uri, range: Range, alternatives: string[]): AlternativeSession | undefined {
+        if (alternatives.length < 2) {
+            return undefined;
+        }
+        const key = `${uri.toString()}#${range.start.line}`;
+        const session = { key, uri, range, alternatives, index: 0 };
+        this.sessions.set(key, session);
+        this.changed.fire();
+        return session;
+    }
+
+    /**
+     * @returns the session of the docstring at or next to `line`
+     */
+    public find(uri: Uri, line: number): AlternativeSession | undefined {
+        for (const session of this.sessions.values()) {
+            if (session.uri.toString() === uri.toString() && session.range.start.line <= line + 1 && session.range.end.line >= line) {
+                return session;
+            }
+        }
+        return undefined;
+    }
+
+    /**
+     * @returns the session of the given key, else the one at the cursor of
+     *  the active editor, else the most recent one of its document
+     */
+    public resolve(key?: string): AlternativeSession | undefined {
+        if (key) {
+            return this.sessions.get(key);
+        }
+        const editor = window.activeTextEditor;
+        if (!editor) {
+            return undefined;
+        }
+        const atCursor = this.find(editor.document.uri, editor.selection.active.line);
+        if (atCursor) {
+            return atCursor;
+        }
+        return [...this.sessions.values()].reverse().find(session => session.uri.toString() === editor.document.uri.toString());
+    }
+
+    /**
+     * Replaces the shown alternative with the one `offset` places away.
+     * @param session
+     * @param offset - 1 for the next alternative, -1 for the previous one
+     */
+    public async cycle(session: AlternativeSession, offset: number): Promise<boolean> {
+        const index = (session.index + offset + session.alternatives.length) % session.alternatives.length;
+        const alternative = session.alternatives[index];
+        const applied = await this.apply(session.uri, session.range, alternative);
+        if (applied) {
+            const start = session.range.start;
+            const lines = alternative.split("\n");
+            const end = lines.length > 1
+                ? start.translate(lines.length - 1).with(undefined, lines[lines.length - 1].length)
+                : start.translate(0, alternative.length);
+            session.range = new Range(start, end);
+            session.index = index;
+            this.changed.fire();
+        }
+        return applied;
+    }
+
+    /**
+     * Keeps the shown alternative and ends the session.
+     */
+    public accept(session: AlternativeSession) {
+        this.sessions.delete(session.key);
+        this.changed.fire();
+    }
+
+    /**
+     * Ends the sessions of documents that are edited or closed.
+     */
+    public watch(): Disposable {
+        return Disposable.from(
+            workspace.onDidChangeTextDocument(event => {
+                if (event.contentChanges.length && !isOwnChange(event)) {
+                    this.discard(event.document.uri);
+                }
+            }),
+            workspace.onDidCloseTextDocument(document => this.discard(document.uri))
+        );
+    }
+
+    public get size(): number {
+        return this.sessions.size;
+    }
+
+    private discard(uri: Uri) {
+        let discarded = false;
+        for (const [key, session] of this.sessions) {
+            if (session.uri.toString() === uri.toString()) {
+                this.sessions.delete(key);
+                discarded = true;
+            }
+        }
+        if (discarded) {
+            this.changed.fire();
+        }
+    }
+
+    private async apply(uri: Uri, range: Range, text: string): Promise<boolean> {
+        const edit = new WorkspaceEdit();
+        edit.replace(uri, range, text);
+        // the document does not have to be shown
+        return await applyOwnEdit(edit);
+    }
+}
+
+export const alternativeStore = new AlternativeStore();
@@ -0,0 +1,212 @@
+import { Disposable, EventEmitter, Range, TextDocument, TextDocumentChangeEvent, Uri, workspace, WorkspaceEdit } from "vscode";
+
+/** Tries of an edit that is rejected because the document changed meanwhile */
+const MAX_ATTEMPTS = 3;
+
+
+export interface OffsetRange {
+    start: number;
+    length: number;
+}
+
+export interface AdjustedRange extends OffsetRange {
+    /** whether the change was within the range */
+    touched: boolean;
+}
+
+export interface ContentChange {
+    rangeOffset: number;
+    rangeLength: number;
+    text: string;
+}
+
+/** An edit of Doxide to one document that is being applied */
+interface OwnEdit {
+    /** version of the document before the edit */
+    version: number;
+    /** the inserted texts, normalized */
+    texts: string[];
+}
+
+/** Edits of Doxide that are being applied, by document URI */
+const ownEdits = new Map<string, OwnEdit[]>();
+/** Whether Doxide made a change, decided once for all listeners of the change */
+const ownChanges = new WeakMap<TextDocumentChangeEvent, boolean>();
+
+/**
+ * @returns the texts in a form that does not depend on their order or the
+ *  line endings of the document
+ */
+function normalizeTexts(texts: string[]): string[] {
+    return texts.map(text => text.replace(/\r\n/g, "\n")).sort();
+}
+
+/**
+ * Applies an edit of Doxide. Anchors move through these edits, but are not
+ *  touched by them.
+ */
+export async function applyOwnEdit(edit: WorkspaceEdit): Promise<boolean> {
+    const pending = new Map<string, OwnEdit>();
+    for (const [uri, textEdits] of edit.entries()) {
+        const key = uri.toString();
+        const document = workspace.textDocuments.find(document => document.uri.toString() === key);
+        const own = pending.get(key) || { version: document?.version ?? 0, texts: [] };
+        own.texts.push(...textEdits.map(textEdit => textEdit.newText));
+        pending.set(key, own);
+    }
+    for (const [key, own] of pending) {
+        own.texts = normalizeTexts(own.texts);
+        ownEdits.set(key, [...(ownEdits.get(key) || []), own]);
+    }
+    try {
+        return await workspace.applyEdit(edit);
+    } finally {
+        // edits that did not change their document (rejected or empty)
+        for (const [key, own] of pending) {
+            const remaining = (ownEdits.get(key) || []).filter(other => other !== own);
+            if (remaining.length) {
+                ownEdits.set(key, remaining);
+            } else {
+                ownEdits.delete(key);
+            }
+        }
+    }
+}
+
+/**
+ * Tells the changes of `applyOwnEdit` from those the user (or another
+ *  extension) makes while it is being applied: a change is Doxide's if it
+ *  makes a newer version of a document with one of its edits pending and
+ *  inserts the texts of that edit. Each edit is matched once.
+ * @returns whether Doxide made the change
+ */
+export function isOwnChange(event: TextDocumentChangeEvent): boolean {
+    let own = ownChanges.get(event);
+    if (own === undefined) {
+        const edits = ownEdits.get(event.document.uri.toString()) || [];
+        const texts = normalizeTexts(event.contentChanges.map(change => change.text));
+        const index = edits.findIndex(edit =>
+            edit.version < event.document.version
+            && edit.texts.length === texts.length
+            && edit.texts.every((text, i) => text === texts[i]));
+        own = index !== -1;
+        if (own) {
+            edits.splice(index, 1);
+        }
+        ownChanges.set(event, own);
+    }
+    return own;
+}
+
+/**
+ * Moves a range of a document through a change of the document.
+ * @param range
+ * @param change
+ * @param own - whether Doxide made the change, which then grows or shrinks
+ *  the range it is in (or at the end of) instead of touching it
+ * @returns the moved range and whether the change touched it
+ */
+export function adjustRange(range: OffsetRange, change: ContentChange, own: boolean): AdjustedRange {
+    const end = range.start + range.length;
+    const changeEnd = change.rangeOffset + change.rangeLength;
+    const delta = change.text.length - change.rangeLength;
+    const fillsEmpty = own && range.length === 0 && change.rangeOffset === range.start;
+    if (changeEnd <= range.start && !fillsEmpty) {
+        // above, including insertions right before the range
+        return { start: range.start + delta, length: range.length, touched: false };
+    }
+    if (change.rangeOffset >= end && !(own && change.rangeOffset === end)) {
+        return { ...range, touched: false };
+    }
+    return { start: range.start, length: Math.max(range.length + delta, 0), touched: !own };
+}
+
+/**
+ * A range of a document that follows the edits around it, so that text can
+ *  be inserted at the right place even if the user edits above it, switches
+ *  editors or runs other generations in the meantime.
+ */
+export class DocumentAnchor implements Disposable {
+    /** whether anything but Doxide has edited the range */
+    public touched = false;
+    private offsets: OffsetRange;
+    private closed = false;
+    private readonly tracking: Disposable;
+    private readonly touchedEmitter = new EventEmitter<void>();
+    /** fires once when anything but Doxide edits the range or the document is closed */
+    public readonly onDidTouch = this.touchedEmitter.event;
+
+    /**
+     * @param document
+     * @param range - the range to follow
+     */
+    constructor(public readonly document: TextDocument, range: Range) {
+        const start = document.offsetAt(range.start);
+        this.offsets = { start, length: document.offsetAt(range.end) - start };
+        this.tracking = Disposable.from(
+            workspace.onDidChangeTextDocument(event => {
+                if (event.document !== this.document) {
+                    return;
+                }
+                const own = isOwnChange(event);
+                for (const change of event.contentChanges) {
+                    const { touched, ...offsets } = adjustRange(this.offsets, change, own);
+                    this.offsets = offsets;
+                    if (touched) {
+                        this.touch();
+                    }
+                }
+            }),
+            workspace.onDidCloseTextDocument(document => {
+                if (document === this.document) {
+                    this.closed = true;
+                    this.touch();
+                }
+            })
+        );
+    }
+
+    public get uri(): Uri {
+        return this.document.uri;
+    }
+
+    /** the range in the document as it is now */
+    public get range(): Range {
+        return new Range(this.document.positionAt(this.offsets.start), this.document.positionAt(this.offsets.start + this.offsets.length));
+    }
+
+    /**
+     * Applies an edit relative to the range as a `WorkspaceEdit`, which works
+     *  whether the document is shown or not. An edit that is rejected because
+     *  the document changed in the meantime is rebuilt from the moved range.
+     * @param build - adds the edits, given the current range
+     * @returns whether the edit was applied
+     */
+    public async edit(build: (edit: WorkspaceEdit, range: Range) => void): Promise<boolean> {
+        for (let attempt = 0; attempt < MAX_ATTEMPTS && !this.closed; attempt++) {
+            const version = this.document.version;
+            const edit = new WorkspaceEdit();
+            build(edit, this.range);
+            if (await applyOwnEdit(edit)) {
+                return true;
+            }
+            if (this.document.version === version) {
+                // rejected for another reason than a concurrent change
+                return false;
+            }
+        }
+        return false;
+    }
+
+    public dispose() {
+        this.tracking.dispose();
+        this.touchedEmitter.dispose();
+    }
+
+    private touch() {
+        if (!this.touched) {
+            this.touched = true;
+            this.touchedEmitter.fire();
+        }
+    }
+}
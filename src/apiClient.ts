@@ -0,0 +1,288 @@
+/* eslint-disable @typescript-eslint/naming-convention */
+// Header names are not camelCase
+import axios from "axios";
+import * as http from "http";
+import * as http2 from "http2";
+import * as https from "https";
+import { Readable } from "stream";
+import { URL } from "url";
+import * as zlib from "zlib";
+import { CancellationError, CancellationToken, workspace } from "vscode";
+import { telemetry } from "./telemetry";
+
+export interface ApiResponse {
+    status: number;
+    headers: { [name: string]: string | string[] | undefined };
+    /** parsed JSON body, or the (decompressed) body stream for streamed requests */
+    data: any;
+}
+
+/**
+ * Error for a response with an error status - shaped like axios' errors so
+ *  that callers can inspect `error.response` for either transport.
+ */
+export class ApiError extends Error {
+    constructor(message: string, public readonly response: ApiResponse) {
+        super(message);
+        this.name = "ApiError";
+    }
+}
+
+const IDLE_TIMEOUT_MS = 60000;
+
+/**
+ * Shared connection pool: connections are kept open between requests so
+ *  that only the first request to a host pays for DNS, TCP and TLS setup.
+ */
+const keepAliveAgent = new https.Agent({
+    keepAlive: true,
+    keepAliveMsecs: 15000,
+    maxSockets: 16,
+    maxFreeSockets: 4,
+    timeout: IDLE_TIMEOUT_MS,
+});
+
+/** Pool for plain HTTP, e.g. an inference server on localhost */
+const plainKeepAliveAgent = new http.Agent({
+    keepAlive: true,
+    keepAliveMsecs: 15000,
+    maxSockets: 16,
+    maxFreeSockets: 4,
+    timeout: IDLE_TIMEOUT_MS,
+});
+
+/**
+ * Records how long new connections of a pool take to set up. Pooled
+ *  connections that are reused are not recorded.
+ */
+function timeConnections(agent: http.Agent, readyEvent: "connect" | "secureConnect") {
+    const createConnection = (agent as any).createConnection.bind(agent);
+    (agent as any).createConnection = (...args: any[]) => {
+        const startedAt = Date.now();
+        const socket = createConnection(...args);
+        socket?.once?.(readyEvent, () => telemetry.record("connect", Date.now() - startedAt));
+        return socket;
+    };
+}
+
+timeConnections(keepAliveAgent, "secureConnect");
+timeConnections(plainKeepAliveAgent, "connect");
+
+const httpClient = axios.create({
+    httpsAgent: keepAliveAgent,
+    httpAgent: plainKeepAliveAgent,
+    decompress: true,
+    headers: { 'Accept-Encoding': 'gzip, deflate' },
+});
+
+const http2Sessions = new Map<string, http2.ClientHttp2Session>();
+
+function useHttp2(url: string): boolean {
+    // HTTP/2 is only negotiated over TLS
+    return url.startsWith("https:") && workspace.getConfiguration("doxide").get("http.http2") === true;
+}
+
+/**
+ * @returns an open HTTP/2 session to `origin`, shared by all requests
+ */
+function getHttp2Session(origin: string): http2.ClientHttp2Session {
+    const existing = http2Sessions.get(origin);
+    if (existing && !existing.closed && !existing.destroyed) {
+        return existing;
+    }
+    const connectingAt = Date.now();
+    const session = http2.connect(origin);
+    session.once("connect", () => telemetry.record("connect", Date.now() - connectingAt));
+    const forget = () => {
+        if (http2Sessions.get(origin) === session) {
+            http2Sessions.delete(origin);
+        }
+    };
+    session.on("error", forget);
+    session.on("close", forget);
+    session.on("goaway", forget);
+    session.setTimeout(IDLE_TIMEOUT_MS, () => session.close());
+    http2Sessions.set(origin, session);
+    return session;
+}
+
+function decompress(body: Readable, encoding: string | string[] | undefined): Readable {
+    if (encoding === "gzip") {
+        return body.pipe(zlib.createGunzip());
+    } else if (encoding === "deflate") {
+        return body.pipe(zlib.createInflate());
+    }
+    return body;
+}
+
+async function readBody(body: Readable): Promise<any> {
+    const chunks: Buffer[] = [];
+    for await (const chunk of body) {
+        chunks.push(Buffer.from(chunk));
+    }
+    const text = Buffer.concat(chunks).toString("utf8");
+    try {
+        return JSON.parse(text);
+    } catch (_) {
+        return text;
+    }
+}
+
+/**
+ * Sends a POST request over a multiplexed HTTP/2 session.
+ */
+function http2Post(
+    url: string,
+    body: string,
+    headers: { [name: string]: string },
+    stream: boolean,
+    token?: CancellationToken
+): Promise<ApiResponse> {
+    const { origin, pathname, search } = new URL(url);
+    const session = getHttp2Session(origin);
+    const sentAt = Date.now();
+    return new Promise((resolve, reject) => {
+        const request = session.request({
+            ":method": "POST",
+            ":path": pathname + search,
+            "accept-encoding": "gzip, deflate",
+            ...Object.fromEntries(Object.entries(headers).map(([name, value]) => [name.toLowerCase(), value])),
+        });
+        // resetting the stream stops the generation without closing the session
+        const cancelled = token?.onCancellationRequested(() => {
+            request.close(http2.constants.NGHTTP2_CANCEL);
+            reject(new CancellationError());
+        });
+        request.on("close", () => cancelled?.dispose());
+        request.on("error", reject);
+        request.on("response", async responseHeaders => {
+            telemetry.record("firstByte", Date.now() - sentAt);
+            const status = Number(responseHeaders[":status"]);
+            const plainHeaders: ApiResponse["headers"] = {};
+            for (const [name, value] of Object.entries(responseHeaders)) {
+                if (!name.startsWith(":")) {
+                    plainHeaders[name] = value as string | string[] | undefined;
+                }
+            }
+            const responseBody = decompress(request, responseHeaders["content-encoding"]);
+            try {
+                if (stream && status < 400) {
+                    resolve({ status, headers: plainHeaders, data: responseBody });
+                    return;
+                }
+                const response = { status, headers: plainHeaders, data: await readBody(responseBody) };
+                if (status >= 400) {
+                    reject(new ApiError(`Request failed with status code ${status}`, response));
+                } else {
+                    resolve(response);
+                }
+            } catch (error) {
+                reject(error);
+            }
+        });
+        request.end(body);
+    });
+}
+
+/**
+ * Sends a completion request over the shared connection pool.
+ * @param url
+ * @param body - the JSON request body
+ * @param authKey - sent as a bearer token, if any
+ * @param stream - resolve with the body stream instead of the parsed body
+ * @param token - aborts the request, or closes the body stream once it was
+ *  returned
+ * @returns the response - rejects with an error carrying `response` on an
+ *  error status, or with a `CancellationError`
+ */
+export async function postCompletion(
+    url: string,
+    body: object,
+    authKey: string | undefined,
+    stream: boolean,
+    token?: CancellationToken
+): Promise<ApiResponse> {
+    if (token?.isCancellationRequested) {
+        throw new CancellationError();
+    }
+    const headers: { [name: string]: string } = {
+        'Content-Type': 'application/json',
+    };
+    if (authKey) {
+        headers['Authorization'] = `Bearer ${authKey}`;
+    }
+    if (useHttp2(url)) {
+        return http2Post(url, JSON.stringify(body), headers, stream, token);
+    }
+    const source = axios.CancelToken.source();
+    const cancelled = token?.onCancellationRequested(() => source.cancel());
+    const sentAt = Date.now();
+    let response;
+    try {
+        // the body is always read here, so that the first byte can be timed
+        response = await httpClient.post(url, body, {
+            headers,
+            responseType: 'stream',
+            cancelToken: source.token,
+        });
+    } catch (error: any) {
+        cancelled?.dispose();
+        if (axios.isCancel(error)) {
+            throw new CancellationError();
+        }
+        if (error?.response?.data instanceof Readable) {
+            error.response.data = await readBody(error.response.data).catch(() => undefined);
+        }
+        throw error;
+    }
+    cancelled?.dispose();
+    telemetry.record("firstByte", Date.now() - sentAt);
+    const data: Readable = response.data;
+    if (token) {
+        // destroying the body closes the connection, which stops the generation
+        const closed = token.onCancellationRequested(() => data.destroy());
+        data.on("close", () => closed.dispose());
+    }
+    if (stream) {
+        return { status: response.status, headers: response.headers, data };
+    }
+    try {
+        return { status: response.status, headers: response.headers, data: await readBody(data) };
+    } catch (error) {
+        throw token?.isCancellationRequested ? new CancellationError() : error;
+    }
+}
+
+/**
+ * Opens a connection to the API host in the background, so that the first
+ *  request after startup does not wait for DNS, TCP and TLS setup.
+ * @param url - any URL on the API host
+ */
+export function warmUpConnection(url: string) {
+    try {
+        if (useHttp2(url)) {
+            getHttp2Session(new URL(url).origin);
+            return;
+        }
+        // the socket is returned to the pool once the response is consumed
+        const request = url.startsWith("http:")
+            ? http.request(url, { method: "HEAD", agent: plainKeepAliveAgent }, response => response.resume())
+            : https.request(url, { method: "HEAD", agent: keepAliveAgent }, response => response.resume());
+        request.on("error", () => undefined);
+        request.end();
+    } catch (_) {
+        // warming up is best-effort
+    }
+}
+
+/**
+ * Closes all pooled connections - called on deactivation.
+ */
+export function closeConnections() {
+    keepAliveAgent.destroy();
+    plainKeepAliveAgent.destroy();
+    for (const session of http2Sessions.values()) {
+        session.close();
+    }
+    http2Sessions.clear();
+}
@@ -0,0 +1,172 @@
+import { CancellationError, CancellationToken, CancellationTokenSource, Disposable } from "vscode";
+import { requestKey } from "./coalesce";
+import type { CompletionRequest, CompletionResult } from "./completions";
+import type { Priority } from "./scheduler";
+
+export interface BatchLimits {
+    /** how long to collect requests before sending them */
+    windowMs: number;
+    /** maximum number of prompts in one request */
+    maxPrompts: number;
+    /** maximum estimated tokens (prompts and completions) of one request */
+    maxTokens: number;
+}
+
+/**
+ * Sends a multi-prompt request.
+ * @returns the result of each request, in the order of `requests`
+ */
+export type BatchSender = (
+    requests: CompletionRequest[],
+    tokens: number,
+    token: CancellationToken,
+    priority: Priority
+) => Promise<CompletionResult[]>;
+
+interface BatchMember {
+    request: CompletionRequest;
+    tokens: number;
+    resolve: (result: CompletionResult) => void;
+    reject: (error: any) => void;
+    token?: CancellationToken;
+    cancelled?: Disposable;
+}
+
+interface PendingGroup {
+    priority: Priority;
+    members: BatchMember[];
+    timer?: NodeJS.Timeout;
+}
+
+/**
+ * Splits items into consecutive batches of at most `maxItems` items whose
+ *  total cost stays within `budget`. An item that exceeds the budget on its
+ *  own gets a batch of its own.
+ */
+export function splitBatches<T>(items: T[], cost: (item: T) => number, budget: number, maxItems: number): T[][] {
+    const batches: T[][] = [];
+    let current: T[] = [];
+    let currentCost = 0;
+    for (const item of items) {
+        const itemCost = cost(item);
+        if (current.length && (current.length >= maxItems || currentCost + itemCost > budget)) {
+            batches.push(current);
+            current = [];
+            currentCost = 0;
+        }
+        current.push(item);
+        currentCost += itemCost;
+    }
+    if (current.length) {
+        batches.push(current);
+    }
+    return batches;
+}
+
+/**
+ * Collects requests for a short window and sends those that can share a
+ *  request (same engine, sampling, key and priority) as one multi-prompt
+ *  request.
+ */
+export class CompletionBatcher {
+    private readonly groups = new Map<string, PendingGroup>();
+    /** Multi-prompt requests sent */
+    public batches = 0;
+    /** Prompts sent in multi-prompt requests */
+    public batchedPrompts = 0;
+
+    constructor(private readonly send: BatchSender, private readonly getLimits: () => BatchLimits) {}
+
+    /**
+     * Queues a request for the next batch.
+     * @param request
+     * @param tokens - estimated tokens of the request
+     * @param token - removes the request from its batch
+     * @param priority
+     * @returns the result of the request
+     */
+    public add(
+        request: CompletionRequest,
+        tokens: number,
+        token?: CancellationToken,
+        priority: Priority = "interactive"
+    ): Promise<CompletionResult> {
+        if (token?.isCancellationRequested) {
+            return Promise.reject(new CancellationError());
+        }
+        const limits = this.getLimits();
+        const key = requestKey(request.engine, request.sampling, request.authKey, priority);
+        let group = this.groups.get(key);
+        if (!group) {
+            group = { priority, members: [] };
+            this.groups.set(key, group);
+        }
+        const pending = group;
+        const promise = new Promise<CompletionResult>((resolve, reject) => {
+            const member: BatchMember = { request, tokens, resolve, reject, token };
+            member.cancelled = token?.onCancellationRequested(() => {
+                const index = pending.members.indexOf(member);
+                if (index !== -1) {
+                    pending.members.splice(index, 1);
+                    member.cancelled?.dispose();
+                    reject(new CancellationError());
+                }
+            });
+            pending.members.push(member);
+        });
+
+        const size = pending.members.reduce((total, member) => total + member.tokens, 0);
+        if (pending.members.length >= limits.maxPrompts || size >= limits.maxTokens) {
+            this.flush(key);
+        } else if (!pending.timer) {
+            pending.timer = setTimeout(() => this.flush(key), limits.windowMs);
+        }
+        return promise;
+    }
+
+    private flush(key: string) {
+        const group = this.groups.get(key);
+        if (!group) {
+            return;
+        }
+        this.groups.delete(key);
+        if (group.timer) {
+            clearTimeout(group.timer);
+        }
+        const limits = this.getLimits();
+        for (const members of splitBatches(group.members, member => member.tokens, limits.maxTokens, limits.maxPrompts)) {
+            this.sendBatch(members, group.priority);
+        }
+    }
+
+    private async sendBatch(members: BatchMember[], priority: Priority) {
+        // the request is aborted once every member was cancelled
+        const source = new CancellationTokenSource();
+        let waiting = members.length;
+        const listeners = members.map(member => {
+            member.cancelled?.dispose();
+            return member.token?.onCancellationRequested(() => {
+                member.reject(new CancellationError());
+                waiting -= 1;
+                if (waiting === 0) {
+                    source.cancel();
+                }
+            });
+        });
+
+        if (members.length > 1) {
+            this.batches += 1;
+            this.batchedPrompts += members.length;
+        }
+        try {
+            const tokens = members.reduce((total, member) => total + member.tokens, 0);
+            const results = await this.send(members.map(member => member.request), tokens, source.token, priority);
+            members.forEach((member, index) => member.resolve(results[index] || { choices: [], tokensSaved: 0 }));
+        } catch (error) {
+            members.forEach(member => member.reject(error));
+        } finally {
+            listeners.forEach(listener => listener?.dispose());
+            source.dispose();
+        }
+    }
+}
@@ -0,0 +1,188 @@
+import { workspace } from "vscode";
+import { countTokens, isTokenCountExact } from "./tokenizer";
+
+/** Context length (prompt plus completion) of known engines */
+const CONTEXT_LENGTHS: { [engine: string]: number } = {
+    "code-davinci-002": 8001,
+    "code-davinci-001": 4096,
+    "code-cushman-001": 2048,
+    "davinci-codex": 4096,
+    "cushman-codex": 2048,
+    "text-davinci-003": 4097,
+    "text-davinci-002": 4097,
+};
+const DEFAULT_CONTEXT_LENGTH = 2048;
+/** Completion tokens the input is trimmed to leave room for, at most */
+const MIN_COMPLETION_TOKENS = 512;
+/** Share of the context left unused when token counts are estimated */
+const ESTIMATE_MARGIN = 0.1;
+
+/** Lines kept when a function body is reduced to its skeleton */
+const SKELETON_LINES: { [langId: string]: RegExp } = {
+    python: /^\s*(@|def |async def |class |return\b|raise\b|yield\b|if |elif |else\b|for |async for |while |try\b|except\b|finally\b|with |async with )/,
+    javascript: /^\s*(function\b|async\b|class\b|return\b|throw\b|yield\b|if\s*\(|else\b|for\s*\(|while\s*\(|switch\s*\(|try\b|catch\b|finally\b|}\s*$|(const|let|var)\s+\w+\s*=\s*(async\s*)?(\(|function))/,
+};
+/** Lines that start a declaration, whose header can span several lines */
+const DECLARATION_LINES: { [langId: string]: RegExp } = {
+    python: /^\s*(async\s+)?(def|class)\s/,
+    javascript: /^\s*(export\s+)?(default\s+)?(async\s+)?(function|class)\b|^\s*(const|let|var)\s+\w+\s*=\s*(async\s*)?(\(|function)/,
+};
+/** Statements that are a call, or assign the result of one */
+const CALL_STATEMENT = /^\s*((const|let|var)\s+)?([\w.$\[\]{}, ]+\s*=\s*)?(await\s+|new\s+)?[\w.$]+\s*\(/;
+
+export interface PromptBudget {
+    prompt: string;
+    promptTokens: number;
+    maxTokens: number;
+    /** how the function text was shortened to fit */
+    trimmed: "none" | "skeleton" | "truncated";
+}
+
+/**
+ * @returns the context length of `engine`, or `doxide.openAI.contextLength`
+ *  if it is set
+ */
+export function getContextLength(engine: string): number {
+    const configured: number = workspace.getConfiguration("doxide").get("openAI.contextLength") || 0;
+    return configured > 0 ? configured : CONTEXT_LENGTHS[engine] || DEFAULT_CONTEXT_LENGTH;
+}
+
+/**
+ * @returns the part of the context that prompt and completion may use: all
+ *  of it if tokens are counted exactly for `engine`, less a margin if they
+ *  are estimated
+ */
+function usableContext(contextLength: number, engine?: string): number {
+    return isTokenCountExact(engine) ? contextLength : Math.floor(contextLength * (1 - ESTIMATE_MARGIN));
+}
+
+/**
+ * @returns whether `prompt` with a completion of `maxTokens` tokens fits
+ *  into the context of `engine`
+ */
+export function fitsContext(prompt: string, maxTokens: number, engine: string): boolean {
+    return countTokens(prompt, engine) + maxTokens <= usableContext(getContextLength(engine), engine);
+}
+
+/**
+ * @returns how many lines the header of a declaration spans: up to the line
+ *  where its brackets are balanced, not counting the `{` of the body
+ */
+function headerLength(lines: string[], start: number): number {
+    let depth = 0;
+    for (let index = start; index < lines.length; index++) {
+        const code = lines[index]
+            .replace(/(["'`])(?:\\.|(?!\1).)*\1/g, "\"\"")
+            .replace(/\s*(#|\/\/).*$/, "")
+            .trimEnd();
+        for (const char of code.endsWith("{") ? code.slice(0, -1) : code) {
+            if (char === "(" || char === "[" || char === "{") {
+                depth += 1;
+            } else if (char === ")" || char === "]" || char === "}") {
+                depth -= 1;
+            }
+        }
+        if (depth <= 0) {
+            return index - start + 1;
+        }
+    }
+    return lines.length - start;
+}
+
+/**
+ * Reduces a function to its signature and control flow, replacing
+ *  everything else with `...` lines. Signatures that span several lines are
+ *  kept whole.
+ * @param text - the function
+ * @param langId
+ * @param keepCalls - also keep statements that call a function
+ */
+export function skeletonize(text: string, langId: string, keepCalls = false): string {
+    const keep = SKELETON_LINES[langId] || SKELETON_LINES.python;
+    const declaration = DECLARATION_LINES[langId] || DECLARATION_LINES.python;
+    const placeholder = langId === "python" ? "..." : "// ...";
+    const lines = text.split("\n");
+    const header = headerLength(lines, 0);
+    const kept: string[] = lines.slice(0, header);
+    let skipping = false;
+    for (let index = header; index < lines.length; index++) {
+        const line = lines[index];
+        if (declaration.test(line)) {
+            const length = headerLength(lines, index);
+            kept.push(...lines.slice(index, index + length));
+            index += length - 1;
+            skipping = false;
+        } else if (keep.test(line) || (keepCalls && CALL_STATEMENT.test(line)) || !line.trim()) {
+            kept.push(line);
+            skipping = false;
+        } else if (!skipping) {
+            kept.push(line.match(/^\s*/)![0] + placeholder);
+            skipping = true;
+        }
+    }
+    return kept.join("\n");
+}
+
+/**
+ * Builds the prompt for `text`, shortening the function if the prompt would
+ *  leave too little of the context for the completion, and sets `max_tokens`
+ *  to at most the remaining context. Tokens are counted with the engine's
+ *  encoding; for engines without a known encoding they are estimated and a
+ *  margin of the context is kept free, so that an estimate that is too low
+ *  does not overflow it.
+ * @param buildPrompt - builds the prompt for a (shortened) function
+ * @param text - the function
+ * @param langId
+ * @param desiredMaxTokens - the completion length to ask for if it fits
+ * @param contextLength - context length of the engine
+ * @param engine - the engine whose encoding counts the tokens
+ */
+export function budgetPrompt(
+    buildPrompt: (text: string) => string,
+    text: string,
+    langId: string,
+    desiredMaxTokens: number,
+    contextLength: number,
+    engine?: string
+): PromptBudget {
+    const tokens = (prompt: string) => countTokens(prompt, engine);
+    const usable = usableContext(contextLength, engine);
+    const reserve = Math.min(desiredMaxTokens, MIN_COMPLETION_TOKENS);
+    const fits = (promptTokens: number) => promptTokens + reserve <= usable;
+    const result = (prompt: string, promptTokens: number, trimmed: PromptBudget["trimmed"]): PromptBudget => ({
+        prompt,
+        promptTokens,
+        maxTokens: Math.max(Math.min(desiredMaxTokens, usable - promptTokens), 0),
+        trimmed,
+    });
+
+    const prompt = buildPrompt(text);
+    const promptTokens = tokens(prompt);
+    if (fits(promptTokens)) {
+        return result(prompt, promptTokens, "none");
+    }
+
+    const skeleton = skeletonize(text, langId);
+    const skeletonPrompt = buildPrompt(skeleton);
+    const skeletonTokens = tokens(skeletonPrompt);
+    if (fits(skeletonTokens)) {
+        return result(skeletonPrompt, skeletonTokens, "skeleton");
+    }
+
+    // keep as many lines of the skeleton as fit
+    const lines = skeleton.split("\n");
+    const placeholder = langId === "python" ? "..." : "// ...";
+    const truncated = (count: number) => buildPrompt(lines.slice(0, count).join("\n") + (count < lines.length ? "\n" + placeholder : ""));
+    let low = 1;
+    let high = lines.length - 1;
+    while (low < high) {
+        const middle = Math.ceil((low + high) / 2);
+        if (fits(tokens(truncated(middle)))) {
+            low = middle;
+        } else {
+            high = middle - 1;
+        }
+    }
+    const truncatedPrompt = truncated(low);
+    return result(truncatedPrompt, tokens(truncatedPrompt), "truncated");
+}
@@ -0,0 +1,315 @@
+import * as crypto from "crypto";
+import * as fs from "fs";
+import * as path from "path";
+import { workspace } from "vscode";
+
+/**
+ * Everything that influences what the completions endpoint returns for a
+ *  docstring request. Two requests with equal parts share one cache entry.
+ */
+export interface CacheKeyParts {
+    text: string;
+    langId: string;
+    templateNum: number;
+    engine: string;
+    sampling: { [key: string]: unknown };
+}
+
+/**
+ * A cached set of completions, stored as one JSON file per entry.
+ */
+export interface CacheEntry {
+    key: string;
+    langId: string;
+    engine: string;
+    templateNum: number;
+    choices: string[];
+    createdAt: number;
+}
+
+/**
+ * Summary of an entry as shown by the `doxide.cache.inspect` command.
+ */
+export interface CacheEntryInfo {
+    key: string;
+    langId: string;
+    engine: string;
+    templateNum: number;
+    size: number;
+    createdAt: string;
+    lastUsed: string;
+    preview: string;
+}
+
+export interface CacheStats {
+    entries: number;
+    bytes: number;
+    maxBytes: number;
+    hits: number;
+    misses: number;
+}
+
+const ENTRY_EXTENSION = ".json";
+const LOCK_STALE_MS = 10000;
+const LOCK_RETRY_MS = 50;
+const LOCK_MAX_RETRIES = 20;
+
+/**
+ * Normalizes function text so that whitespace-only differences (line endings,
+ *  trailing spaces, surrounding blank lines) map to the same cache key.
+ * @param text
+ * @returns normalized text
+ */
+export function normalizeFunctionText(text: string): string {
+    return text
+        .replace(/\r\n?/g, "\n")
+        .split("\n")
+        .map(line => line.replace(/\s+$/, ""))
+        .join("\n")
+        .replace(/^\n+|\n+$/g, "");
+}
+
+/**
+ * @returns the sha256 content address of a docstring request
+ */
+export function computeCacheKey(parts: CacheKeyParts): string {
+    const sampling: { [key: string]: unknown } = {};
+    for (const name of Object.keys(parts.sampling).sort()) {
+        sampling[name] = parts.sampling[name];
+    }
+    return crypto
+        .createHash("sha256")
+        .update(JSON.stringify([
+            normalizeFunctionText(parts.text),
+            parts.langId,
+            parts.templateNum,
+            parts.engine,
+            sampling,
+        ]))
+        .digest("hex");
+}
+
+/**
+ * On-disk, content-addressed cache of generated docstrings.
+ *
+ * Each entry lives in its own file named after its key, and is written to a
+ *  temporary file and renamed into place so that readers in other VS Code
+ *  windows never see a partial entry. File modification times double as the
+ *  LRU order: a hit touches the file, and eviction removes the oldest files
+ *  until the cache fits in `maxBytes`. Eviction runs under a lock file so
+ *  that only one window evicts at a time.
+ */
+export class DocstringCache {
+    public hits = 0;
+    public misses = 0;
+
+    constructor(
+        public readonly dir: string,
+        public maxBytes: number,
+    ) {}
+
+    private entryPath(key: string): string {
+        return path.join(this.dir, key + ENTRY_EXTENSION);
+    }
+
+    /**
+     * @param key
+     * @returns the cached entry, or `undefined` on a miss
+     */
+    public async get(key: string): Promise<CacheEntry | undefined> {
+        const file = this.entryPath(key);
+        try {
+            const entry: CacheEntry = JSON.parse(await fs.promises.readFile(file, "utf8"));
+            const now = new Date();
+            // mark as most recently used - failure only affects eviction order
+            await fs.promises.utimes(file, now, now).catch(() => undefined);
+            this.hits += 1;
+            return entry;
+        } catch (_) {
+            // missing, or removed/corrupted by another window
+            this.misses += 1;
+            return undefined;
+        }
+    }
+
+    /**
+     * Atomically writes an entry and evicts old entries if the cache is full.
+     * @param entry
+     */
+    public async set(entry: CacheEntry): Promise<void> {
+        await fs.promises.mkdir(this.dir, { recursive: true });
+        const tmp = path.join(
+            this.dir,
+            `${entry.key}.${process.pid}.${crypto.randomBytes(4).toString("hex")}.tmp`
+        );
+        await fs.promises.writeFile(tmp, JSON.stringify(entry), "utf8");
+        await fs.promises.rename(tmp, this.entryPath(entry.key));
+        await this.evict();
+    }
+
+    /**
+     * @returns a summary of every entry, most recently used first
+     */
+    public async list(): Promise<CacheEntryInfo[]> {
+        const infos: CacheEntryInfo[] = [];
+        for (const file of await this.entryFiles()) {
+            try {
+                const entry: CacheEntry = JSON.parse(await fs.promises.readFile(file.path, "utf8"));
+                infos.push({
+                    key: entry.key,
+                    langId: entry.langId,
+                    engine: entry.engine,
+                    templateNum: entry.templateNum,
+                    size: file.size,
+                    createdAt: new Date(entry.createdAt).toISOString(),
+                    lastUsed: new Date(file.mtimeMs).toISOString(),
+                    preview: (entry.choices[0] || "").trim().split("\n")[0],
+                });
+            } catch (_) {
+                // entry was evicted by another window while listing
+            }
+        }
+        return infos.sort((a, b) => b.lastUsed.localeCompare(a.lastUsed));
+    }
+
+    public async stats(): Promise<CacheStats> {
+        const files = await this.entryFiles();
+        return {
+            entries: files.length,
+            bytes: files.reduce((total, file) => total + file.size, 0),
+            maxBytes: this.maxBytes,
+            hits: this.hits,
+            misses: this.misses,
+        };
+    }
+
+    /**
+     * Writes every entry into a single JSON file.
+     * @param file - destination path
+     * @returns the number of exported entries
+     */
+    public async export(file: string): Promise<number> {
+        const entries: CacheEntry[] = [];
+        for (const entryFile of await this.entryFiles()) {
+            try {
+                entries.push(JSON.parse(await fs.promises.readFile(entryFile.path, "utf8")));
+            } catch (_) {
+                // entry was evicted by another window while exporting
+            }
+        }
+        await fs.promises.writeFile(file, JSON.stringify(entries, null, 2), "utf8");
+        return entries.length;
+    }
+
+    public async clear(): Promise<void> {
+        await this.withLock(async () => {
+            for (const file of await this.entryFiles()) {
+                await fs.promises.unlink(file.path).catch(() => undefined);
+            }
+        });
+        this.hits = 0;
+        this.misses = 0;
+    }
+
+    /**
+     * Removes least recently used entries until the cache fits in `maxBytes`.
+     */
+    private async evict(): Promise<void> {
+        await this.withLock(async () => {
+            const files = await this.entryFiles();
+            let bytes = files.reduce((total, file) => total + file.size, 0);
+            files.sort((a, b) => a.mtimeMs - b.mtimeMs);
+            for (const file of files) {
+                if (bytes <= this.maxBytes) {
+                    break;
+                }
+                await fs.promises.unlink(file.path).catch(() => undefined);
+                bytes -= file.size;
+            }
+        });
+    }
+
+    private async entryFiles(): Promise<{ path: string; size: number; mtimeMs: number }[]> {
+        let names: string[];
+        try {
+            names = await fs.promises.readdir(this.dir);
+        } catch (_) {
+            return [];
+        }
+        const files = [];
+        for (const name of names) {
+            if (!name.endsWith(ENTRY_EXTENSION)) {
+                continue;
+            }
+            const file = path.join(this.dir, name);
+            try {
+                const stat = await fs.promises.stat(file);
+                files.push({ path: file, size: stat.size, mtimeMs: stat.mtimeMs });
+            } catch (_) {
+                // removed by another window
+            }
+        }
+        return files;
+    }
+
+    /**
+     * Runs `fn` while holding a lock file shared by all VS Code windows. If the
+     *  lock cannot be acquired in time, `fn` is skipped - the window holding
+     *  the lock is doing the same work.
+     */
+    private async withLock(fn: () => Promise<void>): Promise<void> {
+        await fs.promises.mkdir(this.dir, { recursive: true });
+        const lockFile = path.join(this.dir, ".lock");
+        for (let attempt = 0; attempt < LOCK_MAX_RETRIES; attempt++) {
+            try {
+                const handle = await fs.promises.open(lockFile, "wx");
+                await handle.close();
+            } catch (error: any) {
+                if (error.code !== "EEXIST") {
+                    throw error;
+                }
+                // break locks left behind by a crashed window
+                const stat = await fs.promises.stat(lockFile).catch(() => undefined);
+                if (stat && Date.now() - stat.mtimeMs > LOCK_STALE_MS) {
+                    await fs.promises.unlink(lockFile).catch(() => undefined);
+                } else {
+                    await new Promise(resolve => setTimeout(resolve, LOCK_RETRY_MS));
+                }
+                continue;
+            }
+            try {
+                await fn();
+            } finally {
+                await fs.promises.unlink(lockFile).catch(() => undefined);
+            }
+            return;
+        }
+    }
+}
+
+let docstringCache: DocstringCache | undefined;
+
+/**
+ * Creates the shared cache - called once on activation.
+ * @param storagePath - the extension's global storage path, shared by all windows
+ */
+export function initDocstringCache(storagePath: string): DocstringCache {
+    docstringCache = new DocstringCache(path.join(storagePath, "docstringCache"), getMaxBytes());
+    return docstringCache;
+}
+
+/**
+ * @returns the shared cache, or `undefined` if caching is disabled
+ */
+export function getDocstringCache(): DocstringCache | undefined {
+    if (!docstringCache || workspace.getConfiguration("doxide").get("cache.enabled") === false) {
+        return undefined;
+    }
+    docstringCache.maxBytes = getMaxBytes();
+    return docstringCache;
+}
+
+function getMaxBytes(): number {
+    const maxSizeMB: number = workspace.getConfiguration("doxide").get("cache.maxSizeMB") || 50;
+    return maxSizeMB * 1024 * 1024;
+}
@@ -0,0 +1,51 @@
+import * as crypto from "crypto";
+
+/**
+ * Registry of in-flight requests: a request with the same key as one that is
+ *  still running shares its promise instead of being sent again.
+ */
+export class InFlightRegistry<T> {
+    private readonly inFlight = new Map<string, Promise<T>>();
+    /** Requests that were actually started */
+    public issued = 0;
+    /** Duplicate requests that were absorbed by an in-flight one */
+    public absorbed = 0;
+
+    /**
+     * Runs `request`, or joins the identical request that is already running.
+     * @param key - identifies identical requests
+     * @param request - starts the request
+     * @returns the (shared) promise and whether it was already in flight
+     */
+    public run(key: string, request: () => Promise<T>): { promise: Promise<T>; shared: boolean } {
+        const existing = this.inFlight.get(key);
+        if (existing) {
+            this.absorbed += 1;
+            return { promise: existing, shared: true };
+        }
+        this.issued += 1;
+        const promise = request().finally(() => this.inFlight.delete(key));
+        this.inFlight.set(key, promise);
+        return { promise, shared: false };
+    }
+
+    /**
+     * Counts a duplicate that was absorbed before reaching the registry, e.g.
+     *  a second click on the same CodeLens.
+     */
+    public absorb() {
+        this.absorbed += 1;
+    }
+
+    /** Number of requests currently in flight */
+    public get size(): number {
+        return this.inFlight.size;
+    }
+}
+
+/**
+ * @returns a key that is equal for requests with equal JSON bodies
+ */
+export function requestKey(...parts: unknown[]): string {
+    return crypto.createHash("sha256").update(JSON.stringify(parts)).digest("hex");
+}
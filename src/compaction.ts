@@ -0,0 +1,158 @@
+import { workspace } from "vscode";
+import { skeletonize } from "./budget";
+import { countTokens } from "./tokenizer";
+
+interface CommentSyntax {
+    line: string;
+    block?: [string, string];
+    /** string delimiters, longest first */
+    quotes: string[];
+}
+
+const COMMENT_SYNTAX: { [langId: string]: CommentSyntax } = {
+    python: { line: "#", quotes: ['"""', "'''", '"', "'"] },
+    javascript: { line: "//", block: ["/*", "*/"], quotes: ['"', "'", "`"] },
+};
+
+export interface CompactedFunction {
+    text: string;
+    tokensBefore: number;
+    tokensAfter: number;
+    /** whether the body was reduced to its skeleton */
+    skeleton: boolean;
+}
+
+export interface CompactionConfig {
+    enabled: boolean;
+    /** functions longer than this (in tokens) are reduced to their skeleton */
+    skeletonThreshold: number;
+}
+
+/**
+ * Removes comments, leaving strings untouched.
+ * @param text
+ * @param langId
+ */
+export function stripComments(text: string, langId: string): string {
+    const syntax = COMMENT_SYNTAX[langId];
+    if (!syntax) {
+        return text;
+    }
+    let result = "";
+    let quote: string | undefined;
+    for (let i = 0; i < text.length; i++) {
+        if (quote) {
+            if (text[i] === "\\") {
+                result += text.slice(i, i + 2);
+                i++;
+            } else if (text.startsWith(quote, i)) {
+                result += quote;
+                i += quote.length - 1;
+                quote = undefined;
+            } else {
+                result += text[i];
+            }
+        } else if (text.startsWith(syntax.line, i) || (syntax.block && text.startsWith(syntax.block[0], i))) {
+            const block = syntax.block && text.startsWith(syntax.block[0], i) ? syntax.block : undefined;
+            let end = block ? text.indexOf(block[1], i + block[0].length) : text.indexOf("\n", i);
+            end = end === -1 ? text.length : end + (block ? block[1].length : 0);
+            // comments on lines of their own are removed with their line
+            const lineStart = result.lastIndexOf("\n") + 1;
+            if (!result.slice(lineStart).trim() && text[end] === "\n") {
+                result = result.slice(0, lineStart);
+                end += 1;
+            }
+            i = end - 1;
+        } else {
+            quote = syntax.quotes.find(q => text.startsWith(q, i));
+            result += quote || text[i];
+            i += quote ? quote.length - 1 : 0;
+        }
+    }
+    return result;
+}
+
+/**
+ * Removes the docstrings of a Python function and the functions and classes
+ *  nested in it.
+ * @param text - the function, without comments
+ */
+export function stripDocstrings(text: string): string {
+    const kept: string[] = [];
+    let headerDepth: number | undefined;
+    let expectDocstring = false;
+    let closing: string | undefined;
+    for (const line of text.split("\n")) {
+        const trimmed = line.trim();
+        if (closing) {
+            closing = line.includes(closing) ? undefined : closing;
+            continue;
+        }
+        if (expectDocstring && trimmed) {
+            expectDocstring = false;
+            const opening = trimmed.match(/^[rRuU]?("""|'''|"|')/);
+            if (opening) {
+                closing = trimmed.slice(opening[0].length).includes(opening[1]) ? undefined : opening[1];
+                continue;
+            }
+        }
+        if (/^(async\s+)?(def|class)\b/.test(trimmed)) {
+            headerDepth = 0;
+        }
+        if (headerDepth !== undefined) {
+            // the signature may span several lines
+            headerDepth += (trimmed.match(/[([{]/g) || []).length - (trimmed.match(/[)\]}]/g) || []).length;
+            if (headerDepth <= 0) {
+                expectDocstring = trimmed.endsWith(":");
+                headerDepth = undefined;
+            }
+        }
+        kept.push(line);
+    }
+    return kept.join("\n");
+}
+
+/**
+ * Shortens a function before it is sent in a prompt: comments and the
+ *  docstrings of nested functions are removed, and functions that are still
+ *  longer than `skeletonThreshold` tokens are reduced to their signature,
+ *  control flow and calls.
+ * @param text - the function
+ * @param langId
+ * @param skeletonThreshold - in tokens, 0 to never reduce to the skeleton
+ */
+export function compactFunction(text: string, langId: string, skeletonThreshold: number): CompactedFunction {
+    const tokensBefore = countTokens(text);
+    if (!COMMENT_SYNTAX[langId]) {
+        return { text, tokensBefore, tokensAfter: tokensBefore, skeleton: false };
+    }
+    let compacted = stripComments(text, langId);
+    if (langId === "python") {
+        compacted = stripDocstrings(compacted);
+    }
+    // drop trailing whitespace and runs of blank lines
+    compacted = compacted
+        .split("\n")
+        .map(line => line.trimEnd())
+        .filter((line, i, lines) => line || (i > 0 && lines[i - 1]))
+        .join("\n")
+        .trimEnd();
+
+    let skeleton = false;
+    if (skeletonThreshold > 0 && countTokens(compacted) > skeletonThreshold) {
+        compacted = skeletonize(compacted, langId, true);
+        skeleton = true;
+    }
+    return { text: compacted, tokensBefore, tokensAfter: countTokens(compacted), skeleton };
+}
+
+/**
+ * @returns the configured prompt compaction
+ */
+export function getCompactionConfig(): CompactionConfig {
+    const config = workspace.getConfiguration("doxide");
+    return {
+        enabled: config.get("openAI.compactPrompt") !== false,
+        skeletonThreshold: Math.max(config.get<number>("openAI.skeletonThreshold") ?? 400, 0),
+    };
+}
@@ -0,0 +1,407 @@
+/* eslint-disable @typescript-eslint/naming-convention */
+import { CancellationError, CancellationToken, CancellationTokenSource, workspace } from "vscode";
+import { postCompletion } from "./apiClient";
+import { BatchLimits, CompletionBatcher } from "./batch";
+import { fitsContext } from "./budget";
+import { getHedgeConfig, HedgeBudget, LatencyTracker } from "./hedge";
+import { getProvider, meanLogprob, parseChoices, parseFinishReasons, parseLogprobs } from "./providers";
+import { countTokens } from "./tokenizer";
+import { InFlightRegistry, requestKey } from "./coalesce";
+import { NonRetryableError, Priority, requestScheduler } from "./scheduler";
+import { readCompletionStream } from "./stream";
+import { DocstringTerminator } from "./terminator";
+import { logger } from "./logger";
+import { telemetry } from "./telemetry";
+
+/**
+ * A request for docstring completions of one prompt.
+ */
+export interface CompletionRequest {
+    engine: string;
+    prompt: string;
+    maxTokens: number;
+    /** sampling parameters sent as-is (temperature, top_p, n, stop, ...) */
+    sampling: { [key: string]: unknown };
+    authKey: string | undefined;
+}
+
+export interface CompletionResult {
+    choices: string[];
+    /** upper bound of tokens saved by stopping streamed choices early */
+    tokensSaved: number;
+    /**
+     * mean token log probability of every choice, if the request's sampling
+     *  asked for `logprobs`
+     */
+    logprobs?: (number | undefined)[];
+    /**
+     * why every choice ended, if the response said so - `"length"` if it was
+     *  cut off at `max_tokens`
+     */
+    finishReasons?: (string | undefined)[];
+}
+
+export interface CompletionOptions {
+    /** stream the response, passing every delta to `onDelta` */
+    stream?: boolean;
+    /** cuts streamed choices off once they are complete */
+    terminator?: DocstringTerminator;
+    onDelta?: (index: number, delta: string) => void;
+    /** abandons the request - the call itself is aborted once no request waits for it */
+    token?: CancellationToken;
+    /**
+     * send a non-streamed prefetch or bulk request as part of a multi-prompt
+     *  request (defaults to `doxide.batch.enabled`) - interactive requests
+     *  are never batched
+     */
+    batch?: boolean;
+    /** the scheduling class of the request (defaults to interactive) */
+    priority?: Priority;
+}
+
+/**
+ * Completion requests that are currently in flight. Every generation path
+ *  goes through this registry so that identical requests share one call.
+ */
+export const completionRegistry = new InFlightRegistry<CompletionResult>();
+
+/**
+ * Collects non-streamed requests into multi-prompt requests.
+ */
+export const completionBatcher = new CompletionBatcher(sendBatchRequest, readBatchLimits);
+
+/** Time to first token of recent requests, which decides when to hedge */
+export const firstTokenLatency = new LatencyTracker();
+
+/** Hedged requests sent and won */
+export const hedgeBudget = new HedgeBudget();
+
+/** Aborts an in-flight call once every request sharing it was cancelled */
+const inFlightCancellation = new Map<string, { source: CancellationTokenSource; waiting: number }>();
+
+/**
+ * Requests completions, sharing the call with an identical request that is
+ *  already in flight. Only the request that started the call receives
+ *  streamed deltas - requests that joined it get the final result.
+ * @param request
+ * @param options
+ * @returns the result promise and whether an in-flight call was joined. The
+ *  promise rejects with a `CancellationError` as soon as `options.token` is
+ *  cancelled.
+ */
+export function requestCompletions(
+    request: CompletionRequest,
+    options: CompletionOptions = {}
+): { promise: Promise<CompletionResult>; shared: boolean } {
+    const key = requestKey(request.engine, request.prompt, request.maxTokens, request.sampling);
+    const { promise, shared } = completionRegistry.run(key, () => {
+        const source = new CancellationTokenSource();
+        inFlightCancellation.set(key, { source, waiting: 0 });
+        // an interactive request would only wait out the batch window
+        const batch = !options.stream && (options.priority ?? "interactive") !== "interactive" && getProvider().supportsBatch &&
+            (options.batch ?? workspace.getConfiguration("doxide").get("batch.enabled") !== false);
+        const call = batch
+            ? completionBatcher.add(request, estimateTokens(request), source.token, options.priority)
+            : sendHedged(request, options, source.token);
+        return call.finally(() => {
+            inFlightCancellation.delete(key);
+            source.dispose();
+        });
+    });
+
+    telemetry.hit("coalescing", shared);
+    const cancellation = inFlightCancellation.get(key);
+    const token = options.token;
+    if (!cancellation) {
+        return { promise, shared };
+    }
+    // a request without a token keeps the call alive
+    cancellation.waiting += 1;
+    if (!token) {
+        return { promise, shared };
+    }
+    return {
+        promise: new Promise<CompletionResult>((resolve, reject) => {
+            const abandon = () => {
+                reject(new CancellationError());
+                cancellation.waiting -= 1;
+                if (cancellation.waiting === 0) {
+                    cancellation.source.cancel();
+                }
+            };
+            if (token.isCancellationRequested) {
+                abandon();
+                return;
+            }
+            const listener = token.onCancellationRequested(abandon);
+            promise.then(resolve, reject).finally(() => listener.dispose());
+        }),
+        shared,
+    };
+}
+
+/**
+ * @returns an upper bound of the tokens a request uses, for rate limiting
+ */
+function estimateTokens(request: CompletionRequest): number {
+    const n = Number(request.sampling.n) || 1;
+    return countTokens(request.prompt, request.engine) + request.maxTokens * n;
+}
+
+/**
+ * Sends a request through the scheduler. With hedging enabled, a second,
+ *  identical request (optionally to the fallback engine) is sent when the
+ *  first has not produced a token within the configured percentile of
+ *  recent latency. The first request to produce a token wins and the other
+ *  is aborted.
+ */
+function sendHedged(request: CompletionRequest, options: CompletionOptions, token: CancellationToken): Promise<CompletionResult> {
+    const hedge = getHedgeConfig();
+    const delay = hedge.enabled ? firstTokenLatency.percentile(hedge.percentile) : undefined;
+    hedgeBudget.requests += 1;
+
+    return new Promise<CompletionResult>((resolve, reject) => {
+        const attempts: CancellationTokenSource[] = [];
+        let winner: number | undefined;
+        let failed = 0;
+        let hedgeTimer: NodeJS.Timeout | undefined;
+
+        const launch = (index: number, engine: string) => {
+            const source = new CancellationTokenSource();
+            const linked = token.onCancellationRequested(() => source.cancel());
+            attempts.push(source);
+            let sentAt = 0;
+            // called with the first token (or the whole response) of an attempt
+            const claim = () => {
+                if (winner === undefined) {
+                    winner = index;
+                    firstTokenLatency.record(Date.now() - sentAt);
+                    if (hedgeTimer) {
+                        clearTimeout(hedgeTimer);
+                    }
+                    attempts.forEach((attempt, other) => other !== index && attempt.cancel());
+                    if (index > 0) {
+                        hedgeBudget.wins += 1;
+                        logger.info("requestCompletions", `hedge request won`);
+                    }
+                }
+                return winner === index;
+            };
+
+            requestScheduler.schedule(
+                estimateTokens(request),
+                () => {
+                    sentAt = Date.now();
+                    if (index === 0 && delay !== undefined && attempts.length === 1) {
+                        if (hedgeTimer) {
+                            clearTimeout(hedgeTimer);
+                        }
+                        hedgeTimer = setTimeout(() => {
+                            if (winner === undefined && attempts.length === 1 && !token.isCancellationRequested &&
+                                hedgeBudget.allows(hedge.maxExtraPercent)) {
+                                hedgeBudget.hedges += 1;
+                                launch(1, hedge.fallbackEngine || request.engine);
+                            }
+                        }, delay);
+                    }
+                    return sendCompletionRequest({ ...request, engine }, options, source.token, claim);
+                },
+                source.token,
+                options.priority
+            ).then(result => {
+                resolve(result);
+            }, error => {
+                failed += 1;
+                // the loser is aborted - only the winner, or the last attempt, decides
+                if (winner === index || (winner === undefined && failed === attempts.length)) {
+                    if (hedgeTimer) {
+                        clearTimeout(hedgeTimer);
+                    }
+                    reject(error);
+                }
+            }).finally(() => {
+                linked.dispose();
+                source.dispose();
+            });
+        };
+
+        launch(0, request.engine);
+    });
+}
+
+/**
+ * Sends the prompts of compatible requests as a single request.
+ * @returns the result of every request, in order
+ */
+async function sendBatchRequest(
+    requests: CompletionRequest[],
+    tokens: number,
+    token: CancellationToken,
+    priority: Priority
+): Promise<CompletionResult[]> {
+    if (requests.length === 1) {
+        return [await requestScheduler.schedule(tokens, () => sendCompletionRequest(requests[0], {}, token), token, priority)];
+    }
+    // all prompts get the largest max_tokens, which could overflow the context
+    //  of a prompt that was fitted to a smaller one - those are sent alone
+    const maxTokens = Math.max(...requests.map(request => request.maxTokens));
+    const overflowing = requests.filter(request => !fitsContext(request.prompt, maxTokens, request.engine));
+    if (overflowing.length) {
+        logger.debug("requestCompletions", `sending ${overflowing.length} of ${requests.length} batched prompts alone, they do not fit with max_tokens ${maxTokens}`);
+        const groups = [requests.filter(request => !overflowing.includes(request)), ...overflowing.map(request => [request])]
+            .filter(group => group.length);
+        const results = await Promise.all(groups.map(group =>
+            sendBatchRequest(group, group.reduce((total, request) => total + estimateTokens(request), 0), token, priority)
+        ));
+        const byRequest = new Map(groups.flatMap((group, index) => group.map((request, position) => [request, results[index][position]] as const)));
+        return requests.map(request => byRequest.get(request)!);
+    }
+    const first = requests[0];
+    const n = Number(first.sampling.n) || 1;
+    const provider = getProvider();
+    return requestScheduler.schedule(tokens, async () => {
+        const { url, body } = provider.buildRequest(first.engine, {
+            prompt: requests.map(request => request.prompt),
+            max_tokens: maxTokens,
+            logprobs: null,
+            ...first.sampling,
+            stream: false,
+        });
+        const response = await postCompletion(url, body, provider.authorization(first.authKey), false, token);
+        requestScheduler.observe(response.headers);
+        if (response.data.usage) {
+            telemetry.recordUsage(response.data.usage);
+        }
+        // the n choices of each prompt are numbered consecutively, in prompt order
+        const withLogprobs = first.sampling.logprobs !== undefined;
+        const results: CompletionResult[] = requests.map(() => ({
+            choices: [],
+            tokensSaved: 0,
+            logprobs: withLogprobs ? [] : undefined,
+            finishReasons: [],
+        }));
+        const logprobs = withLogprobs ? parseLogprobs(response.data) : [];
+        const finishReasons = parseFinishReasons(response.data);
+        parseChoices(response.data).forEach((text, index) => {
+            const result = results[Math.floor(index / n)];
+            result.choices[index % n] = text;
+            if (result.logprobs) {
+                result.logprobs[index % n] = logprobs[index];
+            }
+            result.finishReasons![index % n] = finishReasons[index];
+        });
+        return results;
+    }, token, priority);
+}
+
+/**
+ * @returns the configured batch limits
+ */
+function readBatchLimits(): BatchLimits {
+    const config = workspace.getConfiguration("doxide");
+    return {
+        windowMs: Math.max(config.get<number>("batch.windowMs") ?? 50, 0),
+        maxPrompts: 20,
+        maxTokens: Math.max(config.get("batch.maxTokens") || 20000, 1),
+    };
+}
+
+/**
+ * @see https://beta.openai.com/docs/api-reference/completions/create
+ */
+async function sendCompletionRequest(
+    request: CompletionRequest,
+    options: CompletionOptions,
+    token: CancellationToken,
+    claim?: () => boolean
+): Promise<CompletionResult> {
+    const stream = options.stream === true;
+    // NOTE: The token count of your prompt plus max_tokens cannot exceed the
+    //  model's context length. davinci-codex supports 4096 tokens
+    const provider = getProvider();
+    const { url, body } = provider.buildRequest(
+        request.engine,
+        {
+            prompt: request.prompt,
+            // suffix: "",
+            max_tokens: request.maxTokens,
+            logprobs: null,
+            ...request.sampling,
+            stream: stream,
+            // presence_penalty: 0,
+            // frequency_penalty: 0,
+            // best_of: ,
+            // logit_bias:
+        }
+    );
+    const response = await postCompletion(url, body, provider.authorization(request.authKey), stream, token);
+    requestScheduler.observe(response.headers);
+
+    if (!stream) {
+        if (response.data.usage) {
+            telemetry.recordUsage(response.data.usage);
+        }
+        if (claim && !claim()) {
+            throw new CancellationError();
+        }
+        logger.trace("requestCompletions", () => `response: ${JSON.stringify(response.data, null, 2)}`);
+        return {
+            choices: parseChoices(response.data),
+            tokensSaved: 0,
+            logprobs: request.sampling.logprobs !== undefined ? parseLogprobs(response.data) : undefined,
+            finishReasons: parseFinishReasons(response.data),
+        };
+    }
+
+    const terminator = options.terminator;
+    let started = false;
+    let choices: string[];
+    const tokenLogprobs: (number | null)[][] = [];
+    const finishReasons: (string | undefined)[] = [];
+    let usageReported = false;
+    try {
+        choices = await readCompletionStream(response.data, chunk => {
+            if (!started && claim && !claim()) {
+                // another attempt produced a token first
+                throw new CancellationError();
+            }
+            const delta = terminator ? terminator.push(chunk.index, chunk.text, chunk.finish_reason) : chunk.text;
+            started = true;
+            if (chunk.logprobs) {
+                tokenLogprobs[chunk.index] = (tokenLogprobs[chunk.index] || []).concat(chunk.logprobs);
+            }
+            if (chunk.finish_reason) {
+                finishReasons[chunk.index] = chunk.finish_reason;
+            }
+            options.onDelta?.(chunk.index, delta);
+            // stop reading (and generating) once every choice is complete
+            return terminator?.done;
+        }, usage => {
+            usageReported = true;
+            telemetry.recordUsage(usage);
+        });
+    } catch (error) {
+        // deltas may already be in the editor, so a retry would repeat them
+        throw started ? new NonRetryableError(error) : error;
+    }
+    if (!usageReported) {
+        const completionTokens = choices.reduce((sum, choice) => sum + countTokens(choice || "", request.engine), 0);
+        telemetry.recordUsage({ prompt_tokens: countTokens(request.prompt, request.engine), completion_tokens: completionTokens }, true);
+    }
+    if (token.isCancellationRequested) {
+        // the stream was closed by the cancellation, the choices are incomplete
+        throw new CancellationError();
+    }
+    if (terminator) {
+        choices = choices.map((_, index) => {
+            options.onDelta?.(index, terminator.end(index));
+            return terminator.text(index);
+        });
+    }
+    return {
+        choices,
+        tokensSaved: terminator?.tokensSaved || 0,
+        logprobs: request.sampling.logprobs !== undefined ? choices.map((_, index) => meanLogprob(tokenLogprobs[index])) : undefined,
+        finishReasons: choices.map((_, index) => finishReasons[index]),
+    };
+}
@@ -0,0 +1,659 @@
+import { CancellationToken, Progress, Range, TextDocument, Uri, workspace, WorkspaceEdit } from "vscode";
+import { EXCLUDE_PATTERN, FILE_PATTERN, languageOf } from "./retrieval";
+import { logger } from "./logger";
+
+/**
+ * The docstring styles of `src/constants/Template.ts`, by template number.
+ */
+export const DOCSTRING_STYLES = ["numpy", "google", "jsdoc"] as const;
+export type DocstringStyle = typeof DOCSTRING_STYLES[number];
+
+/** Section titles of Google style docstrings, which are not underlined */
+const GOOGLE_TITLES = /^(parameters|params|args|arguments|keyword args|keyword arguments|other parameters|returns?|yields?|raises|throws|examples?|notes?|see also|references|attributes|warnings?|warns|todo|methods):$/i;
+const PARAMETER_TITLE = /^(parameters|params|args|arguments|keyword args|keyword arguments)$/i;
+const RETURN_TITLE = /^(returns?|yields?)$/i;
+const RAISES_TITLE = /^(raises|throws)$/i;
+const EXAMPLE_TITLE = /^examples?$/i;
+const TYPE = /^([\w.]+(?:\[[^\]]*\])?(?:\s*[|,]\s*[\w.]+(?:\[[^\]]*\])?)*)$/;
+/** Any other Google style section title, e.g. `Local variables:` */
+const OTHER_GOOGLE_TITLE = /^[A-Za-z][\w ]{0,30}:$/;
+/** The first line of a Google style parameter: `name(type): description` */
+const GOOGLE_PARAMETER = /^[*\w$.]+\s*(?:\([^)]*\))?\s*:/;
+
+/**
+ * A parameter, return value or raised exception of a docstring.
+ */
+export interface DocstringField {
+    name?: string;
+    type?: string;
+    optional?: boolean;
+    description: string[];
+}
+
+/**
+ * A section of a docstring that has no equivalent in every style (e.g.
+ *  `Notes`), kept as it is.
+ */
+export interface DocstringSection {
+    title: string;
+    lines: string[];
+}
+
+/**
+ * The contents of a docstring, independent of its style.
+ */
+export interface ParsedDocstring {
+    summary: string[];
+    params: DocstringField[];
+    returns: DocstringField[];
+    /** whether the return section is a `Yields` section */
+    yields: boolean;
+    raises: DocstringField[];
+    examples: string[];
+    sections: DocstringSection[];
+}
+
+function indentOf(line: string): number {
+    return line.length - line.trimStart().length;
+}
+
+function dedent(lines: string[]): string[] {
+    const indent = Math.min(...lines.filter(line => line.trim()).map(indentOf));
+    return lines.map(line => line.slice(Math.min(indent, indentOf(line))).trimEnd());
+}
+
+function trimBlankLines(lines: string[]): string[] {
+    let start = 0;
+    let end = lines.length;
+    while (start < end && !lines[start].trim()) {
+        start += 1;
+    }
+    while (end > start && !lines[end - 1].trim()) {
+        end -= 1;
+    }
+    return lines.slice(start, end);
+}
+
+/**
+ * @param lines - the dedented lines of a docstring
+ * @returns the style of the docstring, or `undefined` if it has no sections
+ */
+export function detectStyle(lines: string[]): DocstringStyle | undefined {
+    if (lines.some(line => /^@\w+/.test(line))) {
+        return "jsdoc";
+    } else if (lines.some((line, i) => line.trim() && !indentOf(line) && /^-{3,}$/.test((lines[i + 1] || "").trim()))) {
+        return "numpy";
+    } else if (lines.some(line => !indentOf(line) && GOOGLE_TITLES.test(line.trim()))) {
+        return "google";
+    }
+    return undefined;
+}
+
+/**
+ * @param body - the text between the docstring tokens, as it is in the file
+ * @returns the style of the docstring, or `undefined` if it has no sections
+ */
+export function styleOfDocstring(body: string): DocstringStyle | undefined {
+    const [first, ...rest] = body.split("\n");
+    // JSDoc comments usually start every line with a star
+    const starred = rest.filter(line => line.trim());
+    const unstarred = starred.length && starred.every(line => /^\s*\*/.test(line))
+        ? rest.map(line => line.replace(/^\s*\*\s?/, ""))
+        : rest;
+    return detectStyle([first.trim(), ...dedent(unstarred)]);
+}
+
+function emptyDocstring(): ParsedDocstring {
+    return { summary: [], params: [], returns: [], yields: false, raises: [], examples: [], sections: [] };
+}
+
+function splitOptional(type: string | undefined): { type?: string; optional?: boolean } {
+    if (!type) {
+        return {};
+    }
+    const match = type.match(/^(.*?),?\s*\boptional$/);
+    return match ? { type: match[1] || undefined, optional: true } : { type };
+}
+
+/**
+ * Splits the lines of a section into entries: a line without indentation
+ *  followed by its indented lines.
+ * @param isHead - whether a line without indentation starts an entry, or
+ *  continues the one above
+ */
+function splitEntries(lines: string[], isHead: (line: string) => boolean = () => true): { head: string; body: string[] }[] {
+    const entries: { head: string; body: string[] }[] = [];
+    for (const line of lines) {
+        if (!line.trim()) {
+            continue;
+        }
+        if (!entries.length || (!indentOf(line) && isHead(line.trim()))) {
+            entries.push({ head: line.trim(), body: [] });
+        } else {
+            entries[entries.length - 1].body.push(line.trim());
+        }
+    }
+    return entries;
+}
+
+/**
+ * @returns whether a line without indentation starts a field of a Google
+ *  style section, instead of continuing the description of the one above
+ */
+function isGoogleFieldHead(line: string, named: boolean): boolean {
+    if (named || /^[*\w$.]+\s*\([^)]*\)\s*:/.test(line)) {
+        return GOOGLE_PARAMETER.test(line);
+    }
+    const typed = line.match(/^([^:]+):/);
+    return !!typed && TYPE.test(typed[1].trim());
+}
+
+/**
+ * @returns whether a line without indentation starts a field of a numpy
+ *  style section - a return value without a type continues the one above
+ */
+function isNumpyFieldHead(line: string, named: boolean): boolean {
+    return named || /^.+?\s+:/.test(line) || TYPE.test(line);
+}
+
+function parseNumpyField(entry: { head: string; body: string[] }, named: boolean): DocstringField {
+    const colon = entry.head.match(/^(.+?)\s+:\s*(.*)$/);
+    if (colon) {
+        return { name: colon[1], ...splitOptional(colon[2]), description: entry.body };
+    }
+    if (named) {
+        return { name: entry.head, description: entry.body };
+    }
+    return TYPE.test(entry.head)
+        ? { type: entry.head, description: entry.body }
+        : { description: [entry.head, ...entry.body] };
+}
+
+function parseGoogleField(entry: { head: string; body: string[] }, named: boolean): DocstringField {
+    if (named) {
+        const match = entry.head.match(/^([*\w$.]+)\s*(?:\(([^)]*)\))?\s*:\s*(.*)$/);
+        if (match) {
+            return { name: match[1], ...splitOptional(match[2]), description: [match[3], ...entry.body].filter(line => line) };
+        }
+        return { name: entry.head, description: entry.body };
+    }
+    // a named return value, like a parameter
+    const returned = entry.head.match(/^([*\w$.]+)\s*\(([^)]*)\)\s*:\s*(.*)$/);
+    if (returned) {
+        return { name: returned[1], ...splitOptional(returned[2]), description: [returned[3], ...entry.body].filter(line => line) };
+    }
+    const typed = entry.head.match(/^([^:]+):\s*(.*)$/);
+    if (typed && TYPE.test(typed[1].trim())) {
+        return { type: typed[1].trim(), description: [typed[2], ...entry.body].filter(line => line) };
+    }
+    return { description: [entry.head, ...entry.body] };
+}
+
+/**
+ * Parses a numpy or Google style docstring.
+ */
+function parseSectioned(lines: string[], style: DocstringStyle): ParsedDocstring {
+    const parsed = emptyDocstring();
+    const titles: { title: string; start: number; end: number }[] = [];
+    for (let i = 0; i < lines.length; i++) {
+        const line = lines[i].trim();
+        if (indentOf(lines[i]) || !line) {
+            continue;
+        }
+        // after the first section, any title followed by indented lines
+        //  starts a section of its own
+        const otherTitle = titles.length > 0 && OTHER_GOOGLE_TITLE.test(line) && indentOf(lines[i + 1] || "") > 0;
+        if (style === "numpy" && /^-{3,}$/.test((lines[i + 1] || "").trim())) {
+            titles.push({ title: line, start: i, end: i + 2 });
+        } else if (style === "google" && (GOOGLE_TITLES.test(line) || otherTitle)) {
+            titles.push({ title: line.replace(/:$/, ""), start: i, end: i + 1 });
+        }
+    }
+    parsed.summary = trimBlankLines(lines.slice(0, titles.length ? titles[0].start : lines.length));
+
+    titles.forEach(({ title, end }, index) => {
+        const content = trimBlankLines(lines.slice(end, index + 1 < titles.length ? titles[index + 1].start : lines.length));
+        const body = content.length ? dedent(content) : [];
+        const parseField = style === "numpy" ? parseNumpyField : parseGoogleField;
+        const isFieldHead = style === "numpy" ? isNumpyFieldHead : isGoogleFieldHead;
+        const entries = (named: boolean) => splitEntries(body, line => isFieldHead(line, named));
+        if (PARAMETER_TITLE.test(title)) {
+            // "None" stands for no parameters
+            parsed.params.push(...entries(true)
+                .map(entry => parseField(entry, true))
+                .filter(field => field.name !== "None" || field.type || field.description.length));
+        } else if (RETURN_TITLE.test(title)) {
+            parsed.yields = /^yield/i.test(title);
+            parsed.returns.push(...entries(false).map(entry => parseField(entry, false)));
+        } else if (RAISES_TITLE.test(title)) {
+            parsed.raises.push(...entries(false).map(entry => parseField(entry, false)));
+        } else if (EXAMPLE_TITLE.test(title)) {
+            parsed.examples = body;
+        } else {
+            parsed.sections.push({ title, lines: body });
+        }
+    });
+    return parsed;
+}
+
+/**
+ * Parses a JSDoc comment.
+ */
+function parseJSDoc(lines: string[]): ParsedDocstring {
+    const parsed = emptyDocstring();
+    let current: string[] = parsed.summary;
+    let verbatim = false;
+    for (const line of lines) {
+        const tag = line.match(/^@(\w+)\s*(.*)$/);
+        if (!tag) {
+            if (verbatim) {
+                current.push(line);
+            } else if (line.trim() || current === parsed.summary) {
+                current.push(line.trim());
+            }
+            continue;
+        }
+        const [, name, rest] = tag;
+        verbatim = false;
+        if (/^(param|arg|argument)$/.test(name)) {
+            const match = rest.match(/^(?:\{([^}]*)\}\s*)?(\[[^\]]*\]|[\w$.]+)\s*(?:-\s*)?(.*)$/);
+            const optional = match?.[2].startsWith("[");
+            const [paramName, defaultValue] = (optional ? match![2].slice(1, -1) : match?.[2] || rest).split("=");
+            const description = match?.[3] ? [match[3]] : [];
+            if (defaultValue && !/default/i.test(description.join(" "))) {
+                description.push(`Defaults to ${defaultValue.trim()}.`);
+            }
+            const field = { name: paramName.trim(), type: match?.[1] || undefined, optional: optional || undefined, description };
+            parsed.params.push(field);
+            current = field.description;
+        } else if (/^(returns?|yields?|throws|throw|exception)$/.test(name)) {
+            const match = rest.match(/^(?:\{([^}]*)\}\s*)?(?:-\s*)?(.*)$/)!;
+            const field = { type: match[1] || undefined, description: match[2] ? [match[2]] : [] };
+            if (/^(throws|throw|exception)$/.test(name)) {
+                parsed.raises.push(field);
+            } else {
+                parsed.yields = name.startsWith("yield");
+                parsed.returns.push(field);
+            }
+            current = field.description;
+        } else if (/^(description|desc)$/.test(name)) {
+            current = parsed.summary;
+            const text = rest.replace(/^-\s*/, "");
+            if (text) {
+                current.push(text);
+            }
+        } else if (/^examples?$/.test(name)) {
+            current = parsed.examples;
+            verbatim = true;
+            if (rest) {
+                current.push(rest);
+            }
+        } else {
+            const section = { title: name === "see" ? "See Also" : name.charAt(0).toUpperCase() + name.slice(1), lines: rest ? [rest] : [] };
+            parsed.sections.push(section);
+            current = section.lines;
+            verbatim = true;
+        }
+    }
+    parsed.summary = trimBlankLines(parsed.summary);
+    parsed.examples = trimBlankLines(parsed.examples);
+    return parsed;
+}
+
+/**
+ * Parses the contents of a docstring.
+ * @param lines - the dedented lines of the docstring, without comment stars
+ * @returns the contents and the style they were written in, or `undefined`
+ *  if the docstring has no sections
+ */
+export function parseDocstring(lines: string[]): { docstring: ParsedDocstring; style: DocstringStyle } | undefined {
+    const style = detectStyle(lines);
+    if (!style) {
+        return undefined;
+    }
+    const docstring = style === "jsdoc" ? parseJSDoc(lines) : parseSectioned(lines, style);
+    return { docstring, style };
+}
+
+function withOptional(field: DocstringField): string | undefined {
+    return field.optional ? [field.type, "optional"].filter(part => part).join(", ") : field.type;
+}
+
+function renderNumpy(docstring: ParsedDocstring): string[] {
+    const blocks: string[][] = [];
+    const section = (title: string, lines: string[]) => blocks.push([title, "-".repeat(title.length), ...lines]);
+    const fields = (list: DocstringField[], named: boolean) => list.flatMap(field => {
+        const type = withOptional(field);
+        const head = named || field.name
+            ? (type ? `${field.name} : ${type}` : field.name!)
+            : type;
+        return head ? [head, ...field.description.map(line => `    ${line}`)] : field.description;
+    });
+    if (docstring.summary.length) {
+        blocks.push(docstring.summary);
+    }
+    if (docstring.params.length) {
+        section("Parameters", fields(docstring.params, true));
+    }
+    if (docstring.returns.length) {
+        section(docstring.yields ? "Yields" : "Returns", fields(docstring.returns, false));
+    }
+    if (docstring.raises.length) {
+        section("Raises", fields(docstring.raises, false));
+    }
+    docstring.sections.forEach(other => section(other.title, other.lines));
+    if (docstring.examples.length) {
+        section("Examples", docstring.examples);
+    }
+    return blocks.flatMap((block, index) => index ? ["", ...block] : block);
+}
+
+function renderGoogle(docstring: ParsedDocstring): string[] {
+    const blocks: string[][] = [];
+    const section = (title: string, lines: string[]) => blocks.push([`${title}:`, ...lines.map(line => line ? `    ${line}` : line)]);
+    const fields = (list: DocstringField[], named: boolean) => list.flatMap(field => {
+        const type = withOptional(field);
+        const [first, ...rest] = field.description;
+        const head = named || field.name
+            ? `${field.name}${type ? `(${type})` : ""}:`
+            : (type ? `${type}:` : "");
+        return [[head, first].filter(part => part).join(" "), ...rest.map(line => `    ${line}`)];
+    });
+    if (docstring.summary.length) {
+        blocks.push(docstring.summary);
+    }
+    if (docstring.params.length) {
+        section("Parameters", fields(docstring.params, true));
+    }
+    if (docstring.returns.length) {
+        section(docstring.yields ? "Yields" : "Returns", fields(docstring.returns, false));
+    }
+    if (docstring.raises.length) {
+        section("Raises", fields(docstring.raises, false));
+    }
+    docstring.sections.forEach(other => section(other.title, other.lines));
+    if (docstring.examples.length) {
+        section("Examples", docstring.examples);
+    }
+    return blocks.flatMap((block, index) => index ? ["", ...block] : block);
+}
+
+function renderJSDoc(docstring: ParsedDocstring): string[] {
+    const lines: string[] = [];
+    const tag = (name: string, field: DocstringField, head: string) => {
+        const [first, ...rest] = field.description;
+        lines.push(`@${name} {${field.type || "*"}} ${head}- ${first || ""}`.trimEnd(), ...rest);
+    };
+    for (const param of docstring.params) {
+        tag("param", param, `${param.optional ? `[${param.name}]` : param.name} `);
+    }
+    for (const returned of docstring.returns) {
+        tag(docstring.yields ? "yields" : "returns", returned, "");
+    }
+    for (const raised of docstring.raises) {
+        tag("throws", raised, "");
+    }
+    // sections without a tag are kept as part of the description
+    const description = [...docstring.summary];
+    for (const section of docstring.sections) {
+        if (/^see also$/i.test(section.title)) {
+            lines.push(...section.lines.map(line => `@see ${line.trim()}`));
+        } else {
+            description.push("", `${section.title}:`, ...section.lines);
+        }
+    }
+    const [first, ...rest] = trimBlankLines(description);
+    if (first !== undefined) {
+        lines.push(`@description - ${first}`, ...rest);
+    }
+    if (docstring.examples.length) {
+        lines.push("@example", ...docstring.examples);
+    }
+    return lines;
+}
+
+/**
+ * Writes the contents of a docstring in a style.
+ * @returns the lines of the docstring, without indentation or comment stars
+ */
+export function renderDocstring(docstring: ParsedDocstring, style: DocstringStyle): string[] {
+    if (style === "jsdoc") {
+        return renderJSDoc(docstring);
+    }
+    return style === "google" ? renderGoogle(docstring) : renderNumpy(docstring);
+}
+
+function wordCounts(text: string): Map<string, number> {
+    const counts = new Map<string, number>();
+    for (const word of text.toLowerCase().match(/[\p{L}\p{N}_]+/gu) || []) {
+        counts.set(word, (counts.get(word) || 0) + 1);
+    }
+    return counts;
+}
+
+/**
+ * @returns the text without what a conversion renames or drops on purpose:
+ *  section titles, JSDoc tags and the `None` of an empty parameter list
+ */
+function withoutStructure(text: string): string {
+    const lines = text.split("\n").map(line => line.replace(/^\s*\*\s?/, "").trim());
+    return lines
+        .filter((line, i) => !GOOGLE_TITLES.test(line) && !/^-{3,}$/.test(line) && !/^-{3,}$/.test(lines[i + 1] || "") && line !== "None")
+        .map(line => line.replace(/@\w+/g, ""))
+        .join("\n");
+}
+
+/**
+ * @returns the words of `before` that `after` has fewer of, apart from
+ *  section titles and tags
+ */
+export function lostWords(before: string, after: string): string[] {
+    const remaining = wordCounts(after);
+    return [...wordCounts(withoutStructure(before))]
+        .filter(([word, count]) => (remaining.get(word) || 0) < count)
+        .map(([word]) => word);
+}
+
+/**
+ * Converts a docstring to another style, keeping its indentation, comment
+ *  stars and whether the summary starts on the first line. A docstring whose
+ *  conversion would lose any of its words is left as it is.
+ * @param body - the text between the docstring tokens
+ * @param style
+ * @param indent - the indentation of the docstring tokens
+ * @returns the new text between the tokens, or `undefined` if the docstring
+ *  has no sections, already is in the style or cannot be converted without
+ *  losing words
+ */
+export function convertDocstring(body: string, style: DocstringStyle, indent = ""): string | undefined {
+    const lines = body.split("\n");
+    if (lines.length < 2) {
+        return undefined;
+    }
+    const inline = lines[0].trim() !== "";
+    const closing = lines[lines.length - 1];
+    const content = [lines[0].trim(), ...lines.slice(1, -1), ...(closing.trim() ? [closing] : [])]
+        .map((line, index) => index === 0 ? line : line.slice(Math.min(indent.length, indentOf(line))));
+
+    // JSDoc comments usually start every line with a star
+    const starred = content.slice(1).filter(line => line.trim());
+    const starPrefix = starred.length && starred.every(line => /^\s*\*/.test(line)) ? starred[0].match(/^\s*\*\s?/)![0] : "";
+    const unstarred = content.map(line => starPrefix ? line.replace(/^\s*\*\s?/, "") : line);
+
+    const parsed = parseDocstring(dedent(unstarred));
+    if (!parsed || parsed.style === style) {
+        return undefined;
+    }
+    const prefix = starPrefix || (style === "jsdoc" ? "* " : "");
+    const rendered = renderDocstring(parsed.docstring, style).map(line => line
+        ? indent + prefix + line
+        : (prefix ? indent + prefix.trimEnd() : ""));
+    const first = inline ? rendered.shift()!.slice(indent.length + prefix.length) : "";
+    const converted = first + rendered.map(line => "\n" + line).join("") + "\n" + (closing.trim() ? indent : closing);
+    const lost = lostWords(body, converted);
+    if (lost.length) {
+        logger.warn("convertDocstring", `not converting a docstring that would lose: ${lost.join(", ")}`);
+        return undefined;
+    }
+    return converted;
+}
+
+/**
+ * Finds the docstrings of a file: the string right below a Python function
+ *  or class signature, or the doc comments of JavaScript and TypeScript.
+ * @returns the offsets of the text between the docstring tokens and the
+ *  indentation of the opening token
+ */
+export function findDocstrings(text: string, langId: string): { start: number; end: number; indent: string }[] {
+    const docstrings: { start: number; end: number; indent: string }[] = [];
+    if (langId !== "python") {
+        for (const match of text.matchAll(/^([ \t]*)\/\*\*(?!\/)([\s\S]*?)\*\//gm)) {
+            const start = match.index! + match[1].length + 3;
+            docstrings.push({ start, end: start + match[2].length, indent: match[1] });
+        }
+        return docstrings;
+    }
+    const header = /^[ \t]*(?:async\s+)?(?:def|class)\s+\w+/gm;
+    let match: RegExpExecArray | null;
+    while ((match = header.exec(text))) {
+        // the signature may span several lines and ends at a top level colon
+        //  at the end of a line - one-line functions have no docstring
+        let depth = 0;
+        let i = match.index + match[0].length;
+        for (; i < text.length; i++) {
+            const char = text[i];
+            if ("([{".includes(char)) {
+                depth += 1;
+            } else if (")]}".includes(char)) {
+                depth -= 1;
+            } else if (char === ":" && depth <= 0 && /^[ \t]*(#.*)?\r?\n/.test(text.slice(i + 1, i + 200))) {
+                break;
+            } else if (char === "\n" && depth <= 0 && text[i - 1] !== "\\") {
+                i = text.length;
+            }
+        }
+        const opening = i >= text.length ? null : text.slice(i + 1).match(/^[ \t]*(?:#.*)?\r?\n(?:[ \t]*\r?\n)*([ \t]*)[rRuU]?("""|''')/);
+        if (!opening) {
+            continue;
+        }
+        const start = i + 1 + opening[0].length;
+        const end = text.indexOf(opening[2], start);
+        if (end === -1) {
+            break;
+        }
+        docstrings.push({ start, end, indent: opening[1] });
+        header.lastIndex = end + 3;
+    }
+    return docstrings;
+}
+
+/**
+ * @returns the styles the templates of a language support
+ */
+export function stylesOf(langId: string): DocstringStyle[] {
+    return langId === "python" ? ["numpy", "google"] : [...DOCSTRING_STYLES];
+}
+
+/**
+ * Converts the docstrings of a file to another style.
+ * @param text - the file
+ * @param langId
+ * @param style
+ * @param range - only convert docstrings between these offsets
+ * @returns the replacements, by offsets of `text`
+ */
+export function restyleText(
+    text: string,
+    langId: string,
+    style: DocstringStyle,
+    range?: { start: number; end: number }
+): { start: number; end: number; text: string }[] {
+    if (!stylesOf(langId).includes(style)) {
+        return [];
+    }
+    const edits: { start: number; end: number; text: string }[] = [];
+    const crlf = text.includes("\r\n");
+    for (const docstring of findDocstrings(text, langId)) {
+        if (range && (docstring.end < range.start || docstring.start > range.end)) {
+            continue;
+        }
+        const body = text.slice(docstring.start, docstring.end);
+        const converted = convertDocstring(crlf ? body.replace(/\r\n/g, "\n") : body, style, docstring.indent);
+        if (converted !== undefined) {
+            edits.push({ start: docstring.start, end: docstring.end, text: crlf ? converted.replace(/\n/g, "\r\n") : converted });
+        }
+    }
+    return edits;
+}
+
+/**
+ * Adds the conversions of a document's docstrings to a workspace edit.
+ * @param range - only convert the docstrings in this range
+ * @returns the number of docstrings converted
+ */
+export function restyleDocument(edit: WorkspaceEdit, document: TextDocument, style: DocstringStyle, range?: Range): number {
+    const edits = restyleText(
+        document.getText(),
+        document.languageId,
+        style,
+        range && { start: document.offsetAt(range.start), end: document.offsetAt(range.end) }
+    );
+    for (const { start, end, text } of edits) {
+        edit.replace(document.uri, new Range(document.positionAt(start), document.positionAt(end)), text);
+    }
+    return edits.length;
+}
+
+/**
+ * Converts the docstrings of every file of the workspace. Open documents are
+ *  changed through `edit` (so that the change can be undone), the other
+ *  files are rewritten directly.
+ * @returns the number of docstrings and files converted
+ */
+export async function restyleWorkspace(
+    edit: WorkspaceEdit,
+    style: DocstringStyle,
+    progress?: Progress<{ message?: string; increment?: number }>,
+    token?: CancellationToken
+): Promise<{ docstrings: number; files: number }> {
+    const uris = await workspace.findFiles(FILE_PATTERN, EXCLUDE_PATTERN, undefined, token);
+    const open = new Map(workspace.textDocuments.map(document => [document.uri.toString(), document]));
+    let docstrings = 0;
+    let files = 0;
+    for (const uri of uris) {
+        if (token?.isCancellationRequested) {
+            break;
+        }
+        progress?.report({ message: uri.path.split("/").pop(), increment: 100 / uris.length });
+        const langId = languageOf(uri);
+        if (!langId) {
+            continue;
+        }
+        try {
+            const count = await restyleFile(edit, uri, langId, style, open.get(uri.toString()));
+            docstrings += count;
+            files += count ? 1 : 0;
+        } catch (error) {
+            logger.warn("restyleWorkspace", `could not convert ${uri.toString()}: ${error}`);
+        }
+    }
+    return { docstrings, files };
+}
+
+async function restyleFile(edit: WorkspaceEdit, uri: Uri, langId: string, style: DocstringStyle, document?: TextDocument): Promise<number> {
+    if (document) {
+        return restyleDocument(edit, document, style);
+    }
+    const text = Buffer.from(await workspace.fs.readFile(uri)).toString("utf8");
+    const edits = restyleText(text, langId, style);
+    if (edits.length) {
+        let converted = "";
+        let last = 0;
+        for (const { start, end, text: replacement } of edits) {
+            converted += text.slice(last, start) + replacement;
+            last = end;
+        }
+        await workspace.fs.writeFile(uri, Buffer.from(converted + text.slice(last), "utf8"));
+    }
+    return edits.length;
+}
@@ -0,0 +1,173 @@
+import { CancellationToken, commands, Position, Progress, TextDocument, TextEditor, window, workspace, WorkspaceEdit } from "vscode";
+import { applyOwnEdit, DocumentAnchor } from "./anchor";
+import { getFunctionSymbols } from "./CodeLensProvider";
+import { docstringLine, isDocumented } from "./formatter";
+import { logger } from "./logger";
+import { collectDocstring } from "./openai";
+
+/** Tries of the edit that is rejected because the document changed meanwhile */
+const MAX_ATTEMPTS = 3;
+
+/**
+ * A function of the file that is being documented
+ */
+interface PendingFunction {
+    name: string;
+    text: string;
+    anchor: DocumentAnchor;
+    /** the formatted docstring, once it has been generated */
+    docstring?: string;
+    /** why no docstring was generated */
+    error?: string;
+}
+
+/**
+ * @returns how many functions of a file are documented at the same time
+ */
+export function getDocumentFileConcurrency(): number {
+    return Math.max(workspace.getConfiguration("doxide").get<number>("documentFile.concurrency") ?? 4, 1);
+}
+
+/**
+ * Runs a task for every item, at most `limit` at a time, starting them in
+ *  the items' order.
+ * @param items
+ * @param limit - the most tasks that run at the same time
+ * @param task
+ */
+export async function forEachLimited<T>(items: T[], limit: number, task: (item: T) => Promise<void>): Promise<void> {
+    let next = 0;
+    const worker = async () => {
+        while (next < items.length) {
+            await task(items[next++]);
+        }
+    };
+    await Promise.all(Array.from({ length: Math.min(Math.max(limit, 1), items.length) }, worker));
+}
+
+/**
+ * @returns the last non-blank line above the given line, or `""`
+ */
+function lineAbove(document: TextDocument, line: number): string {
+    for (let above = line - 1; above >= 0; above--) {
+        const text = document.lineAt(above).text;
+        if (text.trim()) {
+            return text;
+        }
+    }
+    return "";
+}
+
+/**
+ * Generates docstrings for all functions of the editor's document that do
+ *  not have one yet, several at a time. The docstrings are inserted together
+ *  in one edit once all of them are done (or the rest are cancelled), so a
+ *  single undo removes all of them.
+ * @param editor
+ * @param authKey
+ * @param progress - reports every documented or failed function
+ * @param token - cancels the functions that are not done yet
+ */
+export async function documentFile(
+    editor: TextEditor,
+    authKey: string|undefined,
+    progress: Progress<{ message?: string; increment?: number }>,
+    token: CancellationToken
+) {
+    const document = editor.document;
+    const langId = document.languageId;
+    const symbols = (await getFunctionSymbols(document)).filter(symbol =>
+        !isDocumented(document.getText(symbol.range), langId, lineAbove(document, symbol.range.start.line))
+    );
+    if (!symbols.length) {
+        window.showInformationMessage(`All functions of this file already have a docstring.`);
+        return;
+    }
+
+    // The functions can move while the others are being generated
+    const functions: PendingFunction[] = symbols.map(symbol => ({
+        name: symbol.name,
+        text: document.getText(symbol.range),
+        anchor: new DocumentAnchor(document, symbol.range),
+    }));
+    const concurrency = getDocumentFileConcurrency();
+    logger.info("documentFile", `documenting ${functions.length} functions of ${document.uri.toString()}, ${concurrency} at a time`);
+    let done = 0;
+    let failed = 0;
+    try {
+        await forEachLimited(functions, concurrency, async (pending) => {
+            try {
+                // background work, which must not hold up docstrings the user is waiting for
+                pending.docstring = await collectDocstring(pending.text, authKey, editor, pending.anchor, token, "bulk");
+                if (pending.docstring === undefined) {
+                    pending.error = token.isCancellationRequested ? "cancelled" : "the function was edited or is already being documented";
+                }
+            } catch (error: any) {
+                pending.error = `${error}`;
+            }
+            done += 1;
+            if (pending.error !== undefined) {
+                failed += 1;
+                logger.warn("documentFile", `${pending.name}: ${pending.error}`);
+            }
+            const status = pending.error === undefined ? "✅" : "❌";
+            const failures = failed ? `, ${failed} failed` : "";
+            progress.report({
+                increment: 100 / functions.length,
+                message: `${status} ${pending.name} (${done}/${functions.length}${failures})`,
+            });
+        });
+
+        const documented = functions.filter(pending => pending.docstring !== undefined && !pending.anchor.touched);
+        if (documented.length && !await insertDocstrings(document, documented, langId)) {
+            window.showErrorMessage(`ERROR! Could not insert the docstrings, the file was changed.`);
+            return;
+        }
+        reportResult(documented.length, functions.filter(pending => !documented.includes(pending)));
+    } finally {
+        for (const pending of functions) {
+            pending.anchor.dispose();
+        }
+    }
+}
+
+/**
+ * Inserts the docstrings in one edit, from the bottom of the document up so
+ *  that every insertion point is still valid when it is applied.
+ * @returns whether the edit was applied
+ */
+async function insertDocstrings(document: TextDocument, documented: PendingFunction[], langId: string): Promise<boolean> {
+    for (let attempt = 0; attempt < MAX_ATTEMPTS && !document.isClosed; attempt++) {
+        const version = document.version;
+        const edit = new WorkspaceEdit();
+        const lines = documented
+            .map(pending => ({ line: docstringLine(pending.anchor.range.start.line, langId), docstring: pending.docstring! }))
+            .sort((a, b) => b.line - a.line);
+        for (const { line, docstring } of lines) {
+            edit.insert(document.uri, new Position(line, 0), docstring);
+        }
+        if (await applyOwnEdit(edit)) {
+            return true;
+        }
+        if (document.version === version) {
+            // rejected for another reason than a concurrent change
+            return false;
+        }
+    }
+    return false;
+}
+
+function reportResult(documented: number, failed: PendingFunction[]) {
+    if (!failed.length) {
+        window.showInformationMessage(`✅ Generated ${documented} Docstrings!`);
+        return;
+    }
+    window.showWarningMessage(
+        `Generated ${documented} of ${documented + failed.length} Docstrings. Could not document: ${failed.map(pending => pending.name).join(", ")}.`,
+        "Show Log"
+    ).then(selection => {
+        if (selection === "Show Log") {
+            commands.executeCommand("doxide.showLog");
+        }
+    });
+}
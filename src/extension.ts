@@ -1,29 +1,51 @@
-import { commands, Disposable, window, languages, workspace, ProgressLocation, Range, Position } from "vscode";
+import { commands, Disposable, window, languages, workspace, ProgressLocation, Range, Position, ExtensionContext, Uri, WorkspaceEdit } from "vscode";
 import { DoxideCodeLensProvider } from "./CodeLensProvider";
 import { openaiGenerateDocstring } from "./openai";
+import { initDocstringCache } from "./cache";
+import { initTwinIndex } from "./fingerprint";
+import { indexDocument, initExampleIndex, refreshExampleIndex } from "./retrieval";
+import { closeConnections, warmUpConnection } from "./apiClient";
+import { completionBatcher, completionRegistry, hedgeBudget } from "./completions";
+import { requestScheduler } from "./scheduler";
+import { getProvider } from "./providers";
+import { initLengthModel } from "./lengthModel";
+import { initLocalDocstringStats } from "./localDocstring";
+import { alternativeStore } from "./alternatives";
+import { samplingStats } from "./quality";
+import { formatEntry, initLogger, logger } from "./logger";
+import { formatSnapshot, telemetry } from "./telemetry";
+import { DOCSTRING_STYLES, DocstringStyle, restyleDocument, restyleWorkspace, stylesOf } from "./docstringStyle";
+import { documentFile } from "./documentFile";
 
 let disposables: Disposable[] = [];
 /**
  * @example
  */
-export function activate() {
-	console.log(`🤖 Doxide extension is activated!`);
+export function activate(context: ExtensionContext) {
+	// Logs go to the Doxide output channel, with secrets redacted
+	disposables.push(initLogger());
+	logger.info("activate", `🤖 Doxide extension is activated!`);
 	
 	const langId = window.activeTextEditor?.document.languageId;
 
 	let authKey: string | undefined = workspace
 		.getConfiguration("doxide")
 		.get("openAI.apiKey");
-	console.log(`authKey: ${authKey}`);
 
 	// Check if OpenAI API Key is set
-	if (!authKey || authKey === undefined) {
+	if ((!authKey || authKey === undefined) && getProvider().requiresKey) {
 		showAuthKeyWarningMessage();
 		authKey = workspace
 			.getConfiguration("doxide")
 			.get("openAI.apiKey");
 	}
 
+	// Open the API connection in the background so the first request is fast
+	const provider = getProvider();
+	if ((authKey || !provider.requiresKey) && workspace.getConfiguration("doxide").get("http.warmUp") !== false) {
+		warmUpConnection(provider.baseUrl);
+	}
+
 	// TODO yeet this - Command to say hello
 	commands.registerCommand("doxide.helloWorld", (name?) => {
 		window.showInformationMessage(`Hello ${name ? name : ""} from Doxide!`);
@@ -37,14 +59,14 @@ export function activate() {
 
 	// Command to enable CodeLenses
 	commands.registerCommand("doxide.enableCodeLens", () => {
-		console.log("[Command] doxide.enableCodeLens called.");
+		logger.debug("Command", "doxide.enableCodeLens called.");
 		workspace.getConfiguration("doxide").update("codeLens.enabled", true);
 		window.showInformationMessage(`Doxide: CodeLens Enabled.`);
 	});
 
 	// Command to disable CodeLenses
 	commands.registerCommand("doxide.disableCodeLens", () => {
-		console.log("[Command] doxide.disableCodeLens called.");
+		logger.debug("Command", "doxide.disableCodeLens called.");
 		workspace.getConfiguration("doxide").update("codeLens.enabled", false);
 		window.showInformationMessage(`Doxide: CodeLens Disabled.`);
 	});
@@ -66,7 +88,7 @@ export function activate() {
 		})
 		.then((newKey) => {
 			// Remember API Key - not yet configured
-			console.log(`rememberApiKey: ${workspace.getConfiguration("doxide").get("openAI.openAI.apiKey.storeLocation")}`);
+			logger.debug("activate", `rememberApiKey: ${workspace.getConfiguration("doxide").get("openAI.openAI.apiKey.storeLocation")}`);
 			window.showInputBox({
 				title: `Would you like Doxide to store your API key in the User Settings or Workspace Settings? [Learn More](https://code.visualstudio.com/docs/getstarted/settings)`,
 				prompt: `User(U) / Workspace(W)`,
@@ -111,14 +133,228 @@ export function activate() {
 		});
 	});
 	
+	// Docstring lengths are learned to keep max_tokens tight
+	initLengthModel(context.globalState);
+
+	/* ------------------------------- Cache -------------------------------- */
+	// Generated docstrings are cached in global storage, shared by all windows
+	const docstringCache = initDocstringCache(context.globalStorageUri.fsPath);
+
+	// Command to show cache statistics and entries
+	commands.registerCommand("doxide.cache.inspect", async () => {
+		logger.debug("Command", "doxide.cache.inspect called.");
+		const stats = await docstringCache.stats();
+		const entries = await docstringCache.list();
+		const doc = await workspace.openTextDocument({
+			language: "json",
+			content: JSON.stringify({ stats, entries }, null, 2),
+		});
+		window.showTextDocument(doc);
+	});
+
+	// Command to export all cache entries to a JSON file
+	commands.registerCommand("doxide.cache.export", async () => {
+		logger.debug("Command", "doxide.cache.export called.");
+		const folder = workspace.workspaceFolders?.[0];
+		const uri = await window.showSaveDialog({
+			defaultUri: folder ? Uri.joinPath(folder.uri, "doxide-cache.json") : undefined,
+			filters: { "JSON": ["json"] },
+		});
+		if (!uri) { return; }
+		const count = await docstringCache.export(uri.fsPath);
+		window.showInformationMessage(`Doxide: Exported ${count} cached docstrings.`);
+	});
+
+	// Command to remove all cache entries
+	commands.registerCommand("doxide.cache.clear", async () => {
+		logger.debug("Command", "doxide.cache.clear called.");
+		const res = await window.showWarningMessage(
+			`Clear all cached docstrings? This affects every VS Code window.`,
+			{ modal: true },
+			"Clear"
+		);
+		if (res === "Clear") {
+			await docstringCache.clear();
+			window.showInformationMessage(`Doxide: Docstring cache cleared.`);
+		}
+	});
+
+	/* -------------------------------- Twins ------------------------------- */
+	// Docstrings of already documented functions are reused for their twins
+	const twinIndex = initTwinIndex(context.globalState);
+
+	// Command to report how many API calls were saved by reusing docstrings
+	commands.registerCommand("doxide.twins.showReport", async () => {
+		logger.debug("Command", "doxide.twins.showReport called.");
+		const res = await window.showInformationMessage(
+			`Doxide: Reused docstrings of similar functions ${twinIndex.apiCallsSaved} times, saving ${twinIndex.apiCallsSaved} API calls (${twinIndex.size} documented functions indexed).`,
+			"Clear Index"
+		);
+		if (res === "Clear Index") {
+			twinIndex.clear();
+		}
+	});
+
+	/* ------------------------------ Examples ------------------------------ */
+	// Documented functions of the workspace are used as few-shot examples
+	const exampleIndex = initExampleIndex(context.workspaceState);
+	refreshExampleIndex(exampleIndex).catch(error => logger.error("activate", `example index: ${error}`));
+	disposables.push(workspace.onDidSaveTextDocument(document => indexDocument(exampleIndex, document)));
+
+	/* -------------------------- Local Docstrings -------------------------- */
+	// Trivial functions are documented from their signature, without the model
+	const localStats = initLocalDocstringStats(context.workspaceState);
+
+	// Command to report how many functions were documented locally
+	commands.registerCommand("doxide.local.showReport", async () => {
+		logger.debug("Command", "doxide.local.showReport called.");
+		const percent = localStats.total ? Math.round(100 * localStats.local / localStats.total) : 0;
+		const res = await window.showInformationMessage(
+			`Doxide: Documented ${localStats.local} of ${localStats.total} functions in this workspace locally (${percent}%), saving ${localStats.local} API calls.`,
+			"Reset"
+		);
+		if (res === "Reset") {
+			localStats.clear();
+		}
+	});
+
+	/* ---------------------------- Alternatives ---------------------------- */
+	// The other completions of a request are cycled through in place
+	disposables.push(alternativeStore.watch());
+
+	// Command to show the previous alternative of a generated docstring
+	commands.registerCommand("doxide.previousAlternative", (key?: string) => {
+		logger.debug("Command", "doxide.previousAlternative called.");
+		const session = alternativeStore.resolve(key);
+		if (session) {
+			alternativeStore.cycle(session, -1);
+		}
+	});
+
+	// Command to show the next alternative of a generated docstring
+	commands.registerCommand("doxide.nextAlternative", (key?: string) => {
+		logger.debug("Command", "doxide.nextAlternative called.");
+		const session = alternativeStore.resolve(key);
+		if (session) {
+			alternativeStore.cycle(session, 1);
+		}
+	});
+
+	// Command to keep the shown alternative
+	commands.registerCommand("doxide.acceptAlternative", (key?: string) => {
+		logger.debug("Command", "doxide.acceptAlternative called.");
+		const session = alternativeStore.resolve(key);
+		if (session) {
+			alternativeStore.accept(session);
+		}
+	});
+
+	/* ---------------------------- Style Convert --------------------------- */
+	// Command to convert existing docstrings to another template, without the model
+	commands.registerCommand("doxide.convertDocstringStyle", async () => {
+		logger.debug("Command", "doxide.convertDocstringStyle called.");
+		const editor = window.activeTextEditor;
+		const scopes = [
+			...(editor && !editor.selection.isEmpty ? ["Selection"] : []),
+			...(editor ? ["Current File"] : []),
+			"Workspace",
+		];
+		const scope = await window.showQuickPick(scopes, { title: "Doxide: Convert the docstrings of" });
+		if (!scope) { return; }
+		const styles = scope === "Workspace" ? [...DOCSTRING_STYLES] : stylesOf(editor!.document.languageId);
+		const picked = await window.showQuickPick(
+			styles.map(style => ({ label: style, description: `template ${DOCSTRING_STYLES.indexOf(style)}`, style })),
+			{ title: "Doxide: Convert docstrings to" }
+		);
+		if (!picked) { return; }
+		const style: DocstringStyle = picked.style;
+
+		const edit = new WorkspaceEdit();
+		let result = { docstrings: 0, files: 0 };
+		if (scope === "Workspace") {
+			const res = await window.showWarningMessage(
+				`Convert every docstring of the workspace to ${style} style? Files that are not open are saved directly.`,
+				{ modal: true },
+				"Convert"
+			);
+			if (res !== "Convert") { return; }
+			result = await window.withProgress(
+				{ location: ProgressLocation.Notification, title: "Doxide: Converting docstrings", cancellable: true },
+				(progress, token) => restyleWorkspace(edit, style, progress, token)
+			);
+		} else {
+			const range = scope === "Selection" ? editor!.selection : undefined;
+			const docstrings = restyleDocument(edit, editor!.document, style, range);
+			result = { docstrings, files: docstrings ? 1 : 0 };
+		}
+		await workspace.applyEdit(edit);
+
+		// new docstrings should be generated in the same style
+		const res = await window.showInformationMessage(
+			`Doxide: Converted ${result.docstrings} docstrings in ${result.files} files to ${style} style.`,
+			"Use for New Docstrings"
+		);
+		if (res === "Use for New Docstrings") {
+			for (const lang of ["python", "javascript", "typescript"].filter(lang => stylesOf(lang).includes(style))) {
+				workspace.getConfiguration("doxide").update(`${lang}.docstringTemplate`, DOCSTRING_STYLES.indexOf(style));
+			}
+		}
+	});
+
+	/* -------------------------------- Log --------------------------------- */
+	// Command to show the most recent log entries
+	commands.registerCommand("doxide.showLog", async () => {
+		logger.debug("Command", "doxide.showLog called.");
+		const doc = await workspace.openTextDocument({
+			language: "log",
+			content: logger.recent().map(formatEntry).join("\n"),
+		});
+		window.showTextDocument(doc);
+	});
+
+	/* ------------------------------ Requests ------------------------------ */
+	// Command to show how many duplicate requests were absorbed by in-flight ones
+	commands.registerCommand("doxide.showRequestStats", () => {
+		logger.debug("Command", "doxide.showRequestStats called.");
+		window.showInformationMessage(
+			`Doxide: ${completionRegistry.issued} API requests sent, ${completionRegistry.absorbed} duplicate requests absorbed (${completionRegistry.size} in flight, ${requestScheduler.queued} queued). ` +
+			`${completionBatcher.batchedPrompts} prompts sent in ${completionBatcher.batches} multi-prompt requests. ` +
+			`${hedgeBudget.hedges} hedged requests, ${hedgeBudget.wins} won by the hedge. ` +
+			`${samplingStats.average.toFixed(2)} completions per docstring (${samplingStats.escalations} of ${samplingStats.docstrings} escalated). ` +
+			`${requestScheduler.retries} retries, ${requestScheduler.throttled} throttled responses, circuit ${requestScheduler.circuit}. ` +
+			`Queue wait (mean / p95): ${Object.entries(requestScheduler.queueWaitStats())
+				.map(([priority, wait]) => `${priority} ${wait.meanMs.toFixed(0)}ms / ${wait.p95Ms.toFixed(0)}ms`)
+				.join(", ")}.`
+		);
+	});
+
+	// Command to show the latency percentiles, token usage and hit rates
+	commands.registerCommand("doxide.showPerformanceStats", async () => {
+		logger.debug("Command", "doxide.showPerformanceStats called.");
+		const snapshot = telemetry.snapshot();
+		const res = await window.showInformationMessage(`Doxide: ${formatSnapshot(snapshot)}`, "Export JSON", "Reset");
+		if (res === "Export JSON") {
+			const folder = workspace.workspaceFolders?.[0];
+			const uri = await window.showSaveDialog({
+				defaultUri: folder ? Uri.joinPath(folder.uri, "doxide-performance.json") : undefined,
+				filters: { "JSON": ["json"] },
+			});
+			if (!uri) { return; }
+			await workspace.fs.writeFile(uri, Buffer.from(JSON.stringify(snapshot, null, 2), "utf8"));
+			window.showInformationMessage(`Doxide: Exported performance stats.`);
+		} else if (res === "Reset") {
+			telemetry.reset();
+		}
+	});
+
 	/* ------------------------- Generate Docstring ------------------------- */
 	// Command that is run when "Generate Docstring" CodeLens is clicked
 	// TODO check if another docstring is already present
 	commands.registerCommand("doxide.generateDocstring", (text:string="", insertionLine:number=-1) => {
-		console.log(`[genDocstring] text: ${text}`);
+		logger.trace("genDocstring", () => `text: ${text}`);
 
 		// check authKey
-		if (!authKey || authKey === undefined) {
+		if ((!authKey || authKey === undefined) && getProvider().requiresKey) {
 			var isAuthKeyValid = showAuthKeyWarningMessage();
 		} else {
 			var isAuthKeyValid = true;
@@ -126,12 +362,11 @@ export function activate() {
 
 		// Command not called using CodeLens
 		if (!text || text === undefined || insertionLine === -1) {
-			console.log("YES");
 			const editor = window.activeTextEditor;
 			if (!editor) { return; }
 			text = editor.document.getText(editor.selection);
 			insertionLine = editor.selection.start.line;
-			console.log(`text: ${text}, insertionLine: ${insertionLine}`);
+			logger.trace("genDocstring", () => `text: ${text}, insertionLine: ${insertionLine}`);
 			
 		}
 
@@ -142,16 +377,50 @@ export function activate() {
 					location: ProgressLocation.Notification,
 					title: "Doxide",
 					cancellable: true
-				}, async (progress) => {
+				}, async (progress, token) => {
 					progress.report({
 						message: `Creating Docstring...`,
 					});
-					const res = await openaiGenerateDocstring(text, authKey, insertionLine);
+					const res = await openaiGenerateDocstring(text, authKey, insertionLine, progress, token);
 				}
 			);
 		}
 		
 	});
+
+	// Command that fills the docstring template from the function's signature
+	commands.registerCommand("doxide.generateDocstringLocally", (text:string="", insertionLine:number=-1) => {
+		logger.trace("genDocstringLocally", () => `text: ${text}`);
+
+		// Command not called using CodeLens
+		if (!text || insertionLine === -1) {
+			const editor = window.activeTextEditor;
+			if (!editor) { return; }
+			text = editor.document.getText(editor.selection);
+			insertionLine = editor.selection.start.line;
+		}
+		openaiGenerateDocstring(text, authKey, insertionLine, undefined, undefined, true);
+	});
+
+	// Command that documents every function of the file that has no docstring
+	commands.registerCommand("doxide.documentFile", () => {
+		logger.debug("Command", "doxide.documentFile called.");
+		const editor = window.activeTextEditor;
+		if (!editor) { return; }
+
+		// check authKey
+		if ((!authKey || authKey === undefined) && getProvider().requiresKey) {
+			showAuthKeyWarningMessage();
+			return;
+		}
+		window.withProgress(
+			{
+				location: ProgressLocation.Notification,
+				title: "Doxide: Documenting File",
+				cancellable: true
+			}, (progress, token) => documentFile(editor, authKey, progress, token)
+		);
+	});
 }
 
 // function isPropConfigured (prop: any, notYetConfigVal: any) {
@@ -182,5 +451,6 @@ export function deactivate() {
 		disposables.forEach(item => item.dispose());
 	}
 	disposables = [];
+	closeConnections();
 }
 
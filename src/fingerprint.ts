@@ -0,0 +1,296 @@
+import * as crypto from "crypto";
+import { Memento, workspace } from "vscode";
+
+/**
+ * Structural fingerprint of a function: formatting, comments, docstrings and
+ *  the names of locally bound identifiers do not affect it.
+ */
+export interface FunctionFingerprint {
+    /** hash of the whole canonical token stream - equal for exact twins */
+    exact: string;
+    /** MinHash signature of the token shingles - used for near twins */
+    minhash: number[];
+    /** locally bound identifiers, in the order they were canonicalized */
+    locals: string[];
+}
+
+interface TwinEntry {
+    langId: string;
+    templateNum: number;
+    exact: string;
+    minhash: number[];
+    locals: string[];
+    docstring: string;
+}
+
+const MINHASH_SIZE = 64;
+const SHINGLE_SIZE = 4;
+const MAX_ENTRIES = 2000;
+/** Highest score of a near twin, so that a threshold of 1 only accepts exact twins */
+const NEAR_TWIN_MAX = 1 - 1 / MINHASH_SIZE;
+const STATE_KEY = "doxide.twins";
+const SAVED_KEY = "doxide.twins.saved";
+
+const KEYWORDS = new Set([
+    // python
+    "def", "return", "if", "elif", "else", "for", "while", "in", "not", "and",
+    "or", "is", "None", "True", "False", "break", "continue", "pass", "lambda",
+    "yield", "with", "as", "try", "except", "finally", "raise", "class",
+    "import", "from", "global", "nonlocal", "del", "assert", "async", "await",
+    // javascript / typescript
+    "function", "var", "let", "const", "new", "this", "typeof", "instanceof",
+    "null", "undefined", "true", "false", "switch", "case", "default", "do",
+    "catch", "throw", "of", "delete", "void", "export",
+]);
+
+// tokens that introduce a locally bound name
+const BINDERS = new Set(["def", "function", "let", "const", "var", "as", "lambda", "class"]);
+
+/**
+ * Removes comments and docstrings from the function text.
+ * @param text
+ * @param langId
+ * @returns the code without comments and docstrings
+ */
+export function stripCommentsAndDocstrings(text: string, langId: string): string {
+    if (langId === "python") {
+        return text
+            .replace(/("""|''')[\s\S]*?\1/g, " ")
+            .replace(/("(?:\\.|[^"\\\n])*"|'(?:\\.|[^'\\\n])*')|#[^\n]*/g, (match, str) => str || "");
+    }
+    return text
+        .replace(/("(?:\\.|[^"\\\n])*"|'(?:\\.|[^'\\\n])*'|`(?:\\.|[^`\\])*`)|\/\*[\s\S]*?\*\/|\/\/[^\n]*/g,
+            (match, str) => str || "");
+}
+
+/**
+ * Splits code into identifier, number, string and operator tokens.
+ */
+export function tokenize(code: string): string[] {
+    return code.match(
+        /[A-Za-z_$][\w$]*|\d[\w.]*|"(?:\\.|[^"\\])*"|'(?:\\.|[^'\\])*'|`(?:\\.|[^`\\])*`|===|!==|\.\.\.|\*\*=?|\/\/=?|[-+*/%&|^!=<>]=|=>|&&|\|\||->|[^\s\w]/g
+    ) || [];
+}
+
+/**
+ * Finds the identifiers bound inside the function: its name, parameters,
+ *  assignment targets and loop variables. Keyword arguments (`key=` in a call)
+ *  name the callee's parameters, so they are not locals.
+ */
+function findLocals(tokens: string[]): string[] {
+    const locals: string[] = [];
+    const add = (name: string | undefined) => {
+        if (name && /^[A-Za-z_$][\w$]*$/.test(name) && !KEYWORDS.has(name) && !locals.includes(name)) {
+            locals.push(name);
+        }
+    };
+    let depth = 0;
+    let inSignature = false;
+    // whether each enclosing parenthesis is a call's
+    const calls: boolean[] = [];
+    for (let i = 0; i < tokens.length; i++) {
+        const token = tokens[i];
+        if (BINDERS.has(token)) {
+            add(tokens[i + 1]);
+            inSignature = token === "def" || token === "function" || token === "lambda";
+            depth = 0;
+        } else if (inSignature) {
+            // parameters: identifiers directly inside the signature parentheses
+            if (token === "(") {
+                depth += 1;
+            } else if (token === ")") {
+                depth -= 1;
+                if (depth <= 0) {
+                    inSignature = false;
+                }
+            } else if (token === ":" && depth === 0) {
+                inSignature = false;
+            } else if ((depth === 1 || tokens[i - 1] === "lambda") && [",", "(", "*", "**", "...", "lambda"].includes(tokens[i - 1])) {
+                add(token);
+            }
+        } else if (token === "for") {
+            for (let j = i + 1; j < tokens.length && tokens[j] !== "in" && tokens[j] !== "of"; j++) {
+                add(tokens[j]);
+            }
+        } else if (token === "(") {
+            const before = tokens[i - 1] || "";
+            calls.push((/^[A-Za-z_$][\w$]*$/.test(before) && !KEYWORDS.has(before)) || before === ")" || before === "]");
+        } else if (token === ")") {
+            calls.pop();
+        } else if (/^[-+*/%&|^]?=$/.test(tokens[i + 1] || "") && tokens[i - 1] !== "." && !calls[calls.length - 1]) {
+            add(token);
+        }
+    }
+    return locals;
+}
+
+function hash32(text: string, seed: number): number {
+    // FNV-1a, seeded per MinHash permutation
+    let h = (0x811c9dc5 ^ seed) >>> 0;
+    for (let i = 0; i < text.length; i++) {
+        h ^= text.charCodeAt(i);
+        h = Math.imul(h, 0x01000193) >>> 0;
+    }
+    return h;
+}
+
+/**
+ * @param text - the function's source code
+ * @param langId
+ * @returns the function's fingerprint
+ */
+export function fingerprintFunction(text: string, langId: string): FunctionFingerprint {
+    const tokens = tokenize(stripCommentsAndDocstrings(text, langId));
+    const locals = findLocals(tokens);
+    const canonical = tokens.map(token => {
+        const index = locals.indexOf(token);
+        return index === -1 ? token : `$${index}`;
+    });
+
+    const minhash: number[] = new Array(MINHASH_SIZE).fill(0xffffffff);
+    for (let i = 0; i + SHINGLE_SIZE <= Math.max(canonical.length, SHINGLE_SIZE); i++) {
+        const shingle = canonical.slice(i, i + SHINGLE_SIZE).join(" ");
+        for (let k = 0; k < MINHASH_SIZE; k++) {
+            const h = hash32(shingle, k);
+            if (h < minhash[k]) {
+                minhash[k] = h;
+            }
+        }
+    }
+
+    return {
+        exact: crypto.createHash("sha256").update(canonical.join(" ")).digest("hex"),
+        minhash,
+        locals,
+    };
+}
+
+/**
+ * @returns the estimated Jaccard similarity of two MinHash signatures
+ */
+export function similarity(a: number[], b: number[]): number {
+    let equal = 0;
+    for (let k = 0; k < MINHASH_SIZE; k++) {
+        if (a[k] === b[k]) {
+            equal += 1;
+        }
+    }
+    return equal / MINHASH_SIZE;
+}
+
+/**
+ * Renames the twin's locals that appear in its docstring to the names used
+ *  by the function being documented.
+ */
+function renameLocals(docstring: string, from: string[], to: string[]): string {
+    const renames = new Map<string, string>();
+    for (let i = 0; i < Math.min(from.length, to.length); i++) {
+        if (from[i] !== to[i]) {
+            renames.set(from[i], to[i]);
+        }
+    }
+    if (!renames.size) {
+        return docstring;
+    }
+    const pattern = new RegExp(`\\b(${[...renames.keys()].map(n => n.replace(/\$/g, "\\$")).join("|")})\\b`, "g");
+    return docstring.replace(pattern, name => renames.get(name) || name);
+}
+
+/**
+ * Index of functions that already have a generated docstring, persisted in
+ *  the extension's global state so that twins are found across sessions.
+ */
+export class TwinIndex {
+    private entries: TwinEntry[];
+
+    constructor(private readonly state: Memento) {
+        this.entries = state.get<TwinEntry[]>(STATE_KEY) || [];
+    }
+
+    /** Number of API calls avoided by reusing a twin's docstring */
+    public get apiCallsSaved(): number {
+        return this.state.get<number>(SAVED_KEY) || 0;
+    }
+
+    /**
+     * Looks for an already documented twin of the function.
+     * @param fingerprint
+     * @param langId
+     * @param templateNum
+     * @param threshold - minimum similarity for a near twin, 1 for exact twins only
+     * @returns the twin's docstring adapted to the function's names, or `undefined`
+     */
+    public find(fingerprint: FunctionFingerprint, langId: string, templateNum: number, threshold: number): string | undefined {
+        let best: TwinEntry | undefined;
+        let bestScore = 0;
+        for (const entry of this.entries) {
+            if (entry.langId !== langId || entry.templateNum !== templateNum) {
+                continue;
+            }
+            // an estimate of 1 does not make functions exact twins
+            const score = entry.exact === fingerprint.exact ? 1 : Math.min(similarity(entry.minhash, fingerprint.minhash), NEAR_TWIN_MAX);
+            if (score >= threshold && score > bestScore) {
+                best = entry;
+                bestScore = score;
+            }
+        }
+        if (!best) {
+            return undefined;
+        }
+        this.state.update(SAVED_KEY, this.apiCallsSaved + 1);
+        return renameLocals(best.docstring, best.locals, fingerprint.locals);
+    }
+
+    /**
+     * Remembers the docstring generated for a function.
+     */
+    public add(fingerprint: FunctionFingerprint, langId: string, templateNum: number, docstring: string) {
+        this.entries = this.entries.filter(
+            entry => !(entry.exact === fingerprint.exact && entry.langId === langId && entry.templateNum === templateNum)
+        );
+        this.entries.push({ langId, templateNum, docstring, ...fingerprint });
+        if (this.entries.length > MAX_ENTRIES) {
+            this.entries.splice(0, this.entries.length - MAX_ENTRIES);
+        }
+        this.state.update(STATE_KEY, this.entries);
+    }
+
+    public get size(): number {
+        return this.entries.length;
+    }
+
+    public clear() {
+        this.entries = [];
+        this.state.update(STATE_KEY, undefined);
+        this.state.update(SAVED_KEY, undefined);
+    }
+}
+
+let twinIndex: TwinIndex | undefined;
+
+/**
+ * Creates the shared twin index - called once on activation.
+ * @param state - the extension's global state
+ */
+export function initTwinIndex(state: Memento): TwinIndex {
+    twinIndex = new TwinIndex(state);
+    return twinIndex;
+}
+
+/**
+ * @returns the shared twin index, or `undefined` if twin detection is disabled
+ */
+export function getTwinIndex(): TwinIndex | undefined {
+    if (workspace.getConfiguration("doxide").get("twins.enabled") === false) {
+        return undefined;
+    }
+    return twinIndex;
+}
+
+/**
+ * @returns the configured minimum similarity for reusing a twin's docstring
+ */
+export function getSimilarityThreshold(): number {
+    const threshold: number | undefined = workspace.getConfiguration("doxide").get("twins.similarityThreshold");
+    return threshold === undefined ? 1 : Math.min(Math.max(threshold, 0), 1);
+}
@@ -0,0 +1,277 @@
+/**
+ * Where a language puts its docstrings.
+ */
+interface LanguageRules {
+    /**
+     * @param text - the function, from its declaration
+     * @param declarationIndent - indentation of the declaration's line
+     * @param indentUnit - one level of indentation in the editor
+     * @returns the indentation of the docstring's lines
+     */
+    indent(text: string, declarationIndent: string, indentUnit: string): string;
+    /**
+     * @param declarationLine - line of the function's declaration
+     * @returns the line the docstring is inserted at
+     */
+    line(declarationLine: number): number;
+    /**
+     * @param text - the function, from its declaration
+     * @param lineAbove - the last non-blank line above the declaration
+     * @returns whether the function already has a docstring
+     */
+    documented(text: string, lineAbove: string): boolean;
+}
+
+const LANGUAGE_RULES: { [langId: string]: LanguageRules } = {
+    // below the signature, at the indentation of the body
+    python: {
+        indent: (text, declarationIndent, indentUnit) => pythonBodyIndent(text) ?? declarationIndent + indentUnit,
+        line: (declarationLine) => declarationLine + 1,
+        documented: (text) => {
+            const start = pythonBodyStart(text);
+            return start !== undefined && /^[rRuUbB]?("""|'''|"|')/.test(text.slice(start, start + 4));
+        },
+    },
+};
+
+// above the declaration, at its indentation
+const DEFAULT_RULES: LanguageRules = {
+    indent: (_, declarationIndent) => declarationIndent,
+    line: (declarationLine) => declarationLine,
+    documented: (_, lineAbove) => lineAbove.trimEnd().endsWith("*/"),
+};
+
+/**
+ * @param declarationLine - line of the function's declaration
+ * @param langId
+ * @returns the line a docstring of the function is inserted at
+ */
+export function docstringLine(declarationLine: number, langId: string): number {
+    return (LANGUAGE_RULES[langId] || DEFAULT_RULES).line(declarationLine);
+}
+
+/**
+ * @param text - the function, from its declaration
+ * @param langId
+ * @param lineAbove - the last non-blank line above the declaration
+ * @returns whether the function already has a docstring
+ */
+export function isDocumented(text: string, langId: string, lineAbove = ""): boolean {
+    return (LANGUAGE_RULES[langId] || DEFAULT_RULES).documented(text, lineAbove);
+}
+
+/** Whitespace within a line, as `trimStart` sees it */
+function isBlank(char: string): boolean {
+    return char !== "\n" && char.trim() === "";
+}
+
+/**
+ * Finds the end of a Python function's signature in one pass: the first top
+ *  level colon, outside of strings, comments and brackets.
+ * @returns the offset of the colon
+ */
+function pythonSignatureEnd(text: string): number {
+    let depth = 0;
+    let quote: string | undefined;
+    let i = 0;
+    for (; i < text.length; i++) {
+        const char = text[i];
+        if (quote) {
+            if (char === "\\") {
+                i += 1;
+            } else if (char === quote) {
+                quote = undefined;
+            }
+        } else if (char === "'" || char === "\"") {
+            quote = char;
+        } else if (char === "#") {
+            // a comment in a signature that spans several lines
+            while (i + 1 < text.length && text[i + 1] !== "\n") {
+                i += 1;
+            }
+        } else if (char === "(" || char === "[" || char === "{") {
+            depth += 1;
+        } else if (char === ")" || char === "]" || char === "}") {
+            depth -= 1;
+        } else if (char === ":" && depth <= 0) {
+            break;
+        }
+    }
+    return i;
+}
+
+/**
+ * Finds the first statement of a Python function's body, skipping blank
+ *  lines and comments.
+ * @param signatureEnd - the offset of the signature's colon, if known
+ * @returns its offset, or `undefined` if the body is empty
+ */
+export function pythonBodyStart(text: string, signatureEnd = pythonSignatureEnd(text)): number | undefined {
+    for (let i = signatureEnd + 1; i < text.length; i++) {
+        if (text[i] === "#") {
+            const newline = text.indexOf("\n", i);
+            i = newline === -1 ? text.length : newline;
+        } else if (text[i] !== "\n" && text[i] !== "\r" && !isBlank(text[i])) {
+            return i;
+        }
+    }
+    return undefined;
+}
+
+/**
+ * Finds the indentation of a Python function's body: the leading whitespace
+ *  of the line of its first statement.
+ * @returns the indentation, or `undefined` if the body is on the signature's
+ *  line
+ */
+export function pythonBodyIndent(text: string): string | undefined {
+    const signatureEnd = pythonSignatureEnd(text);
+    const start = pythonBodyStart(text, signatureEnd);
+    if (start === undefined) {
+        return undefined;
+    }
+    const lineStart = text.lastIndexOf("\n", start - 1) + 1;
+    return lineStart > signatureEnd ? text.slice(lineStart, start) : undefined;
+}
+
+/**
+ * Re-indents the lines of a docstring as it arrives. The first line stays
+ *  next to the opening token, the first indented line gives the docstring's
+ *  own indentation, which is replaced by the target indentation on every
+ *  line, blank lines lose their whitespace and the whitespace before the
+ *  closing token is dropped.
+ */
+export class IndentNormalizer {
+    private atLineStart = false;
+    private lineLead = "";
+    private base: string | undefined;
+
+    /**
+     * @param indent - the indentation of the docstring's lines
+     */
+    constructor(private readonly indent: string) {}
+
+    /**
+     * @param delta - the next part of the docstring
+     * @returns the formatted text that is complete so far
+     */
+    public push(delta: string): string {
+        let out = "";
+        let i = 0;
+        while (i < delta.length) {
+            if (!this.atLineStart) {
+                // copy the rest of the line as it is
+                const newline = delta.indexOf("\n", i);
+                if (newline === -1) {
+                    return out + delta.slice(i);
+                }
+                out += delta.slice(i, newline);
+                this.atLineStart = true;
+                this.lineLead = "";
+                i = newline + 1;
+                continue;
+            }
+            let end = i;
+            while (end < delta.length && isBlank(delta[end])) {
+                end += 1;
+            }
+            this.lineLead += delta.slice(i, end);
+            i = end;
+            if (i === delta.length) {
+                break;
+            }
+            if (delta[i] === "\n") {
+                // blank line
+                out += "\n";
+                this.lineLead = "";
+                i += 1;
+                continue;
+            }
+            if (this.base === undefined) {
+                this.base = this.lineLead;
+            }
+            const lead = this.lineLead.startsWith(this.base) ? this.lineLead.slice(this.base.length) : "";
+            out += "\n" + this.indent + lead;
+            this.atLineStart = false;
+        }
+        return out;
+    }
+
+    /**
+     * @returns the rest of the docstring, once all of it has been pushed
+     */
+    public end(): string {
+        // a line with only whitespace is where the closing token goes
+        this.atLineStart = false;
+        this.lineLead = "";
+        return "";
+    }
+}
+
+/**
+ * Formats the docstrings of one function: the opening and closing tokens
+ *  and the indentation of every line.
+ */
+export class DocstringFormatter {
+    /** indentation of the docstring's lines */
+    public readonly indent: string;
+
+    /**
+     * @param text - the function, from its declaration
+     * @param langId
+     * @param options.declarationIndent - indentation of the declaration's line
+     * @param options.indentUnit - one level of indentation in the editor
+     */
+    constructor(
+        text: string,
+        langId: string,
+        private readonly options: { startToken: string; endToken: string; declarationIndent: string; indentUnit: string }
+    ) {
+        const rules = LANGUAGE_RULES[langId] || DEFAULT_RULES;
+        this.indent = rules.indent(text, options.declarationIndent, options.indentUnit);
+    }
+
+    /** the opening token, indented */
+    public get opening(): string {
+        return this.indent + this.options.startToken;
+    }
+
+    /** the closing token on its own line */
+    public get closing(): string {
+        return "\n" + this.indent + this.options.endToken + "\n";
+    }
+
+    /**
+     * @returns a normalizer for a streamed docstring
+     */
+    public stream(): IndentNormalizer {
+        return new IndentNormalizer(this.indent);
+    }
+
+    /**
+     * @param docstring - the text between the tokens, as generated
+     * @returns the docstring with its tokens, ready to be inserted
+     */
+    public format(docstring: string): string {
+        // the same as streaming it, but a line at a time
+        const lines = docstring.split("\n");
+        // a last line with only whitespace is where the closing token goes
+        const last = lines.length > 1 && !lines[lines.length - 1].trim() ? lines.length - 1 : lines.length;
+        let base: string | undefined;
+        let out = this.opening + lines[0];
+        for (let index = 1; index < last; index++) {
+            const line = lines[index];
+            const content = line.trimStart();
+            if (!content) {
+                out += "\n";
+                continue;
+            }
+            const lead = line.slice(0, line.length - content.length);
+            if (base === undefined) {
+                base = lead;
+            }
+            out += "\n" + this.indent + (lead.startsWith(base) ? lead.slice(base.length) : "") + content;
+        }
+        return out + this.closing;
+    }
+}
@@ -0,0 +1,79 @@
+import { workspace } from "vscode";
+
+/** Latencies below this many samples are too few to derive a hedge delay */
+const MIN_SAMPLES = 20;
+const MAX_SAMPLES = 500;
+
+/**
+ * Keeps the most recent time-to-first-token latencies.
+ */
+export class LatencyTracker {
+    private readonly samples: number[] = [];
+
+    public record(ms: number) {
+        this.samples.push(ms);
+        if (this.samples.length > MAX_SAMPLES) {
+            this.samples.shift();
+        }
+    }
+
+    /**
+     * @param p - percentile between 0 and 100
+     * @returns the `p`th percentile of the recorded latencies, or `undefined`
+     *  if there are too few of them
+     */
+    public percentile(p: number): number | undefined {
+        if (this.samples.length < MIN_SAMPLES) {
+            return undefined;
+        }
+        const sorted = [...this.samples].sort((a, b) => a - b);
+        const index = Math.min(Math.ceil(sorted.length * p / 100) - 1, sorted.length - 1);
+        return sorted[Math.max(index, 0)];
+    }
+
+    public get size(): number {
+        return this.samples.length;
+    }
+}
+
+/**
+ * Counts hedged requests and keeps them within a share of all requests.
+ */
+export class HedgeBudget {
+    /** Requests that could have been hedged */
+    public requests = 0;
+    /** Hedge requests sent */
+    public hedges = 0;
+    /** Hedge requests that answered first */
+    public wins = 0;
+
+    /**
+     * @param maxExtraPercent - hedges allowed per 100 requests
+     * @returns whether another hedge may be sent
+     */
+    public allows(maxExtraPercent: number): boolean {
+        return this.hedges + 1 <= this.requests * maxExtraPercent / 100;
+    }
+}
+
+export interface HedgeConfig {
+    enabled: boolean;
+    /** hedge once no token arrived within this percentile of recent latency */
+    percentile: number;
+    /** engine for hedge requests, the request's own engine if empty */
+    fallbackEngine: string;
+    maxExtraPercent: number;
+}
+
+/**
+ * @returns the configured hedging behaviour
+ */
+export function getHedgeConfig(): HedgeConfig {
+    const config = workspace.getConfiguration("doxide");
+    return {
+        enabled: config.get("hedge.enabled") === true,
+        percentile: Math.min(Math.max(config.get("hedge.percentile") || 95, 1), 99.9),
+        fallbackEngine: config.get("hedge.fallbackEngine") || "",
+        maxExtraPercent: Math.max(config.get<number>("hedge.maxExtraPercent") ?? 10, 0),
+    };
+}
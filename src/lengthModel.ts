@@ -0,0 +1,229 @@
+import { Memento, workspace } from "vscode";
+import { countTokens } from "./tokenizer";
+
+const STATE_KEY = "doxide.lengthModel";
+/** Docstrings recorded before predictions are trusted */
+const MIN_SAMPLES = 10;
+/** Recent actual/predicted ratios kept to derive the percentile */
+const MAX_RATIOS = 200;
+const PERCENTILE = 0.95;
+const MIN_MAX_TOKENS = 32;
+/** Regularization of the least squares fit */
+const RIDGE = 1e-3;
+/** How much predictions grow after a docstring was cut off at max_tokens */
+const TRUNCATION_WIDENING = 1.5;
+const MAX_WIDENING = 4;
+/** How much of the widening is kept after a docstring that was not cut off */
+const WIDENING_DECAY = 0.9;
+
+/**
+ * Features of a function that docstring length depends on.
+ */
+export interface FunctionFeatures {
+    params: number;
+    bodyTokens: number;
+    returns: number;
+}
+
+interface LengthStats {
+    /** XᵀX and Xᵀy of the least squares fit */
+    xtx: number[][];
+    xty: number[];
+    samples: number;
+    /** actual / predicted length of recent docstrings */
+    ratios: number[];
+    /** factor of predictions, raised by docstrings that were cut off */
+    widening?: number;
+}
+
+/**
+ * @returns the features of `text`
+ */
+export function extractFeatures(text: string, langId: string): FunctionFeatures {
+    const open = text.indexOf("(");
+    let params = 0;
+    if (open !== -1) {
+        // count top level commas up to the matching parenthesis
+        let depth = 0;
+        let current = "";
+        const names: string[] = [];
+        for (const char of text.slice(open + 1)) {
+            if ("([{".includes(char)) {
+                depth += 1;
+            } else if (")]}".includes(char)) {
+                if (depth === 0) {
+                    break;
+                }
+                depth -= 1;
+            } else if (char === "," && depth === 0) {
+                names.push(current.trim());
+                current = "";
+                continue;
+            }
+            current += char;
+        }
+        names.push(current.trim());
+        params = names.filter(name => name && !(langId === "python" && /^(self|cls)\b/.test(name))).length;
+    }
+    return {
+        params,
+        bodyTokens: countTokens(text),
+        returns: (text.match(/\b(return|yield)\b[ \t]*[^\s;]/g) || []).length,
+    };
+}
+
+function featureVector(features: FunctionFeatures): number[] {
+    return [1, features.params, features.bodyTokens / 100, features.returns];
+}
+
+/**
+ * Solves `a x = b` by Gaussian elimination with partial pivoting.
+ */
+function solve(a: number[][], b: number[]): number[] | undefined {
+    const n = b.length;
+    const m = a.map((row, i) => [...row, b[i]]);
+    for (let col = 0; col < n; col++) {
+        let pivot = col;
+        for (let row = col + 1; row < n; row++) {
+            if (Math.abs(m[row][col]) > Math.abs(m[pivot][col])) {
+                pivot = row;
+            }
+        }
+        if (Math.abs(m[pivot][col]) < 1e-12) {
+            return undefined;
+        }
+        [m[col], m[pivot]] = [m[pivot], m[col]];
+        for (let row = 0; row < n; row++) {
+            if (row !== col) {
+                const factor = m[row][col] / m[col][col];
+                for (let k = col; k <= n; k++) {
+                    m[row][k] -= factor * m[col][k];
+                }
+            }
+        }
+    }
+    return m.map((row, i) => row[n] / m[i][i]);
+}
+
+/**
+ * Predicts how many tokens a docstring will take, from the lengths of the
+ *  docstrings generated so far, per language and template. A linear model
+ *  over the function's features gives the expected length, and the
+ *  percentile of how far actual lengths exceeded predictions gives the
+ *  `max_tokens` to ask for.
+ */
+export class LengthModel {
+    private models: { [key: string]: LengthStats };
+
+    constructor(private readonly state: Memento) {
+        this.models = state.get<{ [key: string]: LengthStats }>(STATE_KEY) || {};
+    }
+
+    /**
+     * Records the length of a generated docstring. The length of a docstring
+     *  that was cut off at `max_tokens` is only a lower bound, so it is not
+     *  learned - it widens the following predictions instead.
+     * @param features - of the documented function
+     * @param langId
+     * @param templateNum
+     * @param docstring - the docstring that was inserted
+     * @param truncated - whether the docstring was cut off at `max_tokens`
+     */
+    public record(features: FunctionFeatures, langId: string, templateNum: number, docstring: string, truncated = false) {
+        const key = `${langId}:${templateNum}`;
+        const x = featureVector(features);
+        const stats = this.models[key] || {
+            xtx: x.map(() => x.map(() => 0)),
+            xty: x.map(() => 0),
+            samples: 0,
+            ratios: [],
+        };
+        const widening = stats.widening ?? 1;
+        if (truncated) {
+            stats.widening = Math.min(widening * TRUNCATION_WIDENING, MAX_WIDENING);
+            this.models[key] = stats;
+            this.state.update(STATE_KEY, this.models);
+            return;
+        }
+        stats.widening = 1 + (widening - 1) * WIDENING_DECAY;
+        const tokens = countTokens(docstring);
+        const predicted = this.expected(stats, x);
+        if (predicted !== undefined) {
+            stats.ratios.push(tokens / predicted);
+            if (stats.ratios.length > MAX_RATIOS) {
+                stats.ratios.shift();
+            }
+        }
+        x.forEach((xi, i) => {
+            x.forEach((xj, j) => stats.xtx[i][j] += xi * xj);
+            stats.xty[i] += xi * tokens;
+        });
+        stats.samples += 1;
+        this.models[key] = stats;
+        this.state.update(STATE_KEY, this.models);
+    }
+
+    /**
+     * @returns the `max_tokens` that covers the docstring of a function like
+     *  this one with high probability, or `undefined` if there is too little
+     *  data yet
+     */
+    public predictMaxTokens(features: FunctionFeatures, langId: string, templateNum: number): number | undefined {
+        const stats = this.models[`${langId}:${templateNum}`];
+        if (!stats || stats.samples < MIN_SAMPLES || !stats.ratios.length) {
+            return undefined;
+        }
+        const predicted = this.expected(stats, featureVector(features));
+        if (predicted === undefined) {
+            return undefined;
+        }
+        const ratios = [...stats.ratios].sort((a, b) => a - b);
+        const ratio = ratios[Math.min(Math.floor(ratios.length * PERCENTILE), ratios.length - 1)];
+        return Math.max(Math.ceil(predicted * Math.max(ratio, 1) * (stats.widening ?? 1)), MIN_MAX_TOKENS);
+    }
+
+    /** Docstrings recorded per language and template */
+    public get samples(): { [key: string]: number } {
+        return Object.fromEntries(Object.entries(this.models).map(([key, stats]) => [key, stats.samples]));
+    }
+
+    public clear() {
+        this.models = {};
+        this.state.update(STATE_KEY, undefined);
+    }
+
+    private expected(stats: LengthStats, x: number[]): number | undefined {
+        if (stats.samples < x.length) {
+            return undefined;
+        }
+        const regularized = stats.xtx.map((row, i) => row.map((value, j) => value + (i === j ? RIDGE * stats.samples : 0)));
+        const weights = solve(regularized, stats.xty);
+        if (!weights) {
+            return undefined;
+        }
+        const predicted = weights.reduce((total, w, i) => total + w * x[i], 0);
+        return predicted > 0 ? predicted : undefined;
+    }
+}
+
+let lengthModel: LengthModel | undefined;
+
+/**
+ * Loads the length model from the extension's global state.
+ * @param state - `context.globalState`
+ */
+export function initLengthModel(state: Memento): LengthModel {
+    lengthModel = new LengthModel(state);
+    return lengthModel;
+}
+
+/**
+ * @returns the shared length model, or `undefined` if length prediction is
+ *  disabled
+ */
+export function getLengthModel(): LengthModel | undefined {
+    if (workspace.getConfiguration("doxide").get("openAI.predictLength") === false) {
+        return undefined;
+    }
+    return lengthModel;
+}
@@ -0,0 +1,328 @@
+import { Memento, workspace } from "vscode";
+import { stripCommentsAndDocstrings } from "./fingerprint";
+
+/** Functions with more lines than this are always sent to the model */
+const MAX_BODY_LINES = 8;
+/** Longer return expressions are described instead of quoted */
+const MAX_EXPRESSION_LENGTH = 60;
+const STATS_KEY = "doxide.local.stats";
+
+export interface Parameter {
+    name: string;
+    type?: string;
+    default?: string;
+}
+
+export interface Signature {
+    name: string;
+    params: Parameter[];
+    returnType?: string;
+    /** the expression of the function's only return statement */
+    returns?: string;
+}
+
+interface LocalStats {
+    local: number;
+    total: number;
+}
+
+/**
+ * Splits a parameter list at its top level commas.
+ */
+function splitTopLevel(text: string): string[] {
+    const parts: string[] = [];
+    let depth = 0;
+    let current = "";
+    for (const char of text) {
+        if ("([{<".includes(char)) {
+            depth += 1;
+        } else if (")]}>".includes(char)) {
+            depth -= 1;
+        } else if (char === "," && depth === 0) {
+            parts.push(current.trim());
+            current = "";
+            continue;
+        }
+        current += char;
+    }
+    parts.push(current.trim());
+    return parts.filter(part => part);
+}
+
+/**
+ * @returns the text between the parenthesis at `open` and its match
+ */
+function parenthesized(text: string, open: number): string {
+    let depth = 0;
+    for (let i = open; i < text.length; i++) {
+        if (text[i] === "(") {
+            depth += 1;
+        } else if (text[i] === ")") {
+            depth -= 1;
+            if (depth === 0) {
+                return text.slice(open + 1, i);
+            }
+        }
+    }
+    return text.slice(open + 1);
+}
+
+function parseParameter(param: string): Parameter | undefined {
+    const match = param.match(/^([*.]*[\w$]+|\{[^}]*\}|\[[^\]]*\])\??\s*(?::\s*([^=]+?))?\s*(?:=\s*([\s\S]+))?$/);
+    if (!match || ["self", "cls"].includes(match[1])) {
+        return undefined;
+    }
+    return { name: match[1], type: match[2]?.trim(), default: match[3]?.trim() };
+}
+
+/**
+ * @returns the type of a literal expression, or `undefined`
+ */
+function literalType(expression: string, langId: string): string | undefined {
+    const python = langId === "python";
+    if (/^-?\d+$/.test(expression)) {
+        return python ? "int" : "number";
+    } else if (/^-?\d*\.\d+$/.test(expression)) {
+        return python ? "float" : "number";
+    } else if (/^[rbfu]?("|'|`)/i.test(expression)) {
+        return python ? "str" : "string";
+    } else if (/^(True|False|true|false)$/.test(expression)) {
+        return python ? "bool" : "boolean";
+    } else if (expression.startsWith("[")) {
+        return python ? "list" : "Array";
+    } else if (expression.startsWith("{")) {
+        return python ? "dict" : "Object";
+    } else if (python && expression.startsWith("(")) {
+        return "tuple";
+    }
+    const constructed = expression.match(/^(?:new\s+)?(list|dict|set|tuple|str|int|float|Array|Map|Set|Object)\(/);
+    return constructed ? constructed[1] : undefined;
+}
+
+/**
+ * Parses the signature and the returned expression of a function.
+ * @param text - the function
+ * @param langId
+ */
+export function parseSignature(text: string, langId: string): Signature | undefined {
+    const code = stripCommentsAndDocstrings(text, langId);
+    const header = langId === "python"
+        ? code.match(/^\s*(?:async\s+)?def\s+(\w+)\s*\(/)
+        : code.match(/^\s*(?:export\s+)?(?:default\s+)?(?:async\s+)?(?:function\s*\*?\s*([\w$]+)\s*\(|(?:const|let|var)\s+([\w$]+)\s*=\s*(?:async\s+)?(?:function\s*\(|\()|(?:(?:public|private|protected|static|async|get|set)\s+)*([\w$]+)\s*\()/);
+    if (!header) {
+        return undefined;
+    }
+    const name = header[1] || header[2] || header[3];
+    const open = header[0].length - 1;
+    const paramText = parenthesized(code, open);
+    const params = splitTopLevel(paramText).map(parseParameter).filter((p): p is Parameter => p !== undefined);
+    const afterParams = code.slice(open + paramText.length + 2);
+
+    let returnType: string | undefined;
+    let returns: string | undefined;
+    if (langId === "python") {
+        returnType = afterParams.match(/^\s*->\s*([^:]+):/)?.[1].trim();
+    } else {
+        returnType = afterParams.match(/^\s*:\s*([^{=]+?)\s*(?:\{|=>)/)?.[1];
+        const arrowBody = afterParams.match(/^[^{]*?=>\s*([^{\s][^\n;]*)/);
+        returns = arrowBody?.[1].trim();
+    }
+    const returnStatements = [...code.matchAll(/^\s*return\b[ \t]*([^\n;]*)/gm)].map(match => match[1].trim());
+    if (returnStatements.length === 1 && returnStatements[0] && returnStatements[0] !== "None") {
+        returns = returnStatements[0];
+    }
+    if (returns && !returnType) {
+        // a returned variable has the type of the literal it was assigned
+        const assigned = /^[\w$]+$/.test(returns)
+            ? code.match(new RegExp(`^\\s*(?:(?:const|let|var)\\s+)?${returns.replace(/\$/g, "\\$")}\\s*=\\s*([^\\n;]+)`, "m"))?.[1].trim()
+            : returns;
+        returnType = assigned ? literalType(assigned, langId) : undefined;
+    }
+    return { name, params, returnType, returns };
+}
+
+/**
+ * @returns the cyclomatic complexity of the function: one plus the number of
+ *  branches and boolean operators
+ */
+export function complexityOf(text: string, langId: string): number {
+    const code = stripCommentsAndDocstrings(text, langId).replace(/("(?:\\.|[^"\\\n])*"|'(?:\\.|[^'\\\n])*'|`(?:\\.|[^`\\])*`)/g, "\"\"");
+    const branches = langId === "python"
+        ? /\b(if|elif|for|while|except|and|or|case)\b/g
+        : /\b(if|for|while|case|catch)\b|&&|\|\||\?\?|\?(?![.?])/g;
+    return 1 + (code.match(branches) || []).length;
+}
+
+/**
+ * @returns whether the function is simple enough to be documented locally
+ */
+export function isTrivial(text: string, langId: string, maxComplexity: number): boolean {
+    const lines = stripCommentsAndDocstrings(text, langId).split("\n").filter(line => line.trim());
+    return lines.length <= MAX_BODY_LINES + 1 && complexityOf(text, langId) <= maxComplexity;
+}
+
+/**
+ * @returns the words of an identifier, lower case
+ */
+function words(identifier: string): string[] {
+    return identifier
+        .replace(/^[*.$_]+/, "")
+        .replace(/([a-z0-9])([A-Z])/g, "$1_$2")
+        .toLowerCase()
+        .split(/[_$]+/)
+        .filter(word => word);
+}
+
+function sentence(text: string): string {
+    return text.charAt(0).toUpperCase() + text.slice(1) + ".";
+}
+
+function summarize(signature: Signature): string {
+    const [verb, ...rest] = words(signature.name);
+    const subject = rest.join(" ");
+    if (verb === "get" && subject) {
+        return `Returns the ${subject}.`;
+    } else if (["is", "has", "can", "should"].includes(verb) && subject) {
+        return `Checks whether it ${verb} ${subject}.`;
+    } else if (verb === "set" && subject) {
+        return `Sets the ${subject}.`;
+    }
+    return sentence(words(signature.name).join(" "));
+}
+
+function describeParam(param: Parameter, numpy: boolean): string {
+    const description = `The ${words(param.name).join(" ")}`;
+    if (!param.default) {
+        return description + ".";
+    }
+    return numpy ? `${description}, by default ${param.default}.` : `${description}. Defaults to ${param.default}.`;
+}
+
+function describeReturn(signature: Signature): string {
+    const returns = signature.returns!;
+    const attribute = returns.match(/^(?:self|this)\.([\w$]+)$/);
+    if (attribute || /^[\w$]+$/.test(returns)) {
+        return `The ${words(attribute ? attribute[1] : returns).join(" ")}.`;
+    }
+    return returns.length <= MAX_EXPRESSION_LENGTH ? `\`${returns}\`` : "The result.";
+}
+
+/**
+ * Fills the docstring template from the function's signature, without a
+ *  request to the model.
+ * @param text - the function
+ * @param langId
+ * @param templateNum - `doxide.[languageName].docstringTemplate`
+ * @returns the docstring between the docstring tokens, or `undefined` if the
+ *  signature could not be parsed
+ */
+export function generateLocalDocstring(text: string, langId: string, templateNum: number): string | undefined {
+    const signature = parseSignature(text, langId);
+    if (!signature) {
+        return undefined;
+    }
+    const paramType = (param: Parameter) => param.type || (param.default && literalType(param.default, langId)) || undefined;
+    const hasReturn = signature.returns !== undefined;
+    const lines: string[] = [];
+
+    if (langId !== "python" && templateNum >= 2) {
+        // JSDoc
+        for (const param of signature.params) {
+            lines.push(`* @param {${paramType(param) || "*"}} ${param.name} - ${describeParam(param, false)}`);
+        }
+        if (hasReturn) {
+            lines.push(`* @returns {${signature.returnType || "*"}} - ${describeReturn(signature)}`);
+        }
+        lines.push(`* @description - ${summarize(signature)}`);
+        return "\n" + lines.join("\n");
+    }
+
+    lines.push(summarize(signature));
+    if (templateNum === 1) {
+        // Google style
+        if (signature.params.length) {
+            lines.push("", "Parameters:");
+            for (const param of signature.params) {
+                const type = paramType(param);
+                lines.push(`    ${param.name}${type ? `(${type})` : ""}: ${describeParam(param, false)}`);
+            }
+        }
+        if (hasReturn) {
+            lines.push("", "Returns:", `    ${signature.returnType ? `${signature.returnType}: ` : ""}${describeReturn(signature)}`);
+        }
+    } else {
+        // numpy style
+        if (signature.params.length) {
+            lines.push("", "Parameters", "----------");
+            for (const param of signature.params) {
+                const spec = [paramType(param), param.default ? "optional" : undefined].filter(part => part).join(", ");
+                lines.push(spec ? `${param.name} : ${spec}` : param.name, `    ${describeParam(param, true)}`);
+            }
+        }
+        if (hasReturn) {
+            lines.push("", "Returns", "-------");
+            lines.push(...(signature.returnType ? [signature.returnType, `    ${describeReturn(signature)}`] : [describeReturn(signature)]));
+        }
+    }
+    const indent = langId === "python" ? "    " : "";
+    return "\n" + lines.map(line => line ? indent + line : line).join("\n");
+}
+
+/**
+ * Counts the functions that were documented locally, per workspace.
+ */
+export class LocalDocstringStats {
+    constructor(private readonly state: Memento) {}
+
+    private get stats(): LocalStats {
+        return this.state.get<LocalStats>(STATS_KEY) || { local: 0, total: 0 };
+    }
+
+    /** Functions documented without a request to the model */
+    public get local(): number {
+        return this.stats.local;
+    }
+
+    /** All functions documented */
+    public get total(): number {
+        return this.stats.total;
+    }
+
+    /**
+     * @param local - whether the docstring was generated locally
+     */
+    public record(local: boolean) {
+        const stats = this.stats;
+        this.state.update(STATS_KEY, { local: stats.local + (local ? 1 : 0), total: stats.total + 1 });
+    }
+
+    public clear() {
+        this.state.update(STATS_KEY, undefined);
+    }
+}
+
+let localStats: LocalDocstringStats | undefined;
+
+/**
+ * Creates the shared statistics - called once on activation.
+ * @param state - the extension's workspace state
+ */
+export function initLocalDocstringStats(state: Memento): LocalDocstringStats {
+    localStats = new LocalDocstringStats(state);
+    return localStats;
+}
+
+/**
+ * @returns the shared statistics
+ */
+export function getLocalDocstringStats(): LocalDocstringStats | undefined {
+    return localStats;
+}
+
+/**
+ * @returns the complexity up to which functions are documented locally, 0 if
+ *  they never are
+ */
+export function getLocalComplexityThreshold(): number {
+    return Math.max(workspace.getConfiguration("doxide").get<number>("local.maxComplexity") ?? 0, 0);
+}
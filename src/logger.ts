@@ -0,0 +1,149 @@
+import { Disposable, OutputChannel, window, workspace } from "vscode";
+
+export const LOG_LEVELS = ["trace", "debug", "info", "warn", "error", "off"] as const;
+export type LogLevel = typeof LOG_LEVELS[number];
+
+/** A message, or a function that formats it only if the level is enabled */
+export type LogMessage = string | (() => string);
+
+export interface LogEntry {
+    time: number;
+    level: LogLevel;
+    scope: string;
+    message: string;
+}
+
+/** Entries kept in memory for `Doxide: Show Log` */
+const BUFFER_SIZE = 1000;
+
+/** Values that look like credentials, whatever key they belong to */
+const SECRET_PATTERNS: [RegExp, string][] = [
+    [/("?(?:api[_-]?key|auth[_-]?key|authorization)"?\s*[:=]\s*"?)(?:Bearer\s+)?[^"\s,}]+/gi, "$1***"],
+    [/\bsk-[A-Za-z0-9_-]{8,}/g, "sk-***"],
+    [/\b(Bearer\s+)[A-Za-z0-9._~+/=-]+/gi, "$1***"],
+];
+
+/**
+ * Replaces credentials in a message.
+ * @param text
+ * @param secrets - known secrets (e.g. the configured API keys)
+ */
+export function redact(text: string, secrets: Iterable<string> = []): string {
+    for (const secret of secrets) {
+        text = text.split(secret).join("***");
+    }
+    return SECRET_PATTERNS.reduce((redacted, [pattern, replacement]) => redacted.replace(pattern, replacement), text);
+}
+
+/**
+ * Leveled logger. Messages below the level are dropped without being
+ *  formatted, the others are redacted, kept in a bounded ring buffer and
+ *  written to the sink (the `Doxide` output channel).
+ */
+export class Logger {
+    public level: LogLevel = "info";
+    private readonly entries: LogEntry[] = [];
+    private next = 0;
+    private readonly secrets = new Set<string>();
+
+    /**
+     * @param capacity - number of entries kept in memory
+     * @param sink - receives every formatted entry
+     */
+    constructor(private readonly capacity = BUFFER_SIZE, public sink?: (line: string) => void) {}
+
+    public enabled(level: LogLevel): boolean {
+        return level !== "off" && LOG_LEVELS.indexOf(level) >= LOG_LEVELS.indexOf(this.level);
+    }
+
+    public trace(scope: string, message: LogMessage) {
+        this.log("trace", scope, message);
+    }
+
+    public debug(scope: string, message: LogMessage) {
+        this.log("debug", scope, message);
+    }
+
+    public info(scope: string, message: LogMessage) {
+        this.log("info", scope, message);
+    }
+
+    public warn(scope: string, message: LogMessage) {
+        this.log("warn", scope, message);
+    }
+
+    public error(scope: string, message: LogMessage) {
+        this.log("error", scope, message);
+    }
+
+    public log(level: LogLevel, scope: string, message: LogMessage) {
+        if (!this.enabled(level)) {
+            return;
+        }
+        const entry = {
+            time: Date.now(),
+            level,
+            scope,
+            message: redact(typeof message === "function" ? message() : message, this.secrets),
+        };
+        if (this.entries.length < this.capacity) {
+            this.entries.push(entry);
+        } else {
+            this.entries[this.next] = entry;
+        }
+        this.next = (this.next + 1) % this.capacity;
+        this.sink?.(formatEntry(entry));
+    }
+
+    /**
+     * Redacts a secret from all later messages.
+     */
+    public addSecret(secret: string | undefined) {
+        if (secret && secret.length >= 8) {
+            this.secrets.add(secret);
+        }
+    }
+
+    /**
+     * @returns the entries in memory, oldest first
+     */
+    public recent(): LogEntry[] {
+        return this.entries.length < this.capacity
+            ? [...this.entries]
+            : [...this.entries.slice(this.next), ...this.entries.slice(0, this.next)];
+    }
+}
+
+/**
+ * @returns the entry as a line of the log
+ */
+export function formatEntry(entry: LogEntry): string {
+    return `${new Date(entry.time).toISOString()} [${entry.level}] [${entry.scope}] ${entry.message}`;
+}
+
+export const logger = new Logger();
+
+let channel: OutputChannel | undefined;
+
+/**
+ * Writes the log to the `Doxide` output channel and follows
+ *  `doxide.log.level` - called once on activation.
+ */
+export function initLogger(): Disposable {
+    channel = window.createOutputChannel("Doxide");
+    logger.sink = line => channel?.appendLine(line);
+    const readConfig = () => {
+        const config = workspace.getConfiguration("doxide");
+        const level = config.get<LogLevel>("log.level");
+        logger.level = level && LOG_LEVELS.includes(level) ? level : "info";
+        logger.addSecret(config.get("openAI.apiKey"));
+        logger.addSecret(config.get("provider.apiKey"));
+    };
+    readConfig();
+    const watching = workspace.onDidChangeConfiguration(event => {
+        if (event.affectsConfiguration("doxide")) {
+            readConfig();
+        }
+    });
+    return Disposable.from(watching, channel);
+}
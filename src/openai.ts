@@ -1,20 +1,46 @@
 /* eslint-disable @typescript-eslint/naming-convention */
 // Disabling eslint because it doesn't like OpenAI's property names (because they use snake_case)
 
-// TODO fix security vulnerability
-process.env.NODE_TLS_REJECT_UNAUTHORIZED = "0";
-
-import axios from "axios";
-import { Position, Range, window, workspace } from "vscode";
+import { CancellationError, CancellationToken, CancellationTokenSource, Position, Progress, Range, TextDocument, TextEditor, WorkspaceEdit, window, workspace } from "vscode";
 import { template } from "./constants/Template";
+import { computeCacheKey, getDocstringCache } from "./cache";
+import { completionRegistry, requestCompletions } from "./completions";
+import { fingerprintFunction, getSimilarityThreshold, getTwinIndex } from "./fingerprint";
+import { DocstringTerminator } from "./terminator";
+import { budgetPrompt, getContextLength } from "./budget";
+import { extractFeatures, getLengthModel } from "./lengthModel";
+import { compactFunction, getCompactionConfig } from "./compaction";
+import { getExampleBudget, getExampleIndex } from "./retrieval";
+import { alternativeStore } from "./alternatives";
+import { generateLocalDocstring, getLocalComplexityThreshold, getLocalDocstringStats, isTrivial } from "./localDocstring";
+import { checkDocstring, getAdaptiveSampling, rankCandidates, samplingStats } from "./quality";
+import { logger } from "./logger";
+import { telemetry } from "./telemetry";
+import { DocstringFormatter, docstringLine, IndentNormalizer } from "./formatter";
+import { DocumentAnchor } from "./anchor";
+import { Priority } from "./scheduler";
+import { styleOfDocstring } from "./docstringStyle";
+
+/** Functions (document URI and line) that are currently being documented */
+const pendingTargets = new Set<string>();
 
 /**
  * Makes a post request to OpenAI-Codex API. Returns an array of the responses 
  *  or `undefined` if something went wrong.
  * @param text
+ * @param progress - reports the generation speed while streaming
+ * @param token - cancels the generation, e.g. from the progress notification
+ * @param local - fill the template from the signature instead of asking the model
  * @see https://beta.openai.com/docs/api-reference/completions/create
  */
-export async function openaiGenerateDocstring(text: string, authKey: string|undefined, insertionLine: number) {
+export async function openaiGenerateDocstring(
+    text: string,
+    authKey: string|undefined,
+    insertionLine: number,
+    progress?: Progress<{ message?: string }>,
+    token?: CancellationToken,
+    local = false
+) {
     // console.log(`  insertionLine: ${JSON.stringify(insertionLine, null, 2)}`);
     // console.log(`  OPENAI_API_KEY: ${authKey}`);
     // console.log(`  text: ${JSON.stringify(text)}`);
@@ -23,11 +49,128 @@ export async function openaiGenerateDocstring(text: string, authKey: string|unde
         return;
     }
 
+    // A second click on the same function while it is being documented would
+    //  insert the docstring twice
     const editor = window.activeTextEditor;
+    const target = `${editor?.document.uri.toString()}#${insertionLine}`;
+    if (pendingTargets.has(target)) {
+        completionRegistry.absorb();
+        logger.debug("openaiGenerateDocstring", `already generating for ${target}`);
+        return;
+    }
+    // The docstring goes into this document, next to the function wherever
+    //  it has moved by then, even if another editor is active
+    const anchor = editor && insertionLine >= 0 && insertionLine < editor.document.lineCount
+        ? anchorFunction(editor.document, insertionLine, text)
+        : undefined;
+    pendingTargets.add(target);
+    try {
+        return await generateDocstring(text, authKey, editor, anchor, insertionLine, progress, token, local);
+    } finally {
+        pendingTargets.delete(target);
+        anchor?.dispose();
+    }
+}
+
+/**
+ * Generates the docstring of an anchored function without inserting it, so
+ *  that the docstrings of several functions can be inserted in one edit.
+ * @param editor - an editor of the function's document, for its indentation
+ * @param priority - the scheduling class of the requests
+ * @returns the formatted docstring, or `undefined` if the generation was
+ *  cancelled or the function is already being documented
+ * @throws if the docstring could not be generated
+ */
+export async function collectDocstring(
+    text: string,
+    authKey: string|undefined,
+    editor: TextEditor,
+    anchor: DocumentAnchor,
+    token?: CancellationToken,
+    priority: Priority = "interactive"
+): Promise<string | undefined> {
+    const insertionLine = anchor.range.start.line;
+    const target = `${anchor.uri.toString()}#${insertionLine}`;
+    if (pendingTargets.has(target)) {
+        logger.debug("collectDocstring", `already generating for ${target}`);
+        return undefined;
+    }
+    let docstring: string | undefined;
+    pendingTargets.add(target);
+    try {
+        await generateDocstring(text, authKey, editor, anchor, insertionLine, undefined, token, false, formatted => docstring = formatted, priority);
+    } finally {
+        pendingTargets.delete(target);
+    }
+    return docstring;
+}
+
+/**
+ * @returns an anchor of the lines of the function
+ */
+function anchorFunction(document: TextDocument, insertionLine: number, text: string): DocumentAnchor {
+    const endLine = Math.min(insertionLine + text.split("\n").length - 1, document.lineCount - 1);
+    return new DocumentAnchor(document, new Range(new Position(insertionLine, 0), document.lineAt(endLine).range.end));
+}
+
+/**
+ * @param editor - the editor the generation was started from
+ * @param collect - receives the formatted docstring instead of inserting
+ *  it, with errors thrown instead of shown
+ * @param priority - the scheduling class of the requests
+ */
+async function generateDocstring(
+    text: string,
+    authKey: string|undefined,
+    editor: TextEditor | undefined,
+    anchor: DocumentAnchor | undefined,
+    insertionLine: number,
+    progress?: Progress<{ message?: string }>,
+    token?: CancellationToken,
+    local = false,
+    collect?: (docstring: string) => void,
+    priority: Priority = "interactive"
+) {
+    if (token?.isCancellationRequested) {
+        return;
+    }
     const langId = editor?.document.languageId || 'python';
     const startDocstringToken = workspace.getConfiguration("doxide").get(`${langId}.startDocstringToken`) || "'''";
     const endDocstringToken = workspace.getConfiguration("doxide").get(`${langId}.endDocstringToken`) || "'''";
     const templateNum: number = workspace.getConfiguration("doxide").get(`${langId}.docstringTemplate`) || 0;
+    const formatter = createFormatter(editor, text, langId, insertionLine, String(startDocstringToken), String(endDocstringToken));
+    const place = async (docstring: string): Promise<Range | undefined> => {
+        if (collect) {
+            // inserted by the caller, together with other docstrings
+            collect(formatter.format(docstring));
+            return undefined;
+        }
+        return insertDocstring(anchor, formatter, docstring, langId);
+    };
+    const generated = (detail = "") => {
+        if (!collect) {
+            window.showInformationMessage(`✅ Generated Docstring!${detail}`);
+        }
+    };
+
+    // Trivial functions are documented from their signature, without a request
+    const localStats = getLocalDocstringStats();
+    const maxComplexity = getLocalComplexityThreshold();
+    if (local || (maxComplexity > 0 && isTrivial(text, langId, maxComplexity))) {
+        const docstring = generateLocalDocstring(text, langId, templateNum);
+        if (docstring !== undefined) {
+            localStats?.record(true);
+            await place(docstring);
+            generated(" (locally)");
+            return;
+        }
+        if (local) {
+            window.showWarningMessage(`Could not parse the function's signature. Please generate the docstring with the model instead.`);
+            return;
+        }
+    }
+    localStats?.record(false);
+    const startedAt = Date.now();
 
     const additionalPostPromptText: string = `${langId === 'python'?"\n    ": ""}` + "# An elaborate, high quality docstring for the above function:" + `${langId === 'python'?"\n    ": ""}` + startDocstringToken;
     const additionalPrePromptText: string = "";
@@ -37,146 +180,435 @@ export async function openaiGenerateDocstring(text: string, authKey: string|unde
     const exampleBubbleSort = docstringTemplateObj?.exampleCode || '';
     const templates = docstringTemplateObj?.exampleTemplates || [];
     // const formattingExamples: string = "def bubble_sort(array):\n    n = len(array)\n    for i in range(n):\n        already_sorted = True\n        for j in range(n - i - 1):\n            if array[j] > array[j + 1]:\n                array[j], array[j + 1] = array[j + 1], array[j]\n                already_sorted = False\n        if already_sorted:\n            break\n    return array"+additionalPostPromptText+"\n    Bubble sort implementation.\n\n    Parameters\n    ----------\n    array : list\n        The array to be sorted.\n\n    Returns\n    -------\n    list\n        The sorted array.\n\n    Examples\n    --------\n    >>> bubble_sort([3, 2, 1])\n    [1, 2, 3]\n    \"\"\""+"\n\n";
-    const formattingExamples: string = exampleBubbleSort + additionalPostPromptText + templates[templateNum] + endDocstringToken + "\n\n";
+    // Documented functions of the workspace that are similar to this one show
+    //  the project's own docstrings, falling back to the bubble sort. They
+    //  replace the template's example, so only those in its style are used
+    const templateStyle = styleOfDocstring(templates[templateNum] || "");
+    const examples = getExampleIndex()?.find(
+        text, langId, getExampleBudget(), undefined, example => styleOfDocstring(example.docstring) === templateStyle
+    ) || [];
+    const formattingExamples: string = examples.length
+        ? examples.map(example => "\n" + example.code + "\n" + additionalPostPromptText + example.docstring + endDocstringToken + "\n\n").join("")
+        : exampleBubbleSort + additionalPostPromptText + templates[templateNum] + endDocstringToken + "\n\n";
+    logger.debug("openaiGenerateDocstring", `${examples.length} examples from the workspace`);
 
-    const prompt = formattingExamples + text + additionalPostPromptText;
+    // Ask for about as many tokens as docstrings of similar functions took,
+    //  which keeps long functions with short docstrings from running long
+    const lengthModel = getLengthModel();
+    const features = extractFeatures(text, langId);
+    const predictedMaxTokens = lengthModel?.predictMaxTokens(features, langId, templateNum);
+
+    // Comments and the docstrings of nested functions cost prompt tokens
+    //  without telling the model much about the function
+    const compaction = getCompactionConfig();
+    let promptText = text;
+    if (compaction.enabled) {
+        const compacted = compactFunction(text, langId, compaction.skeletonThreshold);
+        promptText = compacted.text;
+        logger.debug("openaiGenerateDocstring", `compacted function: ${compacted.tokensBefore} -> ${compacted.tokensAfter} tokens${compacted.skeleton ? " (skeleton)" : ""}`);
+        progress?.report({ message: `Creating Docstring... (function compacted from ${compacted.tokensBefore} to ${compacted.tokensAfter} tokens)` });
+    }
+
+    // The prompt plus max_tokens must fit in the engine's context, so large
+    //  functions are reduced to a skeleton (or truncated) before sending
+    const budget = budgetPrompt(
+        functionText => formattingExamples + functionText + additionalPostPromptText,
+        promptText,
+        langId,
+        predictedMaxTokens ?? Math.floor(text.length/2),
+        getContextLength(engine || ""),
+        engine || ""
+    );
+    const prompt = budget.prompt;
     // const prompt = text + additionalPostPromptText;
-    console.log(`PROMPT: ${prompt}`);
-    // NOTE: The token count of your prompt plus max_tokens cannot exceed the 
-    //  model's context length. davinci-codex supports 4096 tokens
-    await axios
-        .post(
-            `https://api.openai.com/v1/engines/${engine}/completions`,
-            {
-                prompt: prompt,
-                // suffix: "",
-                max_tokens: Math.floor(text.length/2),
-                temperature: 0.3,
-                top_p: 1,
-                n: workspace.getConfiguration("doxide").get("openAI.config.n") || 5,
-                stream: false,
-                logprobs: null,
-                stop: docstringTemplateObj?.stopTokens || ["#", "\"\"\"", "'''", "//", "/**", "*/"],
-                // presence_penalty: 0,
-                // frequency_penalty: 0,
-                // best_of: ,
-                // logit_bias:
-            },
+    logger.trace("openaiGenerateDocstring", () => `prompt: ${prompt}`);
+    logger.debug("openaiGenerateDocstring", `prompt tokens: ${budget.promptTokens}, max_tokens: ${budget.maxTokens}, trimmed: ${budget.trimmed}`);
+    telemetry.record("promptBuild", Date.now() - startedAt);
+
+    // With adaptive sampling, one completion is requested first and the rest
+    //  of the configured n only if it fails the quality checks
+    const maxCompletions = Number(workspace.getConfiguration("doxide").get("openAI.config.n") || 5);
+    const adaptive = maxCompletions > 1 && getAdaptiveSampling();
+    const sampling = {
+        temperature: 0.3,
+        top_p: 1,
+        n: adaptive ? 1 : maxCompletions,
+        stop: docstringTemplateObj?.stopTokens || ["#", "\"\"\"", "'''", "//", "/**", "*/"],
+        ...(adaptive ? { logprobs: 0 } : {}),
+    };
+    const styleExample = examples.length ? examples[0].docstring : templates[templateNum] || "";
+
+    // Reuse the completions of an identical earlier request if there is one
+    const cache = getDocstringCache();
+    const cacheKey = computeCacheKey({ text, langId, templateNum, engine: engine || "", sampling });
+    const cached = await cache?.get(cacheKey);
+    if (cache) {
+        telemetry.hit("cache", !!cached?.choices.length);
+    }
+    if (cached && cached.choices.length) {
+        logger.info("openaiGenerateDocstring", `cache hit: ${cacheKey}`);
+        const range = await place(cached.choices[0]);
+        if (anchor) {
+            await keepAlternatives(anchor.document, range, cached.choices, formatter);
+        }
+        generated(" (cached)");
+        return;
+    }
+
+    // Reuse the docstring of an already documented twin of this function
+    const twins = getTwinIndex();
+    const fingerprint = fingerprintFunction(text, langId);
+    const twinDocstring = twins?.find(fingerprint, langId, templateNum, getSimilarityThreshold());
+    if (twinDocstring !== undefined) {
+        logger.info("openaiGenerateDocstring", `reusing docstring of twin: ${fingerprint.exact}`);
+        await place(twinDocstring);
+        generated(" (reused from a similar function)");
+        return;
+    }
+
+    if (budget.maxTokens < 1) {
+        if (collect) {
+            throw new Error(`The prompt does not fit in the context of ${engine}.`);
+        }
+        window.showErrorMessage(`ERROR! The prompt does not fit in the context of ${engine}.`);
+        return false;
+    }
+
+    // Streamed docstrings are written into the document as they arrive
+    const stream = workspace.getConfiguration("doxide").get("openAI.stream") !== false && anchor !== undefined && !collect;
+    let writer: StreamingDocstringWriter | undefined;
+    const maxTokens = budget.maxTokens;
+    // Streamed choices are cut off as soon as they are complete
+    const terminator = stream && workspace.getConfiguration("doxide").get("openAI.earlyStop") !== false
+        ? new DocstringTerminator(langId, String(endDocstringToken), templates[templateNum] || "", Number(sampling.n), maxTokens)
+        : undefined;
+    const startTime = Date.now();
+    let numTokens = 0;
+    let lastReport = 0;
+
+    let canWrite = false;
+
+    // Cancelled from the progress notification, or by an edit to the function
+    //  or closing its document - edits elsewhere only move the target
+    const cancellation = new CancellationTokenSource();
+    const cancelledByUser = token?.onCancellationRequested(() => cancellation.cancel());
+    const targetChanged = () => {
+        logger.info("openaiGenerateDocstring", `target changed, cancelling`);
+        cancellation.cancel();
+    };
+    const documentChanged = anchor?.onDidTouch(targetChanged);
+    if (anchor?.touched) {
+        targetChanged();
+    }
+
+    try {
+        const { promise, shared } = requestCompletions(
+            { engine: engine || "", prompt, maxTokens, sampling, authKey },
             {
-                headers: {
-                    'Content-Type': 'application/json',
-                    'Authorization': `Bearer ${authKey}`,
+                stream,
+                terminator,
+                token: cancellation.token,
+                priority,
+                onDelta: (index, delta) => {
+                    if (cancellation.token.isCancellationRequested) {
+                        return;
+                    }
+                    numTokens += 1;
+                    if (index === 0 && canWrite && anchor) {
+                        // nothing is written before the first token arrives
+                        writer = writer || new StreamingDocstringWriter(anchor, formatter, langId);
+                        writer.write(delta);
+                    }
+                    const now = Date.now();
+                    if (progress && now - lastReport > 250) {
+                        lastReport = now;
+                        const tokensPerSecond = numTokens / Math.max((now - startTime) / 1000, 0.001);
+                        progress.report({ message: `Writing Docstring... (${tokensPerSecond.toFixed(1)} tokens/s)` });
+                    }
                 },
             }
-        )
-        .then((response: { data: any }) => {
-            console.log(
-                `[openaiGenerateDocstring] response: ${JSON.stringify(
-                    response.data,
-                    null,
-                    2
-                )}`
-            );
-            
-            let docstring = response.data.choices[0].text;
-            
-            editor?.edit(editBuilder => {
-                // make sure docstring is added after function signature
-                if (langId === 'python') {
-                    insertionLine += 1;
+        );
+        // an identical request that is already running writes its own docstring
+        canWrite = stream && !shared;
+        const first = await promise;
+        const { tokensSaved } = first;
+        if (cancellation.token.isCancellationRequested) {
+            throw new CancellationError();
+        }
+
+        let savedMessage = "";
+        if (writer) {
+            await writer.finish();
+            logger.debug("openaiGenerateDocstring", `streamed ${numTokens} tokens in ${Date.now() - startTime}ms`);
+            if (tokensSaved) {
+                logger.info("openaiGenerateDocstring", `stopped early, saved up to ${tokensSaved} tokens`);
+                savedMessage = ` (stopped early, saved up to ${tokensSaved} tokens)`;
+            }
+        }
+
+        let choices = first.choices;
+        let logprobs = first.logprobs || [];
+        let finishReasons = first.finishReasons || [];
+        let reports = choices.map(choice => checkDocstring(choice, text, langId, styleExample));
+        let escalated = false;
+        if (adaptive && reports[0].failures.length) {
+            // only pay for more completions when the first one falls short
+            escalated = true;
+            logger.info("openaiGenerateDocstring", `first completion failed checks (${reports[0].failures.join("; ")}), requesting ${maxCompletions - 1} more`);
+            progress?.report({ message: `Improving Docstring... (${reports[0].failures.join("; ")})` });
+            try {
+                const more = await requestCompletions(
+                    { engine: engine || "", prompt, maxTokens, sampling: { ...sampling, n: maxCompletions - 1 }, authKey },
+                    { batch: false, token: cancellation.token, priority }
+                ).promise;
+                choices = [...choices, ...more.choices];
+                logprobs = [...first.choices.map((_, index) => logprobs[index]), ...(more.logprobs || [])];
+                finishReasons = [...first.choices.map((_, index) => finishReasons[index]), ...more.choices.map((_, index) => more.finishReasons?.[index])];
+                reports = [...reports, ...more.choices.map(choice => checkDocstring(choice, text, langId, styleExample))];
+            } catch (error: any) {
+                // a streamed docstring is already complete and stays as it is
+                if (!writer && (error instanceof CancellationError || cancellation.token.isCancellationRequested)) {
+                    throw error;
                 }
-                docstring = addDocstringIndentationAndTokens(text, docstring, langId);
-                const insertionPoint = new Position(insertionLine, 0);
-                editBuilder.insert(insertionPoint, docstring);
-            });
+                logger.warn("openaiGenerateDocstring", `could not request more completions: ${error}`);
+            }
+        }
+        samplingStats.record(escalated ? maxCompletions : Number(sampling.n), escalated);
+        const order = rankCandidates(reports, logprobs);
+        const ranked = order.map(index => choices[index]);
+
+        // a streamed docstring is already shown and is replaced if a later
+        //  completion ranks higher
+        const shown = writer ? choices[0] : ranked[0];
+        const editStartedAt = Date.now();
+        const range = writer ? writer.range : await place(shown);
+        telemetry.record("editApply", writer ? writer.editMs : Date.now() - editStartedAt);
+        if (anchor && !cancellation.token.isCancellationRequested) {
+            // the other completions are shown with Previous / Next
+            const alternatives = [shown, ...ranked.filter(choice => choice !== shown)];
+            await keepAlternatives(anchor.document, range, alternatives, formatter, ranked[0] === shown ? 0 : 1);
+        }
 
-            window.showInformationMessage(`✅ Generated Docstring!`);
-        })
-        .catch((error: any) => {
-            console.error(`[openaiGenerateDocstring] error: ${error}`);
-            window.showErrorMessage(`ERROR! Could not generate Docstring.\n${error}`);
+        cache?.set({
+            key: cacheKey,
+            langId,
+            engine: engine || "",
+            templateNum,
+            choices: ranked,
+            createdAt: Date.now(),
+        }).catch((error: any) => logger.error("openaiGenerateDocstring", `cache write failed: ${error}`));
+
+        twins?.add(fingerprint, langId, templateNum, ranked[0]);
+        lengthModel?.record(features, langId, templateNum, ranked[0], finishReasons[order[0]] === "length");
+
+        telemetry.record("total", Date.now() - startedAt);
+        generated(savedMessage);
+    } catch (error: any) {
+        // don't leave a partially streamed docstring behind
+        await writer?.discard();
+        if (error instanceof CancellationError || cancellation.token.isCancellationRequested) {
+            logger.info("openaiGenerateDocstring", `cancelled`);
             return false;
-        });
+        }
+        if (collect) {
+            throw error;
+        }
+        logger.error("openaiGenerateDocstring", `error: ${error}`);
+        window.showErrorMessage(`ERROR! Could not generate Docstring.\n${error}`);
+        return false;
+    } finally {
+        cancelledByUser?.dispose();
+        documentChanged?.dispose();
+        writer?.dispose();
+        cancellation.dispose();
+    }
 }
 
 /**
- * Checks if indentation is already present in docstring. If not, adds 
- *  indentation to the docstring given.
- * @param docstring 
- * @returns docstring with indentation
+ * @returns the formatter of the function's docstrings, with the indentation
+ *  of the editor
  */
-function addDocstringIndentationAndTokens(text:string, docstring: string, langId:string): string {
-    const editor = window.activeTextEditor;
-    const tabSize = editor?.options.tabSize as number;
-    const insertSpaces = editor?.options.insertSpaces as boolean;
-    const indentString = insertSpaces ? ' '.repeat(tabSize) : '\t';
-    let numIndents = 0;
-
-    if (langId === "python") {
-        // [1] COUNT NUMBER OF INDENTS NEEDED
-        numIndents = countNumIndents(insertSpaces, tabSize, text);
-
-        // [2] CHECKING IF DOCSTRING ALREADY INCLUDES INDENTATION
-        const numIndentsInDocstring = countNumIndents(insertSpaces, tabSize, docstring);
-        console.log(numIndentsInDocstring);
-
-        if (!(numIndentsInDocstring === numIndents)) {
-            const numIndentsDiff = numIndents - numIndentsInDocstring;
-            if (numIndentsDiff > 0) {
-                // docstring does not include (enough) indentation, add it
-                var re2 = new RegExp('\\n(?![\n\r])', 'g');
-                docstring = docstring.replace(re2, `\n${indentString.repeat(numIndentsDiff)}`);
-            }
-            
-        }
-    }
+function createFormatter(editor: TextEditor | undefined, text: string, langId: string, insertionLine: number, startToken: string, endToken: string): DocstringFormatter {
+    const tabSize = editor?.options.tabSize as number || 4;
+    const indentUnit = editor?.options.insertSpaces === false ? '\t' : ' '.repeat(tabSize);
+    const declarationLine = editor && insertionLine >= 0 && insertionLine < editor.document.lineCount ? editor.document.lineAt(insertionLine) : undefined;
+    const declarationIndent = declarationLine ? declarationLine.text.slice(0, declarationLine.firstNonWhitespaceCharacterIndex) : "";
+    return new DocstringFormatter(text, langId, { startToken, endToken, declarationIndent, indentUnit });
+}
 
-    console.log(`numIndents: ${numIndents}`);
-    
+/**
+ * Inserts the docstring next to the anchored function, below its signature
+ *  for Python and above it for other languages.
+ * @returns the range of the inserted docstring, or `undefined` if it was not
+ *  inserted
+ */
+async function insertDocstring(anchor: DocumentAnchor | undefined, formatter: DocstringFormatter, docstring: string, langId: string): Promise<Range | undefined> {
+    if (!anchor) {
+        return undefined;
+    }
+    docstring = formatter.format(docstring);
+    logger.trace("insertDocstring", () => docstring);
+    let insertionPoint = new Position(0, 0);
+    const inserted = await anchor.edit((edit, range) => {
+        // make sure docstring is added after function signature
+        insertionPoint = new Position(docstringLine(range.start.line, langId), 0);
+        edit.insert(anchor.uri, insertionPoint, docstring);
+    });
+    return inserted ? new Range(insertionPoint, insertionPoint.translate(docstring.split("\n").length - 1)) : undefined;
+}
 
-    // [4] CONSTRUCTING THE FINAL DOCSTRING
-    const startDocstringToken = workspace.getConfiguration("doxide").get(`${langId}.startDocstringToken`) || "'''";
-    const endDocstringToken = workspace.getConfiguration("doxide").get(`${langId}.endDocstringToken`) || "'''";
-    // console.log(`startDocstringToken: ${startDocstringToken}`);
-
-    // insert indents (either tabs or spaces) into each line of the docstring
-    const newDocstring = indentString.repeat(numIndents) + startDocstringToken 
-    + docstring
-    + '\n' + indentString.repeat(numIndents) + endDocstringToken + '\n';
-    console.log(newDocstring);
-    return newDocstring;
+/**
+ * Keeps the other completions of a request, so that the user can cycle
+ *  through them in place without a new request.
+ * @param range - of the inserted docstring
+ * @param choices - the completions, the shown one first
+ * @param select - the completion to show instead of the inserted one
+ */
+async function keepAlternatives(document: TextDocument, range: Range | undefined, choices: string[], formatter: DocstringFormatter, select = 0) {
+    if (!range) {
+        return;
+    }
+    const shown = document.getText(range);
+    const formatted = choices.map((choice, index) => index === 0 ? shown : formatter.format(choice));
+    const alternatives = [...new Set(formatted)];
+    const session = alternativeStore.start(document.uri, range, alternatives);
+    const offset = alternatives.indexOf(formatted[select]);
+    if (session && offset > 0) {
+        await alternativeStore.cycle(session, offset);
+    }
 }
 
 /**
- * @returns the number of indents/tabs are needed for the docstring
+ * Writes a docstring into the document while it is being streamed. The
+ *  start and end docstring tokens are inserted first and the streamed text
+ *  is written between them, each line re-indented by the formatter as soon
+ *  as its first character arrives.
  */
-function countNumIndents(insertSpaces:boolean, tabSize:number, text:string): number {
-    // find for the first line of code after function signature
-    var pattern = insertSpaces ? `\\n\\s{${tabSize},}` : `\\n\\t+`;
-    var re = new RegExp(pattern);
-    var match = text.match(re) || [];
-    console.log(`match: ${match}`);
-
-    // count the number of indets in that first line
-    let numIndents = 0;
-    var spacesCounter = 0;
-    if (match.length) {
-        for (let i=0; i<match[0].length; i++) {
-            let char = match[0][i];
-            if (char === '\t') {
-                numIndents += 1;
-            } else if (char === ' ') {
-                spacesCounter += 1;
-            }
-            if (insertSpaces && spacesCounter === tabSize) {
-                numIndents += 1;
-                spacesCounter = 0;
-            }
+class StreamingDocstringWriter {
+    private readonly normalizer: IndentNormalizer;
+    private readonly anchor: DocumentAnchor;
+    private readonly openingLength: number;
+    private written = 0;
+    private failed = false;
+    private pending = "";
+    private writing: Promise<void> | undefined;
+    private readonly began: Promise<boolean>;
+    /** time spent applying edits so far */
+    public editMs = 0;
+
+    /**
+     * @param target - the anchored function
+     */
+    constructor(
+        target: DocumentAnchor,
+        formatter: DocstringFormatter,
+        langId: string
+    ) {
+        this.normalizer = formatter.stream();
+        const opening = formatter.opening;
+        const closing = formatter.closing;
+        this.openingLength = opening.length;
+        const line = docstringLine(target.range.start.line, langId);
+        const start = new Position(line, 0);
+        // keep track of where the docstring is while the user edits elsewhere
+        this.anchor = new DocumentAnchor(target.document, new Range(start, start));
+        this.began = this.apply((edit, range) => edit.insert(this.anchor.uri, range.start, opening + closing));
+    }
+
+    /**
+     * The written docstring, or `undefined` if the user has edited it.
+     */
+    public get range(): Range | undefined {
+        return this.anchor.touched ? undefined : this.anchor.range;
+    }
+
+    /**
+     * Formats streamed text and queues it for insertion.
+     * @param delta - the newly streamed text
+     */
+    public write(delta: string) {
+        const text = this.normalizer.push(delta);
+        if (text) {
+            this.emit(text);
+        }
+    }
+
+    /**
+     * Writes the rest of the docstring and waits for all edits to be applied.
+     */
+    public async finish() {
+        const text = this.normalizer.end();
+        if (text) {
+            this.emit(text);
+        }
+        await this.idle();
+    }
+
+    /**
+     * Removes everything that was written, unless the user has edited it.
+     */
+    public async discard() {
+        this.pending = "";
+        await this.idle();
+        if (this.anchor.touched) {
+            return;
         }
+        await this.apply((edit, range) => edit.delete(this.anchor.uri, range));
     }
 
-    // console.log(`re: ${re}`);
-    // console.log(`match: ${JSON.stringify(match)}`);
-    // console.log(`numIndents: ${numIndents}`);
-    return numIndents;
-}
\ No newline at end of file
+    /**
+     * Stops following the docstring.
+     */
+    public dispose() {
+        this.anchor.dispose();
+    }
+
+    private async apply(build: (edit: WorkspaceEdit, range: Range) => void): Promise<boolean> {
+        const startedAt = Date.now();
+        try {
+            return await this.anchor.edit(build);
+        } finally {
+            this.editMs += Date.now() - startedAt;
+        }
+    }
+
+    private async idle() {
+        await this.began;
+        while (this.writing) {
+            await this.writing;
+        }
+    }
+
+    private emit(text: string) {
+        if (this.failed) {
+            return;
+        }
+        this.pending += text;
+        if (!this.writing) {
+            this.writing = this.flush();
+        }
+    }
+
+    /**
+     * Applies the queued text. Text that arrives while an edit is being
+     *  applied is written by the next edit, so a fast stream results in
+     *  few, larger edits.
+     */
+    private async flush() {
+        this.failed = !await this.began;
+        while (this.pending && !this.failed) {
+            const text = this.pending;
+            const offset = this.openingLength + this.written;
+            this.pending = "";
+            const document = this.anchor.document;
+            const applied = await this.apply((edit, range) => {
+                edit.insert(this.anchor.uri, document.positionAt(document.offsetAt(range.start) + offset), text);
+            });
+            // the rest would be written out of place
+            this.failed = !applied;
+            this.written += text.length;
+        }
+        this.pending = "";
+        this.writing = undefined;
+    }
+}
@@ -0,0 +1,22 @@
+import { workspace } from "vscode";
+import { OpenAIProvider } from "./openai";
+import { OpenAICompatibleProvider } from "./openaiCompatible";
+import { CompletionProvider } from "./provider";
+
+export { CompletionProvider, meanLogprob, parseChoices, parseFinishReasons, parseLogprobs } from "./provider";
+export { OpenAIProvider, OPENAI_BASE_URL } from "./openai";
+export { OpenAICompatibleProvider } from "./openaiCompatible";
+
+/**
+ * @returns the provider selected in the (workspace) settings
+ */
+export function getProvider(): CompletionProvider {
+    const config = workspace.getConfiguration("doxide");
+    if (config.get("provider.name") === "openaiCompatible") {
+        return new OpenAICompatibleProvider(
+            config.get("provider.baseUrl") || "http://localhost:8000/v1",
+            config.get("provider.apiKey")
+        );
+    }
+    return new OpenAIProvider();
+}
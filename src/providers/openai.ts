@@ -0,0 +1,23 @@
+import { CompletionProvider } from "./provider";
+
+export const OPENAI_BASE_URL = "https://api.openai.com/v1";
+
+/**
+ * The OpenAI completions API.
+ * @see https://beta.openai.com/docs/api-reference/completions/create
+ */
+export class OpenAIProvider implements CompletionProvider {
+    public readonly id: string = "openai";
+    public readonly requiresKey: boolean = true;
+    public readonly supportsBatch: boolean = true;
+
+    constructor(public readonly baseUrl: string = OPENAI_BASE_URL) {}
+
+    public buildRequest(engine: string, body: { [key: string]: unknown }): { url: string; body: object } {
+        return { url: `${this.baseUrl}/engines/${engine}/completions`, body };
+    }
+
+    public authorization(authKey: string | undefined): string | undefined {
+        return authKey;
+    }
+}
@@ -0,0 +1,29 @@
+import { CompletionProvider } from "./provider";
+
+/**
+ * A server that implements the OpenAI completions API, e.g. a local
+ *  inference server. The engine is sent as the `model` of the request.
+ */
+export class OpenAICompatibleProvider implements CompletionProvider {
+    public readonly id: string = "openaiCompatible";
+    public readonly requiresKey: boolean = false;
+    /** not every compatible server accepts an array of prompts */
+    public readonly supportsBatch: boolean = false;
+    public readonly baseUrl: string;
+
+    /**
+     * @param baseUrl - e.g. `http://localhost:8000/v1`
+     * @param apiKey - the server's own key - the OpenAI key is never sent to it
+     */
+    constructor(baseUrl: string, private readonly apiKey?: string) {
+        this.baseUrl = baseUrl.replace(/\/+$/, "");
+    }
+
+    public buildRequest(engine: string, body: { [key: string]: unknown }): { url: string; body: object } {
+        return { url: `${this.baseUrl}/completions`, body: { model: engine, ...body } };
+    }
+
+    public authorization(_authKey: string | undefined): string | undefined {
+        return this.apiKey || undefined;
+    }
+}
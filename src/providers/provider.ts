@@ -0,0 +1,74 @@
+/* eslint-disable @typescript-eslint/naming-convention */
+/**
+ * A completions API. Providers share the request flow (scheduling,
+ *  batching, streaming) and differ in where requests go and how they look.
+ */
+export interface CompletionProvider {
+    /** the `doxide.provider.name` value that selects the provider */
+    readonly id: string;
+    readonly baseUrl: string;
+    /** whether requests fail without an API key */
+    readonly requiresKey: boolean;
+    /** whether a request may carry an array of prompts */
+    readonly supportsBatch: boolean;
+
+    /**
+     * @param engine - engine (or model) to complete with
+     * @param body - OpenAI completion parameters (`prompt`, `max_tokens`, ...)
+     * @returns the URL and JSON body of the request
+     */
+    buildRequest(engine: string, body: { [key: string]: unknown }): { url: string; body: object };
+
+    /**
+     * @param authKey - the OpenAI API key
+     * @returns the key to authorize requests with, if any
+     */
+    authorization(authKey: string | undefined): string | undefined;
+}
+
+/**
+ * @param data - body of a non-streamed completion response
+ * @returns the text of every choice, by choice index
+ */
+export function parseChoices(data: any): string[] {
+    const choices: string[] = [];
+    (data?.choices || []).forEach((choice: { index?: number; text?: string }, position: number) => {
+        choices[choice.index ?? position] = choice.text || "";
+    });
+    return choices;
+}
+
+/**
+ * @param tokenLogprobs - the log probability of every sampled token
+ * @returns the mean, or `undefined` if there are none
+ */
+export function meanLogprob(tokenLogprobs: (number | null)[] | undefined): number | undefined {
+    const known = (tokenLogprobs || []).filter((logprob): logprob is number => typeof logprob === "number");
+    return known.length ? known.reduce((sum, logprob) => sum + logprob, 0) / known.length : undefined;
+}
+
+/**
+ * @param data - body of a non-streamed completion response, requested with
+ *  `logprobs`
+ * @returns the mean token log probability of every choice, by choice index
+ */
+export function parseLogprobs(data: any): (number | undefined)[] {
+    const logprobs: (number | undefined)[] = [];
+    (data?.choices || []).forEach((choice: { index?: number; logprobs?: { token_logprobs?: (number | null)[] } }, position: number) => {
+        logprobs[choice.index ?? position] = meanLogprob(choice.logprobs?.token_logprobs);
+    });
+    return logprobs;
+}
+
+/**
+ * @param data - body of a non-streamed completion response
+ * @returns why every choice ended (`"length"` if it was cut off at
+ *  `max_tokens`), by choice index
+ */
+export function parseFinishReasons(data: any): (string | undefined)[] {
+    const reasons: (string | undefined)[] = [];
+    (data?.choices || []).forEach((choice: { index?: number; finish_reason?: string | null }, position: number) => {
+        reasons[choice.index ?? position] = choice.finish_reason ?? undefined;
+    });
+    return reasons;
+}
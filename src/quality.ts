@@ -0,0 +1,151 @@
+import { workspace } from "vscode";
+import { stripCommentsAndDocstrings } from "./fingerprint";
+import { parseSignature } from "./localDocstring";
+import { findSectionHeaders, isRepetition } from "./terminator";
+
+const NUM_CHECKS = 4;
+const PARAMETER_SECTION = /^(parameters|params|args|arguments|@param)$/;
+const RETURN_SECTION = /^(returns?|yields?|@returns?)$/;
+
+export interface QualityReport {
+    /** the checks that failed, empty if the docstring passed all of them */
+    failures: string[];
+    /** share of the checks that passed, between 0 and 1 */
+    score: number;
+}
+
+/**
+ * @returns whether the function returns (or yields) a value
+ */
+function returnsValue(text: string, langId: string): boolean {
+    const signature = parseSignature(text, langId);
+    if (signature?.returns !== undefined) {
+        return true;
+    }
+    if (signature?.returnType) {
+        return !/^(None|void|Promise<void>)$/.test(signature.returnType);
+    }
+    const code = stripCommentsAndDocstrings(text, langId);
+    return /^\s*(return|yield)\b[ \t]*(?!None\b)[^\s;]/m.test(code);
+}
+
+/**
+ * @returns the sections of a docstring style example: its section headers,
+ *  or its tags for JSDoc
+ */
+function expectedSections(styleExample: string): string[] {
+    const headers = findSectionHeaders(styleExample);
+    return headers.length ? headers : [...new Set(styleExample.match(/@\w+/g) || [])];
+}
+
+function hasSection(lines: string[], section: string): boolean {
+    if (section.startsWith("@")) {
+        return lines.some(line => line.startsWith(section) || line.startsWith("* " + section));
+    }
+    return lines.some(line => {
+        const normalized = line.replace(/:$/, "").trim().toLowerCase();
+        return normalized === section || normalized.startsWith(section + ":");
+    });
+}
+
+/**
+ * Cheap local checks of a generated docstring, which decide whether more
+ *  completions are worth paying for.
+ * @param docstring - the completion, between the docstring tokens
+ * @param text - the documented function
+ * @param langId
+ * @param styleExample - the docstring shown to the model as an example
+ *  (the template or a docstring from the workspace)
+ */
+export function checkDocstring(docstring: string, text: string, langId: string, styleExample: string): QualityReport {
+    const lines = docstring.split("\n").map(line => line.trim()).filter(line => line.replace(/^\*/, "").trim());
+    if (!lines.length) {
+        return { failures: ["empty"], score: 0 };
+    }
+    const failures: string[] = [];
+
+    const params = (parseSignature(text, langId)?.params || [])
+        .map(param => param.name.replace(/^[*.]+/, ""))
+        .filter(name => /^[\w$]+$/.test(name));
+    const undocumented = params.filter(name => !new RegExp(`(^|[^\\w$])${name.replace(/\$/g, "\\$")}([^\\w$]|$)`).test(docstring));
+    if (undocumented.length) {
+        failures.push(`undocumented parameters: ${undocumented.join(", ")}`);
+    }
+
+    const returns = returnsValue(text, langId);
+    if (returns && !/\b(returns?|yields?)\b/i.test(docstring)) {
+        failures.push("no return section");
+    }
+
+    if (lines.some((line, i) => i > 0 && isRepetition(lines.slice(0, i), line))) {
+        failures.push("repetition");
+    }
+
+    const missing = expectedSections(styleExample).filter(section =>
+        !(PARAMETER_SECTION.test(section) && !params.length) &&
+        !(RETURN_SECTION.test(section) && !returns) &&
+        !hasSection(lines, section)
+    );
+    if (missing.length) {
+        failures.push(`missing sections: ${missing.join(", ")}`);
+    }
+    return { failures, score: (NUM_CHECKS - failures.length) / NUM_CHECKS };
+}
+
+/**
+ * Orders candidate docstrings by their check score, then by their mean token
+ *  log probability where both candidates have one.
+ * @param reports - the checks of every candidate
+ * @param logprobs - the mean token log probability of every candidate
+ * @returns the candidate indices, best first
+ */
+export function rankCandidates(reports: QualityReport[], logprobs: (number | undefined)[] = []): number[] {
+    return reports
+        .map((_, index) => index)
+        .sort((a, b) => {
+            const byScore = reports[b].score - reports[a].score;
+            if (byScore !== 0) {
+                return byScore;
+            }
+            const logprobA = logprobs[a];
+            const logprobB = logprobs[b];
+            return logprobA !== undefined && logprobB !== undefined ? logprobB - logprobA : a - b;
+        });
+}
+
+/**
+ * Counts the completions spent per generated docstring.
+ */
+export class SamplingStats {
+    /** Docstrings generated by the model */
+    public docstrings = 0;
+    /** Completions requested for them */
+    public completions = 0;
+    /** Docstrings that needed more than the first completion */
+    public escalations = 0;
+
+    /**
+     * @param completions - requested for one docstring
+     * @param escalated - whether more completions were requested after the first
+     */
+    public record(completions: number, escalated: boolean) {
+        this.docstrings += 1;
+        this.completions += completions;
+        this.escalations += escalated ? 1 : 0;
+    }
+
+    /** Mean completions per docstring */
+    public get average(): number {
+        return this.docstrings ? this.completions / this.docstrings : 0;
+    }
+}
+
+export const samplingStats = new SamplingStats();
+
+/**
+ * @returns whether to request a single completion first and more only when
+ *  it fails the checks
+ */
+export function getAdaptiveSampling(): boolean {
+    return workspace.getConfiguration("doxide").get("openAI.adaptiveSampling") !== false;
+}
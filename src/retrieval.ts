@@ -0,0 +1,448 @@
+import * as crypto from "crypto";
+import { Memento, TextDocument, Uri, workspace } from "vscode";
+import { stripCommentsAndDocstrings, tokenize } from "./fingerprint";
+import { countTokens } from "./tokenizer";
+import { logger } from "./logger";
+
+/**
+ * A function of the workspace that already has a docstring.
+ */
+export interface DocumentedFunction {
+    /** the function without its docstring, dedented */
+    code: string;
+    /** the text between the docstring tokens */
+    docstring: string;
+}
+
+interface IndexedFunction extends DocumentedFunction {
+    langId: string;
+    /** term frequencies of the code */
+    terms: { [term: string]: number };
+    tokens: number;
+    /** hash of the code without comments, docstrings and indentation */
+    identity: string;
+}
+
+interface IndexedFile {
+    mtime: number;
+    functions: IndexedFunction[];
+}
+
+const STATE_KEY = "doxide.examples";
+export const FILE_PATTERN = "**/*.{py,js,jsx,ts,tsx}";
+export const EXCLUDE_PATTERN = "**/{node_modules,out,dist,build,.git,.venv,venv,__pycache__}/**";
+const MAX_FILES = 2000;
+const MAX_FUNCTIONS = 5000;
+/** Functions longer than this (with their docstring) are never used as examples */
+const MAX_EXAMPLE_TOKENS = 400;
+/** Minimum cosine similarity of an example to the function being documented */
+const MIN_SIMILARITY = 0.1;
+const SAVE_DELAY_MS = 2000;
+
+const LANGUAGES: { [extension: string]: string } = {
+    py: "python",
+    js: "javascript",
+    jsx: "javascript",
+    ts: "typescript",
+    tsx: "typescript",
+};
+
+const STOP_TERMS = new Set([
+    "def", "return", "if", "elif", "else", "for", "while", "in", "not", "and",
+    "or", "is", "none", "true", "false", "self", "function", "var", "let",
+    "const", "new", "this", "null", "undefined",
+]);
+
+function dedent(lines: string[], indent: number): string[] {
+    return lines.map(line => line.slice(Math.min(indent, line.length - line.trimStart().length)));
+}
+
+function trimBlankLines(lines: string[]): string[] {
+    let end = lines.length;
+    while (end > 0 && !lines[end - 1].trim()) {
+        end -= 1;
+    }
+    return lines.slice(0, end);
+}
+
+function extractPythonFunctions(lines: string[]): DocumentedFunction[] {
+    const functions: DocumentedFunction[] = [];
+    for (let i = 0; i < lines.length; i++) {
+        const def = lines[i].match(/^(\s*)(async\s+)?def\s+\w+/);
+        if (!def) {
+            continue;
+        }
+        const indent = def[1].length;
+        // the signature may span several lines
+        let headerEnd = i;
+        let depth = 0;
+        for (; headerEnd < lines.length; headerEnd++) {
+            depth += (lines[headerEnd].match(/[([{]/g) || []).length - (lines[headerEnd].match(/[)\]}]/g) || []).length;
+            if (depth <= 0 && lines[headerEnd].trimEnd().endsWith(":")) {
+                break;
+            }
+        }
+        let docStart = headerEnd + 1;
+        while (docStart < lines.length && !lines[docStart].trim()) {
+            docStart += 1;
+        }
+        const opening = (lines[docStart] || "").match(/^\s*[rRuU]?("""|''')/);
+        if (!opening) {
+            continue;
+        }
+        const quote = opening[1];
+        const firstLine = lines[docStart].slice(opening[0].length);
+        let docEnd = docStart;
+        let docstring: string;
+        if (firstLine.includes(quote)) {
+            docstring = firstLine.slice(0, firstLine.indexOf(quote));
+        } else {
+            docEnd += 1;
+            while (docEnd < lines.length && !lines[docEnd].includes(quote)) {
+                docEnd += 1;
+            }
+            if (docEnd === lines.length) {
+                continue;
+            }
+            const last = lines[docEnd];
+            docstring = [firstLine, ...dedent(lines.slice(docStart + 1, docEnd), indent), last.slice(0, last.indexOf(quote)).slice(indent)].join("\n");
+        }
+        let bodyEnd = docEnd + 1;
+        while (bodyEnd < lines.length && (!lines[bodyEnd].trim() || lines[bodyEnd].length - lines[bodyEnd].trimStart().length > indent)) {
+            bodyEnd += 1;
+        }
+        const body = trimBlankLines(lines.slice(docEnd + 1, bodyEnd));
+        if (body.length) {
+            functions.push({ code: dedent([...lines.slice(i, headerEnd + 1), ...body], indent).join("\n"), docstring });
+        }
+    }
+    return functions;
+}
+
+const JS_FUNCTION_START = /^\s*((export\s+)?(default\s+)?(async\s+)?function\b|(export\s+)?(const|let|var)\s+[\w$]+\s*=\s*(async\s*)?(\(|function\b|[\w$]+\s*=>)|(public\s+|private\s+|protected\s+|static\s+|async\s+)*[\w$]+\s*\([^)]*\)\s*(:\s*[^{]+)?\{)/;
+
+function extractJavaScriptFunctions(lines: string[]): DocumentedFunction[] {
+    const functions: DocumentedFunction[] = [];
+    for (let i = 0; i < lines.length; i++) {
+        if (!lines[i].trim().startsWith("/**")) {
+            continue;
+        }
+        let docEnd = i;
+        while (docEnd < lines.length && !lines[docEnd].includes("*/")) {
+            docEnd += 1;
+        }
+        const start = docEnd + 1;
+        if (start >= lines.length || !JS_FUNCTION_START.test(lines[start])) {
+            continue;
+        }
+        const comment = lines.slice(i, docEnd + 1).join("\n");
+        const docstring = comment
+            .slice(comment.indexOf("/**") + 3, comment.lastIndexOf("*/"))
+            .split("\n")
+            .map(line => line.trimStart())
+            .join("\n");
+        // the function ends where its braces are balanced again
+        let depth = 0;
+        let opened = false;
+        let end = start;
+        for (; end < lines.length; end++) {
+            for (const char of lines[end]) {
+                if (char === "{") {
+                    depth += 1;
+                    opened = true;
+                } else if (char === "}") {
+                    depth -= 1;
+                }
+            }
+            if (opened && depth <= 0) {
+                break;
+            }
+        }
+        if (end === lines.length) {
+            continue;
+        }
+        const indent = lines[start].length - lines[start].trimStart().length;
+        functions.push({ code: dedent(lines.slice(start, end + 1), indent).join("\n"), docstring });
+        i = docEnd;
+    }
+    return functions;
+}
+
+/**
+ * Finds the functions of a file that have a docstring.
+ * @param text - contents of the file
+ * @param langId
+ */
+export function extractDocumentedFunctions(text: string, langId: string): DocumentedFunction[] {
+    const lines = text.split(/\r?\n/);
+    return langId === "python" ? extractPythonFunctions(lines) : extractJavaScriptFunctions(lines);
+}
+
+/**
+ * @returns a hash of the code without comments, docstrings, indentation and
+ *  blank lines, which is the same for an indexed function and the function
+ *  as it is in the editor, with or without its docstring
+ */
+export function identifyFunction(code: string, langId: string): string {
+    const lines = stripCommentsAndDocstrings(code, langId).split("\n").map(line => line.trim()).filter(line => line);
+    return crypto.createHash("sha256").update(lines.join("\n")).digest("hex");
+}
+
+/**
+ * @returns the terms of the code: identifiers, split into their words
+ */
+export function extractTerms(code: string, langId: string): { [term: string]: number } {
+    const terms: { [term: string]: number } = {};
+    for (const token of tokenize(stripCommentsAndDocstrings(code, langId))) {
+        if (!/^[A-Za-z_$]/.test(token)) {
+            continue;
+        }
+        const words = token.replace(/([a-z0-9])([A-Z])/g, "$1_$2").toLowerCase().split(/[_$]+/);
+        for (const word of new Set([token.toLowerCase(), ...words])) {
+            if (word.length > 1 && !STOP_TERMS.has(word)) {
+                terms[word] = (terms[word] || 0) + 1;
+            }
+        }
+    }
+    return terms;
+}
+
+/**
+ * TF-IDF index of the documented functions of the workspace, used to pick
+ *  few-shot examples that are similar to the function being documented.
+ *  Files are re-indexed when they change, and the index is persisted in the
+ *  workspace state.
+ */
+export class ExampleIndex {
+    private files: { [uri: string]: IndexedFile };
+    private documentFrequency = new Map<string, number>();
+    private functionCount = 0;
+    private saveTimer: NodeJS.Timeout | undefined;
+
+    constructor(private readonly state: Memento) {
+        this.files = state.get<{ [uri: string]: IndexedFile }>(STATE_KEY) || {};
+        for (const file of Object.values(this.files)) {
+            // indexed before functions had an identity
+            file.functions.forEach(fn => fn.identity = fn.identity || identifyFunction(fn.code, fn.langId));
+            this.count(file, 1);
+        }
+    }
+
+    /** Number of indexed documented functions */
+    public get size(): number {
+        return this.functionCount;
+    }
+
+    /**
+     * @returns whether the file was indexed at modification time `mtime`
+     */
+    public isCurrent(uri: string, mtime: number): boolean {
+        return this.files[uri]?.mtime === mtime;
+    }
+
+    /**
+     * Replaces the indexed functions of a file.
+     * @param uri
+     * @param mtime - modification time of the indexed contents
+     * @param text - contents of the file
+     * @param langId
+     */
+    public update(uri: string, mtime: number, text: string, langId: string) {
+        this.remove(uri);
+        const functions = extractDocumentedFunctions(text, langId)
+            .map(fn => ({
+                ...fn,
+                langId,
+                terms: extractTerms(fn.code, langId),
+                tokens: countTokens(fn.code + fn.docstring),
+                identity: identifyFunction(fn.code, langId),
+            }))
+            .filter(fn => fn.tokens <= MAX_EXAMPLE_TOKENS)
+            .slice(0, Math.max(MAX_FUNCTIONS - this.functionCount, 0));
+        if (functions.length) {
+            this.files[uri] = { mtime, functions };
+            this.count(this.files[uri], 1);
+        }
+        this.scheduleSave();
+    }
+
+    public remove(uri: string) {
+        const file = this.files[uri];
+        if (file) {
+            this.count(file, -1);
+            delete this.files[uri];
+            this.scheduleSave();
+        }
+    }
+
+    /**
+     * Picks the documented functions most similar to `code`, except for the
+     *  function itself if it is indexed.
+     * @param code - the function being documented
+     * @param langId
+     * @param maxTokens - budget for the examples' code and docstrings
+     * @param maxExamples
+     * @param accept - whether a function may be an example
+     * @returns the examples, most similar first
+     */
+    public find(
+        code: string,
+        langId: string,
+        maxTokens: number,
+        maxExamples = 2,
+        accept: (fn: DocumentedFunction) => boolean = () => true
+    ): DocumentedFunction[] {
+        const query = this.weigh(extractTerms(code, langId));
+        const queryNorm = Math.sqrt([...query.values()].reduce((total, w) => total + w * w, 0));
+        if (!queryNorm) {
+            return [];
+        }
+        const identity = identifyFunction(code, langId);
+        const scored: { fn: IndexedFunction; score: number }[] = [];
+        for (const file of Object.values(this.files)) {
+            for (const fn of file.functions) {
+                if (fn.langId !== langId || fn.identity === identity || !accept(fn)) {
+                    continue;
+                }
+                const weights = this.weigh(fn.terms);
+                let dot = 0;
+                let norm = 0;
+                weights.forEach((w, term) => {
+                    dot += w * (query.get(term) || 0);
+                    norm += w * w;
+                });
+                const score = norm ? dot / (Math.sqrt(norm) * queryNorm) : 0;
+                if (score >= MIN_SIMILARITY) {
+                    scored.push({ fn, score });
+                }
+            }
+        }
+        scored.sort((a, b) => b.score - a.score);
+
+        const examples: DocumentedFunction[] = [];
+        let tokens = 0;
+        for (const { fn } of scored) {
+            if (examples.length >= maxExamples) {
+                break;
+            }
+            if (tokens + fn.tokens <= maxTokens) {
+                examples.push({ code: fn.code, docstring: fn.docstring });
+                tokens += fn.tokens;
+            }
+        }
+        return examples;
+    }
+
+    public clear() {
+        this.files = {};
+        this.documentFrequency.clear();
+        this.functionCount = 0;
+        this.state.update(STATE_KEY, undefined);
+    }
+
+    private weigh(terms: { [term: string]: number }): Map<string, number> {
+        const weights = new Map<string, number>();
+        for (const [term, frequency] of Object.entries(terms)) {
+            const idf = Math.log((1 + this.functionCount) / (1 + (this.documentFrequency.get(term) || 0))) + 1;
+            weights.set(term, (1 + Math.log(frequency)) * idf);
+        }
+        return weights;
+    }
+
+    private count(file: IndexedFile, sign: 1 | -1) {
+        for (const fn of file.functions) {
+            this.functionCount += sign;
+            for (const term of Object.keys(fn.terms)) {
+                this.documentFrequency.set(term, (this.documentFrequency.get(term) || 0) + sign);
+            }
+        }
+    }
+
+    private scheduleSave() {
+        if (this.saveTimer) {
+            return;
+        }
+        this.saveTimer = setTimeout(() => {
+            this.saveTimer = undefined;
+            this.state.update(STATE_KEY, this.files);
+        }, SAVE_DELAY_MS);
+    }
+}
+
+/**
+ * @returns the language of a file that can be indexed, or `undefined`
+ */
+export function languageOf(uri: Uri): string | undefined {
+    return LANGUAGES[uri.path.split(".").pop() || ""];
+}
+
+/**
+ * Indexes the workspace files that changed since they were last indexed.
+ * @param index
+ */
+export async function refreshExampleIndex(index: ExampleIndex) {
+    const uris = await workspace.findFiles(FILE_PATTERN, EXCLUDE_PATTERN, MAX_FILES);
+    let indexed = 0;
+    for (const uri of uris) {
+        const langId = languageOf(uri);
+        try {
+            const { mtime } = await workspace.fs.stat(uri);
+            if (!langId || index.isCurrent(uri.toString(), mtime)) {
+                continue;
+            }
+            const text = Buffer.from(await workspace.fs.readFile(uri)).toString("utf8");
+            index.update(uri.toString(), mtime, text, langId);
+            indexed += 1;
+        } catch (error) {
+            logger.warn("refreshExampleIndex", `could not index ${uri.toString()}: ${error}`);
+        }
+    }
+    logger.info("refreshExampleIndex", `indexed ${indexed} of ${uris.length} files, ${index.size} documented functions`);
+}
+
+/**
+ * Re-indexes a saved document.
+ * @param index
+ * @param document
+ */
+export async function indexDocument(index: ExampleIndex, document: TextDocument) {
+    const langId = languageOf(document.uri);
+    if (!langId || document.uri.scheme !== "file") {
+        return;
+    }
+    try {
+        const { mtime } = await workspace.fs.stat(document.uri);
+        index.update(document.uri.toString(), mtime, document.getText(), langId);
+    } catch (error) {
+        logger.warn("indexDocument", `could not index ${document.uri.toString()}: ${error}`);
+    }
+}
+
+let exampleIndex: ExampleIndex | undefined;
+
+/**
+ * Creates the shared example index - called once on activation.
+ * @param state - the extension's workspace state
+ */
+export function initExampleIndex(state: Memento): ExampleIndex {
+    exampleIndex = new ExampleIndex(state);
+    return exampleIndex;
+}
+
+/**
+ * @returns the shared example index, or `undefined` if examples are not taken
+ *  from the workspace
+ */
+export function getExampleIndex(): ExampleIndex | undefined {
+    if (workspace.getConfiguration("doxide").get("examples.fromWorkspace") === false) {
+        return undefined;
+    }
+    return exampleIndex;
+}
+
+/**
+ * @returns the token budget of the examples taken from the workspace
+ */
+export function getExampleBudget(): number {
+    return Math.max(workspace.getConfiguration("doxide").get<number>("examples.maxTokens") ?? 500, 0);
+}
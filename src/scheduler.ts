@@ -0,0 +1,544 @@
+import { CancellationError, CancellationToken, Disposable, workspace } from "vscode";
+import { telemetry } from "./telemetry";
+
+/**
+ * Request classes, from most to least urgent: a developer waiting for a
+ *  docstring, prefetching for visible functions, and background work like
+ *  documenting a whole file.
+ */
+export type Priority = "interactive" | "prefetch" | "bulk";
+
+export interface QueueWaitStats {
+    count: number;
+    meanMs: number;
+    p95Ms: number;
+    maxMs: number;
+}
+
+export interface SchedulerLimits {
+    requestsPerMinute: number;
+    tokensPerMinute: number;
+    maxConcurrent: number;
+    maxRetries: number;
+}
+
+/**
+ * Thrown for a failure that must not be retried, e.g. a stream that broke
+ *  after part of the docstring was already written.
+ */
+export class NonRetryableError extends Error {
+    constructor(public readonly cause: any) {
+        super(String(cause?.message || cause));
+        this.name = "NonRetryableError";
+    }
+}
+
+/**
+ * Thrown instead of sending a request while the circuit breaker is open.
+ */
+export class CircuitOpenError extends Error {
+    constructor(retryInMs: number) {
+        super(`The completions endpoint keeps failing - pausing requests for ${Math.ceil(retryInMs / 1000)}s.`);
+        this.name = "CircuitOpenError";
+    }
+}
+
+const MINUTE_MS = 60000;
+const BACKOFF_BASE_MS = 1000;
+const BACKOFF_MAX_MS = 30000;
+const FAILURE_THRESHOLD = 5;
+const COOLDOWN_BASE_MS = 30000;
+const COOLDOWN_MAX_MS = 5 * MINUTE_MS;
+/** Share of the budgets each class gets while other classes are waiting */
+const WEIGHTS: { [priority in Priority]: number } = { interactive: 8, prefetch: 3, bulk: 1 };
+/** Fraction of the token budget that is kept for interactive requests */
+const INTERACTIVE_RESERVE = 0.2;
+/** Number of recent queue waits kept per class */
+const WAIT_SAMPLES = 200;
+const RETRYABLE_CODES = ["ECONNRESET", "ECONNREFUSED", "ETIMEDOUT", "EPIPE", "EAI_AGAIN", "ECONNABORTED"];
+
+/**
+ * Continuously refilling budget of `capacity` units per minute.
+ */
+class TokenBucket {
+    private level: number;
+    private updated = Date.now();
+
+    constructor(private capacity: number) {
+        this.level = capacity;
+    }
+
+    public configure(capacity: number) {
+        if (capacity !== this.capacity) {
+            this.capacity = capacity;
+            this.level = Math.min(this.level, capacity);
+        }
+    }
+
+    private refill(now: number) {
+        this.level = Math.min(this.capacity, this.level + (now - this.updated) * this.capacity / MINUTE_MS);
+        this.updated = now;
+    }
+
+    /**
+     * @returns how long to wait until `amount` units are available
+     */
+    public waitTime(amount: number, now: number): number {
+        this.refill(now);
+        const needed = Math.min(amount, this.capacity);
+        return this.level >= needed ? 0 : Math.ceil((needed - this.level) * MINUTE_MS / this.capacity);
+    }
+
+    public take(amount: number, now: number) {
+        this.refill(now);
+        this.level -= Math.min(amount, this.capacity);
+    }
+
+    /** the most the bucket holds */
+    public get size(): number {
+        return this.capacity;
+    }
+
+    /**
+     * Lowers the budget to what the server reports as remaining.
+     */
+    public limitTo(remaining: number, now: number) {
+        this.refill(now);
+        this.level = Math.min(this.level, remaining);
+    }
+}
+
+interface QueuedTask {
+    tokens: number;
+    run: () => Promise<unknown>;
+    resolve: (value: any) => void;
+    reject: (error: any) => void;
+    attempt: number;
+    notBefore: number;
+    priority: Priority;
+    enqueuedAt: number;
+    token?: CancellationToken;
+    cancelled?: Disposable;
+}
+
+type CircuitState = "closed" | "open" | "half-open";
+
+/**
+ * Sends requests within the account's rate limits.
+ *
+ * Requests wait for both a requests-per-minute and a tokens-per-minute
+ *  budget, which are lowered further by the rate limit headers of the
+ *  responses. Throttled (429), failed (5xx) and dropped requests are retried
+ *  with jittered exponential backoff, honouring `Retry-After`. After
+ *  repeated failures the circuit breaker opens and requests fail fast until
+ *  a cool-down has passed and a trial request succeeds.
+ *
+ * Each priority class has its own queue. Queued interactive requests are
+ *  always sent first, and the other classes share the budgets by weight
+ *  (weighted fair queuing). Background classes never use the last
+ *  concurrency slot or the last part of the token budget, so that an
+ *  interactive request never waits behind them.
+ */
+export class RequestScheduler {
+    private readonly queues: { [priority in Priority]: QueuedTask[] } = { interactive: [], prefetch: [], bulk: [] };
+    /** Budget used per class, scaled by its weight */
+    private readonly virtualTime: { [priority in Priority]: number } = { interactive: 0, prefetch: 0, bulk: 0 };
+    private readonly waits: { [priority in Priority]: { count: number; totalMs: number; maxMs: number; recent: number[] } } = {
+        interactive: { count: 0, totalMs: 0, maxMs: 0, recent: [] },
+        prefetch: { count: 0, totalMs: 0, maxMs: 0, recent: [] },
+        bulk: { count: 0, totalMs: 0, maxMs: 0, recent: [] },
+    };
+    private readonly requestBucket: TokenBucket;
+    private readonly tokenBucket: TokenBucket;
+    private running = 0;
+    private runningBackground = 0;
+    private pausedUntil = 0;
+    private timer: NodeJS.Timeout | undefined;
+
+    private consecutiveFailures = 0;
+    private circuitOpenUntil = 0;
+    private circuitCooldown = COOLDOWN_BASE_MS;
+    private trialRunning = false;
+
+    /** Attempts that were retried */
+    public retries = 0;
+    /** Responses that were throttled by the server (429) */
+    public throttled = 0;
+    /** Number of times the circuit breaker opened */
+    public circuitOpened = 0;
+
+    constructor(private readonly getLimits: () => SchedulerLimits) {
+        const limits = getLimits();
+        this.requestBucket = new TokenBucket(limits.requestsPerMinute);
+        this.tokenBucket = new TokenBucket(limits.tokensPerMinute);
+    }
+
+    /**
+     * Queues a request.
+     * @param estimatedTokens - prompt plus completion tokens the request may use
+     * @param run - sends the request, may be called again to retry it
+     * @param token - removes the request from the queue, and stops retrying
+     *  it. `run` is responsible for aborting an attempt that is in flight.
+     * @param priority - the class of the request
+     * @returns the result of the first successful attempt
+     */
+    public schedule<T>(
+        estimatedTokens: number,
+        run: () => Promise<T>,
+        token?: CancellationToken,
+        priority: Priority = "interactive"
+    ): Promise<T> {
+        const now = Date.now();
+        if (token?.isCancellationRequested) {
+            return Promise.reject(new CancellationError());
+        }
+        if (this.circuitState(now) === "open") {
+            return Promise.reject(new CircuitOpenError(this.circuitOpenUntil - now));
+        }
+        return new Promise<T>((resolve, reject) => {
+            const task: QueuedTask = {
+                tokens: estimatedTokens, run, resolve, reject, attempt: 0, notBefore: 0, priority, enqueuedAt: now, token,
+            };
+            task.cancelled = token?.onCancellationRequested(() => {
+                // a queued request is dropped before it costs anything
+                const queue = this.queues[priority];
+                const index = queue.indexOf(task);
+                if (index !== -1) {
+                    queue.splice(index, 1);
+                    this.settle(task);
+                    reject(new CancellationError());
+                    this.pump();
+                }
+            });
+            this.enqueue(task);
+            this.pump();
+        });
+    }
+
+    /**
+     * Applies the rate limit headers of a response to the budgets.
+     * @param headers - response headers (lower case names)
+     */
+    public observe(headers: { [name: string]: unknown } | undefined) {
+        if (!headers) {
+            return;
+        }
+        const now = Date.now();
+        const remainingRequests = Number(headers["x-ratelimit-remaining-requests"]);
+        const remainingTokens = Number(headers["x-ratelimit-remaining-tokens"]);
+        if (!isNaN(remainingRequests) && headers["x-ratelimit-remaining-requests"] !== undefined) {
+            this.requestBucket.limitTo(remainingRequests, now);
+            if (remainingRequests <= 0) {
+                this.pauseFor(parseDuration(headers["x-ratelimit-reset-requests"]), now);
+            }
+        }
+        if (!isNaN(remainingTokens) && headers["x-ratelimit-remaining-tokens"] !== undefined) {
+            this.tokenBucket.limitTo(remainingTokens, now);
+            if (remainingTokens <= 0) {
+                this.pauseFor(parseDuration(headers["x-ratelimit-reset-tokens"]), now);
+            }
+        }
+    }
+
+    /** Number of requests waiting to be sent */
+    public get queued(): number {
+        return this.queues.interactive.length + this.queues.prefetch.length + this.queues.bulk.length;
+    }
+
+    /**
+     * @returns how long requests of each class waited in the queue before
+     *  they were first sent
+     */
+    public queueWaitStats(): { [priority in Priority]: QueueWaitStats } {
+        const stats = (priority: Priority): QueueWaitStats => {
+            const waits = this.waits[priority];
+            const sorted = [...waits.recent].sort((a, b) => a - b);
+            return {
+                count: waits.count,
+                meanMs: waits.count ? waits.totalMs / waits.count : 0,
+                p95Ms: sorted.length ? sorted[Math.min(Math.floor(sorted.length * 0.95), sorted.length - 1)] : 0,
+                maxMs: waits.maxMs,
+            };
+        };
+        return { interactive: stats("interactive"), prefetch: stats("prefetch"), bulk: stats("bulk") };
+    }
+
+    public get circuit(): CircuitState {
+        return this.circuitState(Date.now());
+    }
+
+    private circuitState(now: number): CircuitState {
+        if (this.circuitOpenUntil === 0) {
+            return "closed";
+        }
+        return now < this.circuitOpenUntil ? "open" : "half-open";
+    }
+
+    private pauseFor(ms: number, now: number) {
+        this.pausedUntil = Math.max(this.pausedUntil, now + ms);
+    }
+
+    private enqueue(task: QueuedTask, front = false) {
+        const queue = this.queues[task.priority];
+        if (!queue.length) {
+            // a class that was idle does not get to catch up on unused budget
+            const backlogged = (Object.keys(this.queues) as Priority[]).filter(priority => this.queues[priority].length);
+            const minimum = Math.min(...backlogged.map(priority => this.virtualTime[priority]));
+            if (isFinite(minimum)) {
+                this.virtualTime[task.priority] = Math.max(this.virtualTime[task.priority], minimum);
+            }
+        }
+        if (front) {
+            queue.unshift(task);
+        } else {
+            queue.push(task);
+        }
+    }
+
+    /**
+     * @returns the classes that may send next, in the order they are served
+     */
+    private dispatchOrder(now: number): Priority[] {
+        const interactive = this.queues.interactive;
+        if (interactive.length && interactive[0].notBefore <= now) {
+            // nothing else is sent while an interactive request is waiting
+            return ["interactive"];
+        }
+        const background = (["prefetch", "bulk"] as Priority[])
+            .filter(priority => this.queues[priority].length)
+            .sort((a, b) => this.virtualTime[a] - this.virtualTime[b]);
+        return interactive.length ? ["interactive", ...background] : background;
+    }
+
+    private waitTime(task: QueuedTask, now: number): number {
+        const reserve = task.priority === "interactive" ? 0 : this.tokenBucket.size * INTERACTIVE_RESERVE;
+        return Math.max(
+            this.pausedUntil - now,
+            task.notBefore - now,
+            this.requestBucket.waitTime(1, now),
+            this.tokenBucket.waitTime(task.tokens + reserve, now)
+        );
+    }
+
+    private recordWait(task: QueuedTask, now: number) {
+        const waits = this.waits[task.priority];
+        const waited = now - task.enqueuedAt;
+        waits.count += 1;
+        waits.totalMs += waited;
+        waits.maxMs = Math.max(waits.maxMs, waited);
+        waits.recent.push(waited);
+        if (waits.recent.length > WAIT_SAMPLES) {
+            waits.recent.shift();
+        }
+        telemetry.record("queueWait", waited);
+    }
+
+    /**
+     * Starts as many queued requests as the budgets and concurrency allow,
+     *  and sets a timer for when the next one can start.
+     */
+    private pump() {
+        if (this.timer) {
+            clearTimeout(this.timer);
+            this.timer = undefined;
+        }
+        const limits = this.getLimits();
+        this.requestBucket.configure(limits.requestsPerMinute);
+        this.tokenBucket.configure(limits.tokensPerMinute);
+
+        // background classes leave a slot free for interactive requests
+        const maxBackground = Math.max(limits.maxConcurrent - 1, 1);
+
+        while (this.queued && this.running < limits.maxConcurrent) {
+            const now = Date.now();
+            const state = this.circuitState(now);
+            if (state === "open") {
+                // fail fast instead of queueing behind a broken endpoint
+                const error = new CircuitOpenError(this.circuitOpenUntil - now);
+                for (const queue of Object.values(this.queues)) {
+                    queue.splice(0).forEach(task => {
+                        this.settle(task);
+                        task.reject(error);
+                    });
+                }
+                return;
+            }
+            if (state === "half-open" && (this.trialRunning || this.running > 0)) {
+                return; // wait for the trial request
+            }
+
+            let task: QueuedTask | undefined;
+            let wait = Infinity;
+            for (const priority of this.dispatchOrder(now)) {
+                const head = this.queues[priority][0];
+                if (priority !== "interactive" && this.runningBackground >= maxBackground) {
+                    continue; // sent once a request finishes
+                }
+                const headWait = this.waitTime(head, now);
+                if (headWait <= 0) {
+                    task = head;
+                    break;
+                }
+                wait = Math.min(wait, headWait);
+            }
+            if (!task) {
+                if (isFinite(wait)) {
+                    this.timer = setTimeout(() => this.pump(), wait);
+                }
+                return;
+            }
+
+            this.queues[task.priority].shift();
+            if (task.attempt === 0) {
+                this.recordWait(task, now);
+            }
+            this.virtualTime[task.priority] += Math.max(task.tokens, 1) / WEIGHTS[task.priority];
+            this.requestBucket.take(1, now);
+            this.tokenBucket.take(task.tokens, now);
+            this.execute(task, state === "half-open", limits.maxRetries);
+        }
+    }
+
+    private async execute(task: QueuedTask, trial: boolean, maxRetries: number) {
+        const background = task.priority !== "interactive";
+        this.running += 1;
+        if (background) {
+            this.runningBackground += 1;
+        }
+        this.trialRunning = this.trialRunning || trial;
+        try {
+            const result = await task.run();
+            this.consecutiveFailures = 0;
+            if (trial) {
+                // the endpoint recovered
+                this.circuitOpenUntil = 0;
+                this.circuitCooldown = COOLDOWN_BASE_MS;
+            }
+            this.settle(task);
+            task.resolve(result);
+        } catch (error: any) {
+            const now = Date.now();
+            if (task.token?.isCancellationRequested) {
+                // an aborted attempt is neither a failure nor retried
+                this.settle(task);
+                task.reject(new CancellationError());
+                return;
+            }
+            const status: number | undefined = error?.response?.status;
+            const headers = error?.response?.headers;
+            this.observe(headers);
+
+            const throttled = status === 429;
+            const failed = !throttled && ((status !== undefined && status >= 500) || (status === undefined && isNetworkError(error)));
+            if (throttled) {
+                this.throttled += 1;
+            }
+            if (failed || error instanceof NonRetryableError) {
+                this.recordFailure(now, trial);
+            }
+
+            if ((throttled || failed) && !(error instanceof NonRetryableError) && task.attempt < maxRetries && this.circuitState(now) !== "open") {
+                const retryAfter = parseRetryAfter(headers, now);
+                if (retryAfter !== undefined) {
+                    this.pauseFor(retryAfter, now);
+                }
+                // full jitter: a random delay up to the exponential backoff
+                const backoff = Math.random() * Math.min(BACKOFF_MAX_MS, BACKOFF_BASE_MS * 2 ** task.attempt);
+                task.attempt += 1;
+                task.notBefore = now + Math.max(backoff, retryAfter || 0);
+                this.retries += 1;
+                this.enqueue(task, true);
+            } else {
+                this.settle(task);
+                task.reject(error instanceof NonRetryableError ? error.cause : error);
+            }
+        } finally {
+            this.running -= 1;
+            if (background) {
+                this.runningBackground -= 1;
+            }
+            if (trial) {
+                this.trialRunning = false;
+            }
+            this.pump();
+        }
+    }
+
+    private settle(task: QueuedTask) {
+        task.cancelled?.dispose();
+        task.cancelled = undefined;
+    }
+
+    private recordFailure(now: number, trial: boolean) {
+        this.consecutiveFailures += 1;
+        if (trial) {
+            this.circuitCooldown = Math.min(this.circuitCooldown * 2, COOLDOWN_MAX_MS);
+        }
+        if (trial || this.consecutiveFailures >= FAILURE_THRESHOLD) {
+            this.circuitOpenUntil = now + this.circuitCooldown;
+            this.circuitOpened += 1;
+            this.consecutiveFailures = 0;
+        }
+    }
+}
+
+function isNetworkError(error: any): boolean {
+    return RETRYABLE_CODES.includes(error?.code) || RETRYABLE_CODES.includes(error?.cause?.code);
+}
+
+/**
+ * Parses rate limit reset durations like `1s`, `6m0s` or `120ms`.
+ * @returns the duration in milliseconds
+ */
+export function parseDuration(value: unknown): number {
+    if (typeof value !== "string" && typeof value !== "number") {
+        return 0;
+    }
+    const text = String(value).trim();
+    if (/^\d+(\.\d+)?$/.test(text)) {
+        return Number(text) * 1000;
+    }
+    let ms = 0;
+    const units: { [unit: string]: number } = { h: 3600000, m: 60000, s: 1000, ms: 1 };
+    for (const match of text.matchAll(/(\d+(?:\.\d+)?)(ms|h|m|s)/g)) {
+        ms += Number(match[1]) * units[match[2]];
+    }
+    return ms;
+}
+
+/**
+ * @returns the delay requested by a `Retry-After` header in milliseconds
+ */
+function parseRetryAfter(headers: { [name: string]: unknown } | undefined, now: number): number | undefined {
+    const retryAfterMs = headers?.["retry-after-ms"];
+    if (retryAfterMs !== undefined && !isNaN(Number(retryAfterMs))) {
+        return Number(retryAfterMs);
+    }
+    const retryAfter = headers?.["retry-after"];
+    if (retryAfter === undefined) {
+        return undefined;
+    }
+    if (!isNaN(Number(retryAfter))) {
+        return Number(retryAfter) * 1000;
+    }
+    const date = Date.parse(String(retryAfter));
+    return isNaN(date) ? undefined : Math.max(date - now, 0);
+}
+
+/**
+ * @returns the configured rate limits
+ */
+function readLimits(): SchedulerLimits {
+    const config = workspace.getConfiguration("doxide");
+    return {
+        requestsPerMinute: Math.max(config.get("rateLimit.requestsPerMinute") || 60, 1),
+        tokensPerMinute: Math.max(config.get("rateLimit.tokensPerMinute") || 150000, 1),
+        maxConcurrent: Math.max(config.get("rateLimit.maxConcurrent") || 4, 1),
+        maxRetries: Math.max(config.get<number>("rateLimit.maxRetries") ?? 4, 0),
+    };
+}
+
+/**
+ * The scheduler shared by every generation path.
+ */
+export const requestScheduler = new RequestScheduler(readLimits);
@@ -0,0 +1,74 @@
+/* eslint-disable @typescript-eslint/naming-convention */
+import { StringDecoder } from "string_decoder";
+
+/**
+ * A streamed completion event for one of the `n` choices.
+ * @see https://beta.openai.com/docs/api-reference/completions/create#completions/create-stream
+ */
+export interface CompletionChunk {
+    index: number;
+    text: string;
+    finish_reason: string | null;
+    /** log probabilities of the chunk's tokens, if requested with `logprobs` */
+    logprobs?: (number | null)[];
+}
+
+/**
+ * Reads a server-sent event stream of completions, calling `onChunk` for
+ *  every choice delta as soon as it arrives.
+ * @param stream - the response body
+ * @param onChunk - may return `true` to stop reading, which closes the stream
+ *  and ends the generation on the server
+ * @param onUsage - called with the `usage` of an event, which some servers
+ *  send with the last one
+ * @returns the text of every choice received so far, by index
+ */
+export async function readCompletionStream(
+    stream: AsyncIterable<Buffer | string>,
+    onChunk: (chunk: CompletionChunk) => boolean | void,
+    onUsage?: (usage: { prompt_tokens?: number; completion_tokens?: number; total_tokens?: number }) => void
+): Promise<string[]> {
+    const choices: string[] = [];
+    const decoder = new StringDecoder("utf8");
+    let buffered = "";
+
+    const handleLine = (line: string): boolean => {
+        if (!line.startsWith("data:")) {
+            return false; // comments, event names and blank separators
+        }
+        const data = line.slice(5).trim();
+        if (data === "[DONE]") {
+            return true;
+        }
+        const event = JSON.parse(data);
+        if (event.error) {
+            throw new Error(event.error.message || JSON.stringify(event.error));
+        }
+        if (event.usage) {
+            onUsage?.(event.usage);
+        }
+        for (const choice of event.choices || []) {
+            choices[choice.index] = (choices[choice.index] || "") + choice.text;
+            if (onChunk({ index: choice.index, text: choice.text, finish_reason: choice.finish_reason, logprobs: choice.logprobs?.token_logprobs }) === true) {
+                return true;
+            }
+        }
+        return false;
+    };
+
+    for await (const data of stream) {
+        // multi-byte characters may be split across chunks
+        buffered += typeof data === "string" ? data : decoder.write(data);
+        let newline = buffered.indexOf("\n");
+        while (newline !== -1) {
+            const line = buffered.slice(0, newline).replace(/\r$/, "");
+            buffered = buffered.slice(newline + 1);
+            if (handleLine(line)) {
+                return choices;
+            }
+            newline = buffered.indexOf("\n");
+        }
+    }
+    handleLine(buffered);
+    return choices;
+}
@@ -0,0 +1,170 @@
+/* eslint-disable @typescript-eslint/naming-convention */
+
+/** Number of recent samples percentiles are computed from, per phase */
+const MAX_SAMPLES = 1000;
+
+export const PHASES = ["promptBuild", "queueWait", "connect", "firstByte", "total", "editApply"] as const;
+export type Phase = typeof PHASES[number];
+export type PhaseMap<T> = { [phase in Phase]: T };
+
+export interface PhaseStats {
+    count: number;
+    meanMs: number;
+    p50Ms: number;
+    p95Ms: number;
+    p99Ms: number;
+    maxMs: number;
+}
+
+export interface TokenUsage {
+    /** requests whose usage is known */
+    requests: number;
+    /** streamed requests whose usage was counted with the local tokenizer */
+    estimatedRequests: number;
+    promptTokens: number;
+    completionTokens: number;
+    totalTokens: number;
+}
+
+export interface HitRate {
+    hits: number;
+    misses: number;
+    rate: number;
+}
+
+export interface TelemetrySnapshot {
+    since: string;
+    phases: PhaseMap<PhaseStats>;
+    usage: TokenUsage;
+    hitRates: { [name: string]: HitRate };
+}
+
+/**
+ * Durations of one phase: the count, sum and maximum of all of them and the
+ *  most recent ones for percentiles.
+ */
+export class Histogram {
+    private readonly samples: number[] = [];
+    private next = 0;
+    private count = 0;
+    private totalMs = 0;
+    private maxMs = 0;
+
+    public record(ms: number) {
+        if (this.samples.length < MAX_SAMPLES) {
+            this.samples.push(ms);
+        } else {
+            this.samples[this.next] = ms;
+        }
+        this.next = (this.next + 1) % MAX_SAMPLES;
+        this.count += 1;
+        this.totalMs += ms;
+        this.maxMs = Math.max(this.maxMs, ms);
+    }
+
+    public stats(): PhaseStats {
+        const sorted = [...this.samples].sort((a, b) => a - b);
+        const percentile = (p: number) => sorted.length ? sorted[Math.min(Math.ceil(sorted.length * p / 100), sorted.length) - 1] : 0;
+        return {
+            count: this.count,
+            meanMs: this.count ? this.totalMs / this.count : 0,
+            p50Ms: percentile(50),
+            p95Ms: percentile(95),
+            p99Ms: percentile(99),
+            maxMs: this.maxMs,
+        };
+    }
+}
+
+/**
+ * Records how long each phase of docstring generation takes, the tokens the
+ *  API reports and how often requests are answered without a new call.
+ *  Nothing leaves the machine: the numbers are shown by `Doxide: Show
+ *  Performance Stats` and exported as JSON on request.
+ */
+export class Telemetry {
+    private phases = emptyPhases();
+    private usage = emptyUsage();
+    private hits = new Map<string, { hits: number; misses: number }>();
+    private since = Date.now();
+
+    public record(phase: Phase, ms: number) {
+        this.phases[phase].record(Math.max(ms, 0));
+    }
+
+    /**
+     * @param usage - the `usage` field of a completion response
+     * @param estimated - whether the counts come from the local tokenizer
+     */
+    public recordUsage(usage: { prompt_tokens?: number; completion_tokens?: number; total_tokens?: number }, estimated = false) {
+        const promptTokens = usage.prompt_tokens || 0;
+        const completionTokens = usage.completion_tokens || 0;
+        this.usage.requests += 1;
+        this.usage.estimatedRequests += estimated ? 1 : 0;
+        this.usage.promptTokens += promptTokens;
+        this.usage.completionTokens += completionTokens;
+        this.usage.totalTokens += usage.total_tokens ?? promptTokens + completionTokens;
+    }
+
+    /**
+     * @param name - e.g. `cache`
+     * @param hit - whether the lookup was answered without a new API call
+     */
+    public hit(name: string, hit: boolean) {
+        const counts = this.hits.get(name) || { hits: 0, misses: 0 };
+        counts.hits += hit ? 1 : 0;
+        counts.misses += hit ? 0 : 1;
+        this.hits.set(name, counts);
+    }
+
+    public snapshot(): TelemetrySnapshot {
+        const phases = {} as PhaseMap<PhaseStats>;
+        for (const phase of PHASES) {
+            phases[phase] = this.phases[phase].stats();
+        }
+        const hitRates: { [name: string]: HitRate } = {};
+        for (const [name, { hits, misses }] of this.hits) {
+            hitRates[name] = { hits, misses, rate: hits + misses ? hits / (hits + misses) : 0 };
+        }
+        return { since: new Date(this.since).toISOString(), phases, usage: { ...this.usage }, hitRates };
+    }
+
+    public reset() {
+        this.phases = emptyPhases();
+        this.usage = emptyUsage();
+        this.hits = new Map();
+        this.since = Date.now();
+    }
+}
+
+function emptyPhases(): PhaseMap<Histogram> {
+    const phases = {} as PhaseMap<Histogram>;
+    for (const phase of PHASES) {
+        phases[phase] = new Histogram();
+    }
+    return phases;
+}
+
+function emptyUsage(): TokenUsage {
+    return { requests: 0, estimatedRequests: 0, promptTokens: 0, completionTokens: 0, totalTokens: 0 };
+}
+
+export const telemetry = new Telemetry();
+
+/**
+ * @returns a short summary of a snapshot, for a notification
+ */
+export function formatSnapshot(snapshot: TelemetrySnapshot): string {
+    const phases = PHASES
+        .filter(phase => snapshot.phases[phase].count)
+        .map(phase => {
+            const stats = snapshot.phases[phase];
+            return `${phase} ${stats.p50Ms.toFixed(0)} / ${stats.p95Ms.toFixed(0)} / ${stats.p99Ms.toFixed(0)}ms`;
+        });
+    const usage = snapshot.usage;
+    const rates = Object.entries(snapshot.hitRates).map(([name, rate]) => `${name} ${(rate.rate * 100).toFixed(0)}% (${rate.hits}/${rate.hits + rate.misses})`);
+    return `Latency (p50 / p95 / p99): ${phases.join(", ") || "no requests yet"}. ` +
+        `Tokens: ${usage.promptTokens} prompt, ${usage.completionTokens} completion, ${usage.totalTokens} total in ${usage.requests} requests` +
+        `${usage.estimatedRequests ? ` (${usage.estimatedRequests} streamed, estimated)` : ""}. ` +
+        `Hit rates: ${rates.join(", ") || "none yet"}.`;
+}
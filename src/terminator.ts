@@ -0,0 +1,299 @@
+/**
+ * Detects when a streamed docstring is complete so that the request can be
+ *  aborted instead of paying for tokens that would be thrown away.
+ *
+ * A choice is complete when:
+ *  - the closing docstring token appears,
+ *  - the last section of the template (e.g. `Examples`) has content and is
+ *    followed by a blank line and anything other than another example,
+ *  - a section of the template is repeated,
+ *  - the model starts writing code (e.g. the next function), or
+ *  - the model repeats the same line or block of lines.
+ *
+ * Text is released to the caller as soon as it can no longer be cut off by
+ *  any of these rules, so only the start of a suspicious line is held back.
+ */
+export class DocstringTerminator {
+    private readonly choices: ChoiceState[] = [];
+    private readonly headers: string[];
+    private readonly finalHeader: string | undefined;
+    private readonly codePattern: RegExp;
+    private readonly codeKeywords: string[];
+
+    /**
+     * @param langId
+     * @param endToken - the closing docstring token
+     * @param templateText - the docstring template used in the prompt
+     * @param n - number of choices requested
+     * @param maxTokens - `max_tokens` of the request
+     */
+    constructor(
+        langId: string,
+        private readonly endToken: string,
+        templateText: string,
+        n: number,
+        private readonly maxTokens: number
+    ) {
+        this.headers = findSectionHeaders(templateText);
+        this.finalHeader = this.headers[this.headers.length - 1];
+        this.codePattern = langId === "python"
+            ? /^((async\s+)?def\s+\w+\s*\(|class\s+\w+\s*[(:]|import\s+[\w.]+\s*$|from\s+[\w.]+\s+import\s|if __name__)/
+            : /^(function\s*\w*\s*\(|class\s+\w+\s*[{e]|(const|let|var)\s+\w+\s*=|export\s|import\s.*\sfrom\s)/;
+        this.codeKeywords = langId === "python"
+            ? ["def ", "async ", "class ", "import ", "from ", "if __name__"]
+            : ["function", "class ", "const ", "let ", "var ", "export ", "import "];
+        for (let i = 0; i < n; i++) {
+            this.choices.push(newChoiceState());
+        }
+    }
+
+    /**
+     * Feeds a streamed delta of one choice.
+     * @param index - the choice index
+     * @param delta - the streamed text
+     * @param finishReason - set when the server finished the choice
+     * @returns the part of the choice's text that is now known to be kept
+     */
+    public push(index: number, delta: string, finishReason?: string | null): string {
+        const state = this.choices[index];
+        if (!state || state.complete) {
+            return "";
+        }
+        state.tokens += 1;
+        let released = "";
+        for (const char of delta) {
+            if (state.complete) {
+                break;
+            }
+            if (char === '\n') {
+                released += this.completeLine(state);
+            } else {
+                state.line += char;
+                released += this.checkPartialLine(state);
+            }
+        }
+        if (finishReason && !state.complete) {
+            released += this.release(state, state.line.length);
+            state.complete = true;
+        }
+        state.text += released;
+        return released;
+    }
+
+    /**
+     * Ends a choice whose stream ended without being stopped early.
+     * @returns any text that was still held back
+     */
+    public end(index: number): string {
+        const state = this.choices[index];
+        if (!state || state.complete) {
+            return "";
+        }
+        const released = this.release(state, state.line.length);
+        state.text += released;
+        state.complete = true;
+        return released;
+    }
+
+    /** Whether every choice is complete and the request can be aborted */
+    public get done(): boolean {
+        return this.choices.every(state => state.complete);
+    }
+
+    /**
+     * @returns the kept text of a choice
+     */
+    public text(index: number): string {
+        return this.choices[index]?.text || "";
+    }
+
+    /**
+     * @returns the upper bound of tokens saved by stopping choices early
+     */
+    public get tokensSaved(): number {
+        return this.choices
+            .filter(state => state.stoppedEarly)
+            .reduce((total, state) => total + Math.max(this.maxTokens - state.tokens, 0), 0);
+    }
+
+    private release(state: ChoiceState, end: number): string {
+        const released = state.line.slice(state.released, end);
+        state.released = Math.max(state.released, end);
+        return released;
+    }
+
+    private stop(state: ChoiceState) {
+        state.complete = true;
+        state.stoppedEarly = true;
+    }
+
+    /**
+     * Checks the line being streamed for rules that can be decided before
+     *  the line is complete.
+     * @returns the part of the line that can be released
+     */
+    private checkPartialLine(state: ChoiceState): string {
+        const endTokenIndex = this.endToken ? state.line.indexOf(this.endToken) : -1;
+        if (endTokenIndex !== -1) {
+            const released = this.release(state, endTokenIndex);
+            this.stop(state);
+            return released;
+        }
+        const trimmed = state.line.trim();
+        if (state.maybeComplete && trimmed && !">>>".startsWith(trimmed.slice(0, 3))) {
+            // the final section is followed by something other than an example
+            this.stop(state);
+            return "";
+        }
+        return this.shouldHold(state, trimmed) ? "" : this.release(state, state.line.length);
+    }
+
+    /**
+     * A line is held back while it could still turn out to be cut off.
+     */
+    private shouldHold(state: ChoiceState, trimmed: string): boolean {
+        if (!trimmed || state.maybeComplete) {
+            return true;
+        }
+        for (let k = 1; k < this.endToken.length; k++) {
+            if (state.line.endsWith(this.endToken.slice(0, k))) {
+                return true;
+            }
+        }
+        if (this.codeKeywords.some(keyword => keyword.startsWith(trimmed) || trimmed.startsWith(keyword))) {
+            return true;
+        }
+        return [...state.lines.slice(-8), ...state.seenHeaders].some(line => line.startsWith(trimmed));
+    }
+
+    /**
+     * Applies the rules that need the whole line.
+     * @returns the released rest of the line, including its newline
+     */
+    private completeLine(state: ChoiceState): string {
+        const trimmed = state.line.trim();
+        const header = normalizeHeader(trimmed);
+
+        if (trimmed && (
+            (state.maybeComplete && !trimmed.startsWith(">>>")) ||
+            this.codePattern.test(trimmed) ||
+            state.seenHeaders.includes(trimmed) ||
+            isRepetition(state.lines, trimmed)
+        )) {
+            this.stop(state);
+            return "";
+        }
+
+        const released = this.release(state, state.line.length) + '\n';
+        state.line = "";
+        state.released = 0;
+
+        if (!trimmed) {
+            if (state.finalSectionContent) {
+                state.blankRun += 1;
+                state.maybeComplete = true;
+                if (state.blankRun >= 2) {
+                    this.stop(state);
+                }
+            }
+            return released;
+        }
+
+        state.blankRun = 0;
+        state.maybeComplete = false;
+        state.lines.push(trimmed);
+        if (this.headers.includes(header)) {
+            state.seenHeaders.push(trimmed);
+            state.inFinalSection = header === this.finalHeader;
+        } else if (state.inFinalSection && !/^-+$/.test(trimmed)) {
+            state.finalSectionContent = true;
+        }
+        return released;
+    }
+}
+
+interface ChoiceState {
+    /** kept text */
+    text: string;
+    /** the line being streamed */
+    line: string;
+    /** number of characters of `line` already released */
+    released: number;
+    /** completed, non-blank lines (trimmed) */
+    lines: string[];
+    seenHeaders: string[];
+    tokens: number;
+    inFinalSection: boolean;
+    finalSectionContent: boolean;
+    maybeComplete: boolean;
+    blankRun: number;
+    complete: boolean;
+    stoppedEarly: boolean;
+}
+
+function newChoiceState(): ChoiceState {
+    return {
+        text: "",
+        line: "",
+        released: 0,
+        lines: [],
+        seenHeaders: [],
+        tokens: 0,
+        inFinalSection: false,
+        finalSectionContent: false,
+        maybeComplete: false,
+        blankRun: 0,
+        complete: false,
+        stoppedEarly: false,
+    };
+}
+
+function normalizeHeader(line: string): string {
+    return line.trim().replace(/:$/, "").trim().toLowerCase();
+}
+
+/**
+ * Finds the section headers of a template, in order: lines underlined with
+ *  dashes (numpy) or least-indented lines ending with a colon (Google).
+ *  JSDoc tags may legitimately repeat, so JSDoc templates have no sections.
+ */
+export function findSectionHeaders(templateText: string): string[] {
+    const lines = templateText.split('\n');
+    const indents = lines.filter(line => line.trim()).map(line => line.length - line.trimStart().length);
+    const baseIndent = Math.min(...indents);
+    const headers: string[] = [];
+    for (let i = 0; i < lines.length; i++) {
+        const line = lines[i];
+        const trimmed = line.trim();
+        if (!trimmed || trimmed.startsWith("*") || trimmed.startsWith("@")) {
+            continue;
+        }
+        const underlined = /^-{3,}$/.test((lines[i + 1] || "").trim());
+        const colonHeader = /:$/.test(trimmed) && line.length - line.trimStart().length === baseIndent;
+        if (underlined || colonHeader) {
+            headers.push(normalizeHeader(trimmed));
+        }
+    }
+    return headers;
+}
+
+/**
+ * @returns whether adding `line` makes the last lines repeat the block
+ *  of lines right before them
+ */
+export function isRepetition(lines: string[], line: string): boolean {
+    const all = [...lines, line];
+    for (let k = 1; k <= 4 && 2 * k <= all.length; k++) {
+        let repeated = true;
+        for (let i = 1; i <= k; i++) {
+            if (all[all.length - i] !== all[all.length - k - i]) {
+                repeated = false;
+                break;
+            }
+        }
+        if (repeated) {
+            return true;
+        }
+    }
+    return false;
+}
@@ -0,0 +1,64 @@
+/**
+ * Microbenchmark of docstring formatting: formats a generated docstring for
+ *  every function of the examples, once with the formatter and once with the
+ *  regex based formatting it replaced.
+ *
+ * Run with `npm run benchmark`.
+ */
+import * as fs from "fs";
+import * as path from "path";
+
+import { DocstringFormatter } from "../../formatter";
+
+const examplesDir = path.resolve(__dirname, "../../../examples");
+const ROUNDS = 2000;
+
+const DOCSTRING = "\n    Bubble sort implementation.\n\n    Parameters\n    ----------\n    array : list\n        The array to be sorted.\n\n    Returns\n    -------\n    list\n        The sorted array.\n\n    Examples\n    --------\n    >>> bubble_sort([3, 2, 1])\n    [1, 2, 3]\n    ";
+
+/** The previous implementation, reading the tokens once instead of per call */
+function legacyFormat(text: string, docstring: string, startToken: string, endToken: string): string {
+    const countNumIndents = (source: string) => {
+        const match = source.match(new RegExp("\\n\\s{4,}")) || [];
+        return match.length ? Math.floor(match[0].replace(/\n/g, "").length / 4) : 0;
+    };
+    const numIndents = countNumIndents(text);
+    const numIndentsDiff = numIndents - countNumIndents(docstring);
+    if (numIndentsDiff > 0) {
+        docstring = docstring.replace(new RegExp("\\n(?![\n\r])", "g"), `\n${"    ".repeat(numIndentsDiff)}`);
+    }
+    return "    ".repeat(numIndents) + startToken + docstring + "\n" + "    ".repeat(numIndents) + endToken + "\n";
+}
+
+function functionsOf(source: string): { text: string; declarationIndent: string }[] {
+    const headers = [...source.matchAll(/^([ \t]*)(?:async\s+)?def\s+\w+/gm)];
+    return headers.map((header, index) => ({
+        text: source.slice(header.index! + header[1].length, headers[index + 1]?.index ?? source.length),
+        declarationIndent: header[1],
+    }));
+}
+
+function time(name: string, count: number, run: () => void) {
+    run();
+    const start = process.hrtime.bigint();
+    for (let round = 0; round < ROUNDS; round++) {
+        run();
+    }
+    const perCall = Number(process.hrtime.bigint() - start) / 1000 / ROUNDS / count;
+    console.log(`${name.padEnd(10)} ${perCall.toFixed(2)}µs per docstring`);
+}
+
+const functions = fs.readdirSync(examplesDir)
+    .filter(file => file.endsWith(".py"))
+    .flatMap(file => functionsOf(fs.readFileSync(path.join(examplesDir, file), "utf8")));
+console.log(`${functions.length} functions, ${ROUNDS} rounds`);
+
+time("formatter", functions.length, () => {
+    for (const { text, declarationIndent } of functions) {
+        new DocstringFormatter(text, "python", { startToken: "'''", endToken: "'''", declarationIndent, indentUnit: "    " }).format(DOCSTRING);
+    }
+});
+time("legacy", functions.length, () => {
+    for (const { text } of functions) {
+        legacyFormat(text, DOCSTRING, "'''", "'''");
+    }
+});
@@ -0,0 +1,35 @@
+import * as assert from 'assert';
+import { Position, Range, Uri, window, workspace } from 'vscode';
+
+import { AlternativeStore } from '../../alternatives';
+
+suite('Alternatives Test Suite', () => {
+	test('Cycles alternatives in place and ends on edits', async () => {
+		const document = await workspace.openTextDocument({ language: 'python', content: 'def f():\n    """\n    One.\n    """\n    return 1\n' });
+		const editor = await window.showTextDocument(document);
+		const store = new AlternativeStore();
+		const watching = store.watch();
+		try {
+			const shown = '    """\n    One.\n    """\n';
+			const session = store.start(document.uri, new Range(1, 0, 4, 0), [shown, '    """\n    Two,\n    lines.\n    """\n'])!;
+			assert.strictEqual(store.find(document.uri, 0), session);
+
+			assert.ok(await store.cycle(session, 1));
+			assert.strictEqual(document.getText(), 'def f():\n    """\n    Two,\n    lines.\n    """\n    return 1\n');
+			assert.strictEqual(store.size, 1);
+
+			assert.ok(await store.cycle(session, 1));
+			assert.strictEqual(document.getText(), 'def f():\n' + shown + '    return 1\n');
+
+			await editor.edit(editBuilder => editBuilder.insert(new Position(5, 0), '\n'));
+			assert.strictEqual(store.size, 0);
+		} finally {
+			watching.dispose();
+		}
+	});
+
+	test('Needs more than one alternative', () => {
+		const store = new AlternativeStore();
+		assert.strictEqual(store.start(Uri.parse('untitled:doxide'), new Range(0, 0, 1, 0), ['only']), undefined);
+	});
+});
@@ -0,0 +1,75 @@
+import * as assert from 'assert';
+import { Position, Range, TextDocument, TextDocumentChangeEvent, Uri, window, workspace, WorkspaceEdit } from 'vscode';
+
+import { adjustRange, applyOwnEdit, DocumentAnchor, isOwnChange } from '../../anchor';
+
+suite('Anchor Test Suite', () => {
+	test('Moves ranges through edits around them', () => {
+		const range = { start: 10, length: 5 };
+		// above, and right before the range
+		assert.deepStrictEqual(adjustRange(range, { rangeOffset: 0, rangeLength: 2, text: 'abcd' }, false), { start: 12, length: 5, touched: false });
+		assert.deepStrictEqual(adjustRange(range, { rangeOffset: 10, rangeLength: 0, text: 'ab' }, false), { start: 12, length: 5, touched: false });
+		// below, and right after the range
+		assert.deepStrictEqual(adjustRange(range, { rangeOffset: 15, rangeLength: 0, text: 'ab' }, false), { start: 10, length: 5, touched: false });
+		// within the range
+		assert.deepStrictEqual(adjustRange(range, { rangeOffset: 12, rangeLength: 1, text: '' }, false), { start: 10, length: 4, touched: true });
+		assert.deepStrictEqual(adjustRange(range, { rangeOffset: 8, rangeLength: 4, text: '' }, false), { start: 10, length: 1, touched: true });
+	});
+
+	test('Grows ranges through their own edits', () => {
+		// the first insertion into an empty range, then appending to it
+		const empty = { start: 10, length: 0 };
+		assert.deepStrictEqual(adjustRange(empty, { rangeOffset: 10, rangeLength: 0, text: 'abc' }, true), { start: 10, length: 3, touched: false });
+		assert.deepStrictEqual(adjustRange({ start: 10, length: 3 }, { rangeOffset: 13, rangeLength: 0, text: 'de' }, true), { start: 10, length: 5, touched: false });
+		// an insertion before a range moves it, whoever makes it
+		assert.deepStrictEqual(adjustRange({ start: 10, length: 3 }, { rangeOffset: 10, rangeLength: 0, text: 'de' }, true), { start: 12, length: 3, touched: false });
+		assert.deepStrictEqual(adjustRange({ start: 10, length: 3 }, { rangeOffset: 10, rangeLength: 3, text: '' }, true), { start: 10, length: 0, touched: false });
+	});
+
+	test('Tells its own changes from those made meanwhile', async () => {
+		const uri = Uri.parse('doxide-test:/a.py');
+		const change = (document: { uri: Uri; version: number }, text: string) =>
+			({ document: document as TextDocument, contentChanges: [{ range: new Range(1, 0, 1, 0), rangeOffset: 9, rangeLength: 0, text }], reason: undefined }) as TextDocumentChangeEvent;
+		const edit = new WorkspaceEdit();
+		edit.insert(uri, new Position(1, 0), '    """F."""\n');
+		const applying = applyOwnEdit(edit);
+		try {
+			// the user types in the document, and the same text in another one
+			assert.ok(!isOwnChange(change({ uri, version: 2 }, 'x')));
+			assert.ok(!isOwnChange(change({ uri: Uri.parse('doxide-test:/b.py'), version: 2 }, '    """F."""\n')));
+			// every listener of the change sees the same, but the edit only makes one change
+			const own = change({ uri, version: 3 }, '    """F."""\r\n');
+			assert.ok(isOwnChange(own));
+			assert.ok(isOwnChange(own));
+			assert.ok(!isOwnChange(change({ uri, version: 4 }, '    """F."""\n')));
+		} finally {
+			await applying;
+		}
+	});
+
+	test('Follows a function through edits and editor switches', async () => {
+		const document = await workspace.openTextDocument({ language: 'python', content: 'def f():\n    return 1\n' });
+		const editor = await window.showTextDocument(document);
+		const anchor = new DocumentAnchor(document, new Range(0, 0, 1, 12));
+		let touched = 0;
+		const listener = anchor.onDidTouch(() => touched++);
+		try {
+			await editor.edit(editBuilder => editBuilder.insert(new Position(0, 0), 'import os\n\n'));
+			assert.deepStrictEqual(anchor.range, new Range(2, 0, 3, 12));
+
+			// inserted into the document even if another one is shown
+			await window.showTextDocument(await workspace.openTextDocument({ content: 'other' }));
+			assert.ok(await anchor.edit((edit, range) => edit.insert(anchor.uri, range.start.translate(1), '    """F."""\n')));
+			assert.strictEqual(document.getText(), 'import os\n\ndef f():\n    """F."""\n    return 1\n');
+			assert.deepStrictEqual(anchor.range, new Range(2, 0, 4, 12));
+			assert.strictEqual(touched, 0);
+
+			await editor.edit(editBuilder => editBuilder.insert(new Position(4, 11), '0'));
+			assert.strictEqual(touched, 1);
+			assert.ok(anchor.touched);
+		} finally {
+			listener.dispose();
+			anchor.dispose();
+		}
+	});
+});
@@ -0,0 +1,37 @@
+import * as assert from 'assert';
+import { CancellationError, CancellationTokenSource } from 'vscode';
+
+import { CompletionBatcher, splitBatches } from '../../batch';
+import { CompletionRequest } from '../../completions';
+
+function completionRequest(prompt: string): CompletionRequest {
+	return { engine: 'code-davinci-002', prompt, maxTokens: 100, sampling: { n: 1 }, authKey: 'key' };
+}
+
+suite('Request Batching Test Suite', () => {
+	test('Splits batches by token budget and size', () => {
+		assert.deepStrictEqual(splitBatches([5, 5, 5, 20, 1], x => x, 10, 10), [[5, 5], [5], [20], [1]]);
+		assert.deepStrictEqual(splitBatches([1, 1, 1], x => x, 10, 2), [[1, 1], [1]]);
+		assert.deepStrictEqual(splitBatches([], x => x, 10, 2), []);
+	});
+
+	test('Sends requests of one window together and maps choices back', async () => {
+		const sent: string[][] = [];
+		const batcher = new CompletionBatcher(async requests => {
+			sent.push(requests.map(request => request.prompt));
+			return requests.map(request => ({ choices: [`doc of ${request.prompt}`], tokensSaved: 0 }));
+		}, () => ({ windowMs: 10, maxPrompts: 20, maxTokens: 1000 }));
+
+		const cancellation = new CancellationTokenSource();
+		const a = batcher.add(completionRequest('a'), 10);
+		const b = batcher.add(completionRequest('b'), 10, cancellation.token);
+		const c = batcher.add(completionRequest('c'), 10);
+		cancellation.cancel();
+
+		assert.deepStrictEqual((await a).choices, ['doc of a']);
+		assert.deepStrictEqual((await c).choices, ['doc of c']);
+		await assert.rejects(b, CancellationError);
+		assert.deepStrictEqual(sent, [['a', 'c']]);
+		assert.strictEqual(batcher.batches, 1);
+	});
+});
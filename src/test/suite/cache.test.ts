@@ -0,0 +1,50 @@
+import * as assert from 'assert';
+import * as fs from 'fs';
+import * as os from 'os';
+import * as path from 'path';
+
+import { computeCacheKey, DocstringCache } from '../../cache';
+
+suite('Docstring Cache Test Suite', () => {
+	const parts = {
+		text: 'def f(x):\n    return x\n',
+		langId: 'python',
+		templateNum: 0,
+		engine: 'code-davinci-002',
+		sampling: { temperature: 0.3, n: 1 },
+	};
+
+	test('Key ignores whitespace-only differences', () => {
+		const key = computeCacheKey(parts);
+		assert.strictEqual(key, computeCacheKey({ ...parts, text: '\r\ndef f(x):  \r\n    return x' }));
+		assert.strictEqual(key, computeCacheKey({ ...parts, sampling: { n: 1, temperature: 0.3 } }));
+		assert.notStrictEqual(key, computeCacheKey({ ...parts, templateNum: 1 }));
+		assert.notStrictEqual(key, computeCacheKey({ ...parts, sampling: { temperature: 0.9, n: 1 } }));
+	});
+
+	test('Evicts least recently used entries', async () => {
+		const dir = fs.mkdtempSync(path.join(os.tmpdir(), 'doxide-cache-'));
+		const entry = (key: string) => ({
+			key,
+			langId: 'python',
+			engine: 'code-davinci-002',
+			templateNum: 0,
+			choices: ['x'.repeat(100)],
+			createdAt: Date.now(),
+		});
+		const cache = new DocstringCache(dir, 500);
+		await cache.set(entry('a'));
+		await cache.set(entry('b'));
+		const past = new Date(Date.now() - 60000);
+		fs.utimesSync(path.join(dir, 'a.json'), past, past);
+		fs.utimesSync(path.join(dir, 'b.json'), past, past);
+		assert.ok(await cache.get('a'));
+		await cache.set(entry('c'));
+
+		assert.ok(await cache.get('a'));
+		assert.strictEqual(await cache.get('b'), undefined);
+		assert.ok(await cache.get('c'));
+		assert.strictEqual((await cache.stats()).entries, 2);
+		fs.rmSync(dir, { recursive: true, force: true });
+	});
+});
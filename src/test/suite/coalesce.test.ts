@@ -0,0 +1,26 @@
+import * as assert from 'assert';
+
+import { InFlightRegistry } from '../../coalesce';
+
+suite('Request Coalescing Test Suite', () => {
+	test('Concurrent identical requests share one call', async () => {
+		const registry = new InFlightRegistry<number>();
+		let calls = 0;
+		const request = () => new Promise<number>(resolve => setTimeout(() => resolve(++calls), 10));
+
+		const first = registry.run('a', request);
+		const second = registry.run('a', request);
+		const other = registry.run('b', request);
+
+		assert.strictEqual(first.shared, false);
+		assert.strictEqual(second.shared, true);
+		assert.strictEqual(await first.promise, await second.promise);
+		await other.promise;
+		assert.strictEqual(calls, 2);
+		assert.strictEqual(registry.absorbed, 1);
+
+		// finished requests are not shared
+		assert.strictEqual(registry.run('a', request).shared, false);
+		assert.strictEqual(registry.size, 1);
+	});
+});
@@ -0,0 +1,56 @@
+import * as assert from 'assert';
+
+import { compactFunction, stripComments, stripDocstrings } from '../../compaction';
+
+const nested = [
+	'def outer(hand):',
+	'    \'\'\'',
+	'    Outer docstring.',
+	'    \'\'\'',
+	'    def inner(cards,',
+	'              total):',
+	'        """Inner docstring."""',
+	'        # count the cards',
+	'        return len(cards)  # trailing',
+	'',
+	'',
+	'    label = "# not a comment"',
+	'    return inner(hand, 0)',
+].join('\n');
+
+suite('Compaction Test Suite', () => {
+	test('Removes comments but not strings', () => {
+		assert.strictEqual(
+			stripComments('x = 1  # one\n# alone\ny = "# two"', 'python'),
+			'x = 1  \ny = "# two"'
+		);
+		assert.strictEqual(
+			stripComments('function f() {\n    /**\n     * Doc.\n     */\n    const url = "http://x"; // home\n    return url;\n}', 'javascript'),
+			'function f() {\n    const url = "http://x"; \n    return url;\n}'
+		);
+	});
+
+	test('Removes the docstrings of nested functions', () => {
+		assert.strictEqual(
+			stripDocstrings(stripComments(nested, 'python')),
+			'def outer(hand):\n    def inner(cards,\n              total):\n        return len(cards)  \n\n\n    label = "# not a comment"\n    return inner(hand, 0)'
+		);
+	});
+
+	test('Compacts functions and reduces long ones to their skeleton', () => {
+		const compacted = compactFunction(nested, 'python', 0);
+		assert.strictEqual(
+			compacted.text,
+			'def outer(hand):\n    def inner(cards,\n              total):\n        return len(cards)\n\n    label = "# not a comment"\n    return inner(hand, 0)'
+		);
+		assert.strictEqual(compacted.skeleton, false);
+		assert.ok(compacted.tokensAfter < compacted.tokensBefore);
+
+		const skeleton = compactFunction(nested, 'python', 10);
+		assert.strictEqual(skeleton.skeleton, true);
+		assert.strictEqual(
+			skeleton.text,
+			'def outer(hand):\n    def inner(cards,\n              total):\n        return len(cards)\n\n    ...\n    return inner(hand, 0)'
+		);
+	});
+});
@@ -0,0 +1,84 @@
+import * as assert from 'assert';
+import * as fs from 'fs';
+import * as path from 'path';
+
+import { template } from '../../constants/Template';
+import { convertDocstring, findDocstrings, lostWords, restyleText, styleOfDocstring } from '../../docstringStyle';
+
+const examplesDir = path.resolve(__dirname, '../../../examples');
+
+const numpy = '\n    Scales the values.\n\n    Parameters\n    ----------\n    values : list\n        The values.\n    factor : int, optional\n        The factor, by default 2.\n\n    Returns\n    -------\n    list\n        The scaled values.\n\n    Raises\n    ------\n    ValueError\n        If a value is not a number.\n\n    Examples\n    --------\n    >>> scale([1, 2])\n    [2, 4]\n    ';
+const google = '\n    Scales the values.\n\n    Parameters:\n        values(list): The values.\n        factor(int, optional): The factor, by default 2.\n\n    Returns:\n        list: The scaled values.\n\n    Raises:\n        ValueError: If a value is not a number.\n\n    Examples:\n        >>> scale([1, 2])\n        [2, 4]\n    ';
+
+suite('Docstring Style Test Suite', () => {
+	test('Converts between numpy and Google style', () => {
+		assert.strictEqual(convertDocstring(numpy, 'google', '    '), google);
+		assert.strictEqual(convertDocstring(google, 'numpy', '    '), numpy);
+		assert.strictEqual(convertDocstring(numpy, 'numpy', '    '), undefined);
+		assert.strictEqual(convertDocstring('\n    Only a summary.\n    ', 'google', '    '), undefined);
+	});
+
+	test('Detects the style of docstrings and templates', () => {
+		assert.strictEqual(styleOfDocstring(numpy), 'numpy');
+		assert.strictEqual(styleOfDocstring(google), 'google');
+		assert.strictEqual(styleOfDocstring('\n * Scales the values.\n *\n * @param {number[]} values\n '), 'jsdoc');
+		assert.strictEqual(styleOfDocstring('Only a summary.'), undefined);
+		// template numbers follow the styles
+		for (const { lang, exampleTemplates } of template) {
+			assert.deepStrictEqual(exampleTemplates.map(styleOfDocstring), lang === 'python' ? ['numpy', 'google'] : ['numpy', 'google', 'jsdoc']);
+		}
+	});
+
+	test('Converts JSDoc comments and keeps their stars', () => {
+		const jsdoc = '\n     * Scales the values.\n     *\n     * @param {Array} values - The values\n     *   to scale.\n     * @param {number} [factor=2] - The factor\n     * @returns {Array} - The scaled values\n     * @example\n     * scale([1, 2])\n     ';
+		const converted = convertDocstring(jsdoc, 'numpy', '    ')!;
+		assert.strictEqual(converted, '\n     * Scales the values.\n     *\n     * Parameters\n     * ----------\n     * values : Array\n     *     The values\n     *     to scale.\n     * factor : number, optional\n     *     The factor\n     *     Defaults to 2.\n     *\n     * Returns\n     * -------\n     * Array\n     *     The scaled values\n     *\n     * Examples\n     * --------\n     * scale([1, 2])\n     ');
+		assert.strictEqual(
+			convertDocstring('\nSums.\n\nParameters\n----------\na : number\n    The first.\n\nReturns\n-------\nnumber\n    The sum.\n', 'jsdoc'),
+			'\n* @param {number} a - The first.\n* @returns {number} - The sum.\n* @description - Sums.\n'
+		);
+	});
+
+	test('Finds and restyles the docstrings of a file', () => {
+		const indented = (docstring: string) => docstring.replace(/\n(?!\n)/g, '\n    ');
+		const file = `def short(): return 1\n\n\nclass Scaler:\n    def scale(self, values,\n              factor=2):  # scales\n        """${indented(numpy)}"""\n        return [v * factor for v in values]\n`;
+		assert.strictEqual(findDocstrings(file, 'python').length, 1);
+		const [edit] = restyleText(file, 'python', 'google');
+		assert.strictEqual(file.slice(0, edit.start) + edit.text + file.slice(edit.end), file.replace(indented(numpy), indented(google)));
+		assert.deepStrictEqual(restyleText(file, 'python', 'jsdoc'), []);
+		assert.strictEqual(restyleText(file.replace(/\n/g, '\r\n'), 'python', 'google')[0].text, indented(google).replace(/\n/g, '\r\n'));
+	});
+
+	test('Keeps every word of the examples through a round trip', () => {
+		const apply = (text: string, edits: { start: number; end: number; text: string }[]) => {
+			let out = '';
+			let last = 0;
+			for (const edit of edits) {
+				out += text.slice(last, edit.start) + edit.text;
+				last = edit.end;
+			}
+			return out + text.slice(last);
+		};
+		const text = fs.readFileSync(path.join(examplesDir, 'cardgamebot.py'), 'utf8');
+		const toNumpy = restyleText(text, 'python', 'numpy');
+		assert.strictEqual(toNumpy.length, 9);
+		for (const edit of toNumpy) {
+			assert.deepStrictEqual(lostWords(text.slice(edit.start, edit.end), edit.text), [], edit.text);
+		}
+		const numpyFile = apply(text, toNumpy);
+		const googleFile = apply(numpyFile, restyleText(numpyFile, 'python', 'google'));
+		assert.strictEqual(apply(googleFile, restyleText(googleFile, 'python', 'numpy')), numpyFile);
+
+		// unknown sections stay apart from the parameters
+		assert.ok(numpyFile.includes('    group : list\n        list of cards\n    max_wild : int\n        maximum number of wild cards allowed in the run\n'));
+		assert.ok(numpyFile.includes('    Local variables\n    ---------------\n    ref(str): reference value for next card\n'));
+		// continuation lines stay in their field
+		assert.ok(numpyFile.includes('        checks if aces are the same colour too\n        -- for phase 6: accumulation of cards of same colour\n'));
+	});
+
+	test('Does not convert docstrings that would lose words', () => {
+		assert.deepStrictEqual(lostWords('\n    Sums.\n\n    Args:\n        a(int): The first.\n    ', '\n    Sums.\n\n    Parameters\n    ----------\n    a : int\n    '), ['the', 'first']);
+		assert.deepStrictEqual(lostWords(numpy, google), []);
+		assert.deepStrictEqual(lostWords(google, numpy), []);
+	});
+});
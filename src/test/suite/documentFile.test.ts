@@ -0,0 +1,27 @@
+import * as assert from 'assert';
+
+import { forEachLimited } from '../../documentFile';
+
+suite('Document File Test Suite', () => {
+	test('Runs at most the given number of tasks at a time, in order', async () => {
+		const started: number[] = [];
+		let running = 0;
+		let mostRunning = 0;
+		await forEachLimited([1, 2, 3, 4, 5, 6, 7], 3, async (item) => {
+			started.push(item);
+			running += 1;
+			mostRunning = Math.max(mostRunning, running);
+			await new Promise(resolve => setTimeout(resolve, 10 - item));
+			running -= 1;
+		});
+		assert.deepStrictEqual(started, [1, 2, 3, 4, 5, 6, 7]);
+		assert.strictEqual(mostRunning, 3);
+	});
+
+	test('Runs every task even with more workers than items', async () => {
+		const done: string[] = [];
+		await forEachLimited(['a', 'b'], 8, async (item) => { done.push(item); });
+		await forEachLimited([], 0, async () => { done.push('none'); });
+		assert.deepStrictEqual(done, ['a', 'b']);
+	});
+});
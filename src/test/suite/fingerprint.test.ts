@@ -0,0 +1,67 @@
+import * as assert from 'assert';
+import * as fs from 'fs';
+import * as path from 'path';
+
+import { Memento } from 'vscode';
+
+import { fingerprintFunction, similarity, TwinIndex } from '../../fingerprint';
+
+const examplesDir = path.resolve(__dirname, '../../../examples');
+
+function memento(): Memento {
+	const values = new Map<string, any>();
+	return {
+		keys: () => [...values.keys()],
+		get: (key: string, defaultValue?: any) => (values.has(key) ? values.get(key) : defaultValue),
+		update: async (key: string, value: any) => {
+			values.set(key, value);
+		},
+	} as Memento;
+}
+
+function readLines(file: string, start: number, end: number): string {
+	return fs
+		.readFileSync(path.join(examplesDir, file), 'utf8')
+		.split('\n')
+		.slice(start - 1, end)
+		.join('\n');
+}
+
+suite('Fingerprint Test Suite', () => {
+	test('Twins with different docstrings and comments match exactly', () => {
+		const a = fingerprintFunction(readLines('cardgamebot.py', 27, 55), 'python');
+		const b = fingerprintFunction(readLines('largeExample.py', 19, 54), 'python');
+		assert.strictEqual(a.exact, b.exact);
+	});
+
+	test('Renamed locals do not change the fingerprint', () => {
+		const text = readLines('cardgamebot.py', 27, 55);
+		const a = fingerprintFunction(text, 'python');
+		const b = fingerprintFunction(text.replace(/\bgroup\b/g, 'cards'), 'python');
+		assert.strictEqual(a.exact, b.exact);
+		assert.strictEqual(b.locals[1], 'cards');
+	});
+
+	test('Different functions are not similar', () => {
+		const a = fingerprintFunction(readLines('cardgamebot.py', 27, 55), 'python');
+		const b = fingerprintFunction(readLines('cardgamebot.py', 56, 88), 'python');
+		assert.ok(similarity(a.minhash, b.minhash) < 0.5);
+	});
+
+	test('Keyword arguments are not renamed', () => {
+		const a = fingerprintFunction('def f(items):\n    return sorted(items, key=len)\n', 'python');
+		const b = fingerprintFunction('def f(items):\n    return sorted(items, reverse=len)\n', 'python');
+		assert.deepStrictEqual(a.locals, ['f', 'items']);
+		assert.notStrictEqual(a.exact, b.exact);
+	});
+
+	test('Only exact twins are reused at a threshold of 1', () => {
+		const index = new TwinIndex(memento());
+		const text = readLines('cardgamebot.py', 27, 55);
+		// a near twin whose first comparison is inverted
+		const near = text.replace('==', '!=');
+		index.add(fingerprintFunction(text, 'python'), 'python', 0, 'Docstring');
+		assert.strictEqual(index.find(fingerprintFunction(near, 'python'), 'python', 0, 1), undefined);
+		assert.strictEqual(index.find(fingerprintFunction(text, 'python'), 'python', 0, 1), 'Docstring');
+	});
+});
@@ -0,0 +1,126 @@
+import * as assert from 'assert';
+import * as fs from 'fs';
+import * as path from 'path';
+
+import { DocstringFormatter, docstringLine, isDocumented, pythonBodyIndent } from '../../formatter';
+import { findDocstrings } from '../../docstringStyle';
+
+const examplesDir = path.resolve(__dirname, '../../../examples');
+
+interface Golden {
+	name: string;
+	text: string;
+	langId: string;
+	declarationIndent: string;
+	generated: string;
+	expected: string;
+}
+
+/**
+ * Every documented function of the examples, with its docstring as the model
+ *  would generate it (indented like the prompt's examples) and as it is in
+ *  the file.
+ */
+function goldens(): Golden[] {
+	const cases: Golden[] = [];
+	for (const file of fs.readdirSync(examplesDir)) {
+		const langId = file.endsWith('.py') ? 'python' : 'javascript';
+		const source = fs.readFileSync(path.join(examplesDir, file), 'utf8');
+		for (const { start, end, indent } of findDocstrings(source, langId)) {
+			const openingLine = source.lastIndexOf('\n', start - 1) + 1;
+			const closingEnd = source.indexOf('\n', end) + 1;
+			// blank lines lose their whitespace
+			const expected = source.slice(openingLine, closingEnd).replace(/^[ \t]+$/gm, '');
+			const body = source.slice(start, end);
+			if (!/\n[ \t]*$/.test(body)) {
+				// the closing token is always written on its own line
+				continue;
+			}
+			if (langId === 'python') {
+				const headers = [...source.slice(0, openingLine).matchAll(/^([ \t]*)(?:async\s+)?(?:def|class)\s+\w+/gm)];
+				const header = headers[headers.length - 1];
+				const declaration = header.index! + header[1].length;
+				cases.push({
+					name: `${file}:${header[0].trim()}`,
+					text: source.slice(declaration, openingLine) + source.slice(closingEnd),
+					langId,
+					declarationIndent: header[1],
+					generated: body.split(`\n${indent}`).join('\n    '),
+					expected,
+				});
+			} else {
+				cases.push({
+					name: `${file}:${source.slice(closingEnd, source.indexOf('\n', closingEnd))}`,
+					text: source.slice(closingEnd),
+					langId,
+					declarationIndent: indent,
+					generated: body,
+					expected,
+				});
+			}
+		}
+	}
+	return cases;
+}
+
+function formatterFor(golden: Golden, indentUnit = '    '): DocstringFormatter {
+	const tokens = golden.langId === 'python' ? { startToken: "'''", endToken: "'''" } : { startToken: '/**', endToken: '*/' };
+	return new DocstringFormatter(golden.text, golden.langId, { ...tokens, declarationIndent: golden.declarationIndent, indentUnit });
+}
+
+suite('Formatter Test Suite', () => {
+	test('Formats every docstring of the examples as it is in the file', () => {
+		const cases = goldens();
+		assert.ok(cases.length > 20);
+		assert.ok(cases.some(golden => golden.name.includes('find_partial_sets')));
+		for (const golden of cases) {
+			assert.strictEqual(formatterFor(golden).format(golden.generated), golden.expected, golden.name);
+		}
+	});
+
+	test('Formats streamed docstrings like whole ones', () => {
+		for (const golden of goldens()) {
+			const formatter = formatterFor(golden);
+			const normalizer = formatter.stream();
+			let streamed = formatter.opening;
+			for (let i = 0; i < golden.generated.length; i += 3) {
+				streamed += normalizer.push(golden.generated.slice(i, i + 3));
+			}
+			streamed += normalizer.end() + formatter.closing;
+			assert.strictEqual(streamed, golden.expected, golden.name);
+		}
+	});
+
+	test('Finds the indentation of the body', () => {
+		assert.strictEqual(pythonBodyIndent('def f(a,\n          b):  # comment\n\n  \treturn a'), '  \t');
+		assert.strictEqual(pythonBodyIndent('def f(a: Dict[str, int] = {"x": 1}, sep=":") -> int:\n      return 1'), '      ');
+		assert.strictEqual(pythonBodyIndent('def f(): return 1'), undefined);
+		const oneLiner = new DocstringFormatter('def f(): return 1', 'python', { startToken: '"""', endToken: '"""', declarationIndent: '  ', indentUnit: '\t' });
+		assert.strictEqual(oneLiner.indent, '  \t');
+	});
+
+	test('Re-indents nested functions and docstrings that are already indented', () => {
+		// two space indentation does not divide into the editor's tab size
+		const nested = 'def inner(x):\n      return x';
+		const formatter = new DocstringFormatter(nested, 'python', { startToken: "'''", endToken: "'''", declarationIndent: '    ', indentUnit: '    ' });
+		assert.strictEqual(
+			formatter.format('\n            Inner.\n\n            Parameters\n            ----------\n            x : int\n                The value.\n            '),
+			"      '''\n      Inner.\n\n      Parameters\n      ----------\n      x : int\n          The value.\n      '''\n"
+		);
+	});
+
+	test('Finds functions that already have a docstring', () => {
+		assert.ok(isDocumented('def f(a):\n    # comment\n\n    """A."""\n    return a', 'python'));
+		assert.ok(isDocumented("def f(a): r'''A.'''", 'python'));
+		assert.ok(!isDocumented('def f(a):\n    return "a"', 'python'));
+		assert.ok(!isDocumented('def f(a):\n    pass\n    """Not the docstring."""', 'python'));
+		assert.ok(isDocumented('function f(a) {\n    return a;\n}', 'javascript', ' */'));
+		assert.ok(!isDocumented('function f(a) {\n    return a;\n}', 'javascript', '}'));
+		assert.ok(!isDocumented('function f(a) {\n    return a;\n}', 'typescript'));
+	});
+
+	test('Inserts docstrings below Python signatures and above other declarations', () => {
+		assert.strictEqual(docstringLine(4, 'python'), 5);
+		assert.strictEqual(docstringLine(4, 'typescript'), 4);
+	});
+});
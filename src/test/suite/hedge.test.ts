@@ -0,0 +1,27 @@
+import * as assert from 'assert';
+
+import { HedgeBudget, LatencyTracker } from '../../hedge';
+
+suite('Hedged Requests Test Suite', () => {
+	test('Needs enough samples for a latency percentile', () => {
+		const latency = new LatencyTracker();
+		for (let ms = 1; ms <= 19; ms++) {
+			latency.record(ms * 10);
+		}
+		assert.strictEqual(latency.percentile(95), undefined);
+		latency.record(200);
+		assert.strictEqual(latency.percentile(95), 190);
+		assert.strictEqual(latency.percentile(50), 100);
+	});
+
+	test('Caps hedges to a share of requests', () => {
+		const budget = new HedgeBudget();
+		budget.requests = 19;
+		assert.strictEqual(budget.allows(10), true);
+		budget.hedges = 1;
+		assert.strictEqual(budget.allows(10), false);
+		budget.requests = 20;
+		assert.strictEqual(budget.allows(10), true);
+		assert.strictEqual(budget.allows(0), false);
+	});
+});
@@ -0,0 +1,70 @@
+import * as assert from 'assert';
+import { Memento } from 'vscode';
+
+import { extractFeatures, LengthModel } from '../../lengthModel';
+import { countTokens } from '../../tokenizer';
+
+function memoryState(): Memento {
+	const values = new Map<string, any>();
+	return {
+		keys: () => [...values.keys()],
+		get: (key: string, defaultValue?: any) => values.has(key) ? values.get(key) : defaultValue,
+		update: async (key: string, value: any) => {
+			values.set(key, value);
+		},
+	} as Memento;
+}
+
+suite('Length Model Test Suite', () => {
+	test('Extracts function features', () => {
+		const features = extractFeatures('def f(self, a, b=(1, 2), *args):\n    if a:\n        return a\n    return b', 'python');
+		assert.strictEqual(features.params, 3);
+		assert.strictEqual(features.returns, 2);
+
+		assert.strictEqual(extractFeatures('function g() {\n    return;\n}', 'javascript').params, 0);
+		assert.strictEqual(extractFeatures('function g() {\n    return;\n}', 'javascript').returns, 0);
+	});
+
+	test('Predicts a max_tokens that covers similar docstrings', () => {
+		const state = memoryState();
+		const model = new LengthModel(state);
+		const paramLine = '    name : str\n        The name of the thing.\n';
+		const docstring = (params: number) => '\n    Summary.\n\n    Parameters\n    ----------\n' + paramLine.repeat(params);
+		const features = (params: number) => ({ params, bodyTokens: 200, returns: 1 });
+
+		assert.strictEqual(model.predictMaxTokens(features(2), 'python', 0), undefined);
+		for (let i = 0; i < 30; i++) {
+			model.record(features(i % 6), 'python', 0, docstring(i % 6));
+		}
+
+		const predicted = model.predictMaxTokens(features(3), 'python', 0)!;
+		assert.ok(predicted >= countTokens(docstring(3)));
+		assert.ok(predicted < countTokens(docstring(3)) * 2);
+		// other templates learn separately
+		assert.strictEqual(model.predictMaxTokens(features(3), 'python', 1), undefined);
+		// the model is kept in the global state
+		assert.deepStrictEqual(new LengthModel(state).samples, { 'python:0': 30 });
+	});
+
+	test('Widens predictions after docstrings that were cut off', () => {
+		const model = new LengthModel(memoryState());
+		const features = (params: number) => ({ params, bodyTokens: 100 + params * 20, returns: 1 });
+		const docstring = (params: number) => '\n    Summary.\n' + '    name : str\n        The thing.\n'.repeat(params);
+		for (let i = 0; i < 20; i++) {
+			model.record(features(i % 4), 'python', 0, docstring(i % 4));
+		}
+		const before = model.predictMaxTokens(features(2), 'python', 0)!;
+
+		// the length of a truncated docstring is not learned
+		model.record(features(2), 'python', 0, 'cut', true);
+		assert.deepStrictEqual(model.samples, { 'python:0': 20 });
+		const widened = model.predictMaxTokens(features(2), 'python', 0)!;
+		assert.ok(widened > before);
+
+		// and the widening wears off with docstrings that were not cut off
+		for (let i = 0; i < 10; i++) {
+			model.record(features(i % 4), 'python', 0, docstring(i % 4));
+		}
+		assert.ok(model.predictMaxTokens(features(2), 'python', 0)! < widened);
+	});
+});
@@ -0,0 +1,57 @@
+import * as assert from 'assert';
+import * as fs from 'fs';
+import * as path from 'path';
+
+import { complexityOf, generateLocalDocstring, isTrivial, parseSignature } from '../../localDocstring';
+
+const examplesDir = path.resolve(__dirname, '../../../examples');
+
+function readLines(file: string, start: number, end: number): string {
+	return fs
+		.readFileSync(path.join(examplesDir, file), 'utf8')
+		.split('\n')
+		.slice(start - 1, end)
+		.join('\n');
+}
+
+suite('Local Docstring Test Suite', () => {
+	test('Parses signatures and simple returns', () => {
+		assert.deepStrictEqual(parseSignature('def set_size(self, size: int, force=False) -> None:\n    self.size = size', 'python'), {
+			name: 'set_size',
+			params: [{ name: 'size', type: 'int', default: undefined }, { name: 'force', type: undefined, default: 'False' }],
+			returnType: 'None',
+			returns: undefined,
+		});
+		assert.deepStrictEqual(parseSignature('const area = (width, height = 1) => width * height;', 'javascript'), {
+			name: 'area',
+			params: [{ name: 'width', type: undefined, default: undefined }, { name: 'height', type: undefined, default: '1' }],
+			returnType: undefined,
+			returns: 'width * height',
+		});
+	});
+
+	test('Measures complexity', () => {
+		const flatten = readLines('cardgamebot.py', 719, 725);
+		assert.strictEqual(complexityOf(flatten, 'python'), 3);
+		assert.ok(isTrivial(flatten, 'python', 3));
+		assert.ok(!isTrivial(flatten, 'python', 2));
+		assert.ok(!isTrivial(readLines('cardgamebot.py', 128, 299), 'python', 3));
+		assert.strictEqual(complexityOf('function f(a) {\n    return a?.b ?? (a ? 1 : 2);\n}', 'javascript'), 3);
+	});
+
+	test('Fills the templates', () => {
+		assert.strictEqual(
+			generateLocalDocstring(readLines('cardgamebot.py', 719, 725), 'python', 0),
+			'\n    Flatten.\n\n    Parameters\n    ----------\n    list_2d\n        The list 2d.\n\n    Returns\n    -------\n    list\n        The list.'
+		);
+		assert.strictEqual(
+			generateLocalDocstring('def set_size(self, size: int, force=False):\n    self.size = size', 'python', 1),
+			'\n    Sets the size.\n\n    Parameters:\n        size(int): The size.\n        force(bool): The force. Defaults to False.'
+		);
+		assert.strictEqual(
+			generateLocalDocstring('getName() {\n    return this.name;\n}', 'javascript', 2),
+			'\n* @returns {*} - The name.\n* @description - Returns the name.'
+		);
+		assert.strictEqual(generateLocalDocstring('x = 1', 'python', 0), undefined);
+	});
+});
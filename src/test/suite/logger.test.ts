@@ -0,0 +1,35 @@
+import * as assert from 'assert';
+
+import { Logger, redact } from '../../logger';
+
+suite('Logger Test Suite', () => {
+	test('Only formats messages of enabled levels', () => {
+		const lines: string[] = [];
+		const logger = new Logger(10, line => lines.push(line));
+		let formatted = 0;
+		logger.debug('test', () => `${++formatted}`);
+		assert.strictEqual(formatted, 0);
+		logger.level = 'trace';
+		logger.debug('test', () => `${++formatted}`);
+		assert.strictEqual(formatted, 1);
+		assert.ok(lines[0].endsWith('[debug] [test] 1'));
+		logger.level = 'off';
+		logger.error('test', 'dropped');
+		assert.strictEqual(lines.length, 1);
+	});
+
+	test('Redacts secrets', () => {
+		assert.strictEqual(redact('key sk-abcdefghijklmnop used'), 'key sk-*** used');
+		assert.strictEqual(redact('{"Authorization":"Bearer abc.def"}'), '{"Authorization":"***"}');
+		assert.strictEqual(redact('apiKey: local-secret-1, n: 2'), 'apiKey: ***, n: 2');
+		assert.strictEqual(redact('token local-secret-1', ['local-secret-1']), 'token ***');
+	});
+
+	test('Keeps the most recent entries', () => {
+		const logger = new Logger(3);
+		for (let i = 0; i < 5; i++) {
+			logger.info('test', `${i}`);
+		}
+		assert.deepStrictEqual(logger.recent().map(entry => entry.message), ['2', '3', '4']);
+	});
+});
@@ -0,0 +1,117 @@
+import * as assert from 'assert';
+import * as http from 'http';
+import { AddressInfo } from 'net';
+
+import { postCompletion } from '../../apiClient';
+import { CompletionProvider, OpenAICompatibleProvider, OpenAIProvider, parseChoices } from '../../providers';
+import { readCompletionStream } from '../../stream';
+
+interface ReceivedRequest {
+	path: string;
+	body: any;
+	authorization?: string;
+}
+
+/**
+ * A stand-in completions server: the text of a choice is `doc <prompt>.<n>`.
+ */
+function startStandIn(received: ReceivedRequest[]): Promise<http.Server> {
+	const server = http.createServer((request, response) => {
+		let data = '';
+		request.on('data', chunk => data += chunk);
+		request.on('end', () => {
+			const body = JSON.parse(data);
+			received.push({ path: request.url || '', body, authorization: request.headers.authorization });
+			if (!/\/completions$/.test(request.url || '') || body.prompt === 'fail') {
+				response.writeHead(request.url?.endsWith('/completions') ? 500 : 404, { 'Content-Type': 'application/json' });
+				response.end(JSON.stringify({ error: { message: 'failed' } }));
+				return;
+			}
+			const prompts: string[] = Array.isArray(body.prompt) ? body.prompt : [body.prompt];
+			const n = body.n || 1;
+			const choices = prompts.flatMap((_, i) => Array.from({ length: n }, (__, j) => ({ index: i * n + j, text: `doc ${i}.${j}`, finish_reason: 'stop' })));
+			if (!body.stream) {
+				response.writeHead(200, { 'Content-Type': 'application/json' });
+				response.end(JSON.stringify({ choices }));
+				return;
+			}
+			response.writeHead(200, { 'Content-Type': 'text/event-stream' });
+			for (const choice of choices) {
+				const [first, rest] = choice.text.split(' ');
+				response.write(`data: ${JSON.stringify({ choices: [{ index: choice.index, text: first + ' ', finish_reason: null }] })}\n\n`);
+				response.write(`data: ${JSON.stringify({ choices: [{ index: choice.index, text: rest, finish_reason: 'stop' }] })}\n\n`);
+			}
+			response.end('data: [DONE]\n\n');
+		});
+	});
+	return new Promise(resolve => server.listen(0, '127.0.0.1', () => resolve(server)));
+}
+
+function conformanceSuite(name: string, createProvider: (baseUrl: string) => CompletionProvider) {
+	suite(`Provider Conformance: ${name}`, () => {
+		const received: ReceivedRequest[] = [];
+		let server: http.Server;
+		let provider: CompletionProvider;
+
+		suiteSetup(async () => {
+			server = await startStandIn(received);
+			provider = createProvider(`http://127.0.0.1:${(server.address() as AddressInfo).port}/v1`);
+		});
+
+		suiteTeardown(() => {
+			server.close();
+		});
+
+		async function complete(body: { [key: string]: unknown }, stream = false) {
+			const request = provider.buildRequest('code-davinci-002', { max_tokens: 10, ...body, stream });
+			return postCompletion(request.url, request.body, provider.authorization('sk-openai'), stream);
+		}
+
+		test('Returns every choice of a completion', async () => {
+			const response = await complete({ prompt: 'def f():', n: 2 });
+			assert.deepStrictEqual(parseChoices(response.data), ['doc 0.0', 'doc 0.1']);
+		});
+
+		test('Streams choices', async () => {
+			const response = await complete({ prompt: 'def f():', n: 2 }, true);
+			const deltas: string[] = [];
+			const choices = await readCompletionStream(response.data, chunk => {
+				deltas.push(chunk.text);
+			});
+			assert.deepStrictEqual(choices, ['doc 0.0', 'doc 0.1']);
+			assert.strictEqual(deltas.length, 4);
+		});
+
+		test('Maps multi-prompt choices back by index', async function () {
+			if (!provider.supportsBatch) {
+				this.skip();
+			}
+			const response = await complete({ prompt: ['a', 'b'], n: 2 });
+			assert.deepStrictEqual(parseChoices(response.data), ['doc 0.0', 'doc 0.1', 'doc 1.0', 'doc 1.1']);
+		});
+
+		test('Rejects with the response of a failed request', async () => {
+			await assert.rejects(complete({ prompt: 'fail' }), (error: any) => error.response?.status === 500);
+		});
+
+		test('Only sends the OpenAI key to OpenAI', () => {
+			const last = received[received.length - 1];
+			assert.strictEqual(last.authorization, provider.requiresKey ? 'Bearer sk-openai' : undefined);
+		});
+	});
+}
+
+conformanceSuite('OpenAI', baseUrl => new OpenAIProvider(baseUrl));
+conformanceSuite('OpenAI-compatible', baseUrl => new OpenAICompatibleProvider(baseUrl));
+
+suite('Provider Request Test Suite', () => {
+	test('Builds provider specific requests', () => {
+		const openai = new OpenAIProvider().buildRequest('code-davinci-002', { prompt: 'x' });
+		assert.strictEqual(openai.url, 'https://api.openai.com/v1/engines/code-davinci-002/completions');
+		assert.deepStrictEqual(openai.body, { prompt: 'x' });
+
+		const local = new OpenAICompatibleProvider('http://localhost:8000/v1/').buildRequest('codellama', { prompt: 'x' });
+		assert.strictEqual(local.url, 'http://localhost:8000/v1/completions');
+		assert.deepStrictEqual(local.body, { model: 'codellama', prompt: 'x' });
+	});
+});
@@ -0,0 +1,47 @@
+import * as assert from 'assert';
+
+import { template } from '../../constants/Template';
+import { checkDocstring, rankCandidates, SamplingStats } from '../../quality';
+
+const [numpy, google] = template[0].exampleTemplates;
+const jsdoc = template[1].exampleTemplates[2];
+
+const func = 'def scale(values, factor=2):\n    return [value * factor for value in values]';
+
+suite('Quality Test Suite', () => {
+	test('Passes a complete docstring', () => {
+		const docstring = '\n    Scales the values.\n\n    Parameters\n    ----------\n    values : list\n        The values.\n    factor : int, optional\n        The factor, by default 2.\n\n    Returns\n    -------\n    list\n        The scaled values.\n\n    Examples\n    --------\n    >>> scale([1, 2])\n    [2, 4]\n';
+		assert.deepStrictEqual(checkDocstring(docstring, func, 'python', numpy), { failures: [], score: 1 });
+	});
+
+	test('Finds what is missing', () => {
+		const report = checkDocstring('\n    Scales the values.\n\n    Parameters:\n        values(list): The values.\n', func, 'python', google);
+		assert.deepStrictEqual(report.failures, ['undocumented parameters: factor', 'no return section', 'missing sections: returns, examples']);
+		assert.strictEqual(report.score, 0.25);
+		assert.deepStrictEqual(checkDocstring('\n    ', func, 'python', numpy), { failures: ['empty'], score: 0 });
+	});
+
+	test('Only expects sections the function needs', () => {
+		const docstring = '\n* @description - Logs the state.\n* @example\n* log()\n';
+		assert.deepStrictEqual(checkDocstring(docstring, 'function log() {\n    console.log(state);\n}', 'javascript', jsdoc).failures, []);
+	});
+
+	test('Detects repetition', () => {
+		const docstring = '\n    Scales values by factor and returns them.\n\n    Examples\n    --------\n    >>> scale([1])\n    >>> scale([1])\n';
+		assert.deepStrictEqual(checkDocstring(docstring, func, 'python', '\n    Summary.\n\n    Examples\n    --------\n    >>> f()\n').failures, ['repetition']);
+	});
+
+	test('Ranks by checks, then by likelihood', () => {
+		const reports = [{ failures: ['repetition'], score: 0.75 }, { failures: [], score: 1 }, { failures: [], score: 1 }];
+		assert.deepStrictEqual(rankCandidates(reports, [-0.1, -0.9, -0.4]), [2, 1, 0]);
+		assert.deepStrictEqual(rankCandidates(reports), [1, 2, 0]);
+	});
+
+	test('Averages completions per docstring', () => {
+		const stats = new SamplingStats();
+		stats.record(1, false);
+		stats.record(5, true);
+		assert.strictEqual(stats.average, 3);
+		assert.strictEqual(stats.escalations, 1);
+	});
+});
@@ -0,0 +1,68 @@
+import * as assert from 'assert';
+import * as fs from 'fs';
+import * as path from 'path';
+import { Memento } from 'vscode';
+
+import { ExampleIndex, extractDocumentedFunctions } from '../../retrieval';
+
+const examplesDir = path.resolve(__dirname, '../../../examples');
+
+function memoryState(): Memento {
+	const values = new Map<string, any>();
+	return {
+		keys: () => [...values.keys()],
+		get: (key: string, defaultValue?: any) => values.has(key) ? values.get(key) : defaultValue,
+		update: async (key: string, value: any) => {
+			values.set(key, value);
+		},
+	} as Memento;
+}
+
+suite('Retrieval Test Suite', () => {
+	test('Extracts documented functions without their docstrings', () => {
+		const functions = extractDocumentedFunctions([
+			'class Hand:',
+			'    def size(self):',
+			'        """',
+			'        Number of cards.',
+			'        """',
+			'        return len(self.cards)',
+			'',
+			'    def empty(self):',
+			'        return not self.cards',
+		].join('\n'), 'python');
+		assert.deepStrictEqual(functions, [
+			{ code: 'def size(self):\n    return len(self.cards)', docstring: '\n    Number of cards.\n    ' },
+		]);
+
+		const js = extractDocumentedFunctions('/**\n * Adds two numbers.\n */\nfunction add(a, b) {\n    return a + b;\n}', 'javascript');
+		assert.deepStrictEqual(js, [{ code: 'function add(a, b) {\n    return a + b;\n}', docstring: '\n* Adds two numbers.\n' }]);
+	});
+
+	test('Finds the most similar documented functions', () => {
+		const index = new ExampleIndex(memoryState());
+		const text = fs.readFileSync(path.join(examplesDir, 'cardgamebot.py'), 'utf8');
+		index.update('cardgamebot.py', 1, text, 'python');
+		assert.ok(index.size >= 3);
+
+		const query = 'def find_run(hand, wild_count):\n    group = sorted(hand)\n    return run_check(group, max_wild=wild_count)';
+		const examples = index.find(query, 'python', 1000, 1);
+		assert.strictEqual(examples.length, 1);
+		assert.ok(examples[0].code.startsWith('def run_check('));
+		assert.deepStrictEqual(index.find(query, 'python', 10), []);
+		assert.deepStrictEqual(index.find(query, 'javascript', 1000), []);
+		// functions that are not accepted are skipped
+		const isRunCheck = (example: { code: string }) => example.code.startsWith('def run_check(');
+		assert.ok(!index.find(query, 'python', 1000, 1, example => !isRunCheck(example)).some(isRunCheck));
+
+		// a documented function is not its own example, however it is indented
+		const colourCheck = text.slice(text.indexOf('def colour_check('), text.indexOf('\ndef ', text.indexOf('def colour_check(') + 1));
+		const indented = colourCheck.split('\n').map((line, i) => i ? '    ' + line : line).join('\n');
+		for (const own of [colourCheck, indented]) {
+			assert.ok(index.find(own, 'python', 1000).every(example => !example.code.startsWith('def colour_check(')));
+		}
+
+		index.remove('cardgamebot.py');
+		assert.strictEqual(index.size, 0);
+	});
+});
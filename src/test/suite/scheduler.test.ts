@@ -0,0 +1,101 @@
+import * as assert from 'assert';
+import { CancellationError, CancellationTokenSource } from 'vscode';
+
+import { CircuitOpenError, parseDuration, RequestScheduler } from '../../scheduler';
+
+function httpError(status: number, headers: { [name: string]: string } = {}) {
+	return Object.assign(new Error(`Request failed with status code ${status}`), { response: { status, headers } });
+}
+
+function limits(maxRetries: number) {
+	return () => ({ requestsPerMinute: 600, tokensPerMinute: 100000, maxConcurrent: 2, maxRetries });
+}
+
+suite('Request Scheduler Test Suite', () => {
+	test('Parses rate limit reset durations', () => {
+		assert.strictEqual(parseDuration('1s'), 1000);
+		assert.strictEqual(parseDuration('6m0s'), 360000);
+		assert.strictEqual(parseDuration('120ms'), 120);
+		assert.strictEqual(parseDuration('2'), 2000);
+		assert.strictEqual(parseDuration(undefined), 0);
+	});
+
+	test('Retries throttled requests but not client errors', async function () {
+		this.timeout(5000);
+		const scheduler = new RequestScheduler(limits(2));
+		let attempts = 0;
+		const result = await scheduler.schedule(10, async () => {
+			attempts += 1;
+			if (attempts === 1) {
+				throw httpError(429, { 'retry-after-ms': '10' });
+			}
+			return 'ok';
+		});
+		assert.strictEqual(result, 'ok');
+		assert.strictEqual(scheduler.retries, 1);
+		assert.strictEqual(scheduler.throttled, 1);
+
+		let clientAttempts = 0;
+		await assert.rejects(scheduler.schedule(10, async () => {
+			clientAttempts += 1;
+			throw httpError(401);
+		}));
+		assert.strictEqual(clientAttempts, 1);
+	});
+
+	test('Cancelled requests are never sent', async () => {
+		const scheduler = new RequestScheduler(limits(0));
+		const slow = () => new Promise<void>(resolve => setTimeout(resolve, 20));
+		const running = [scheduler.schedule(10, slow), scheduler.schedule(10, slow)];
+
+		const cancellation = new CancellationTokenSource();
+		let sent = false;
+		const queued = scheduler.schedule(10, async () => {
+			sent = true;
+		}, cancellation.token);
+		assert.strictEqual(scheduler.queued, 1);
+		cancellation.cancel();
+
+		await assert.rejects(queued, CancellationError);
+		await Promise.all(running);
+		assert.strictEqual(sent, false);
+		assert.strictEqual(scheduler.queued, 0);
+	});
+
+	test('Interactive requests are sent before queued bulk work', async () => {
+		const scheduler = new RequestScheduler(() => ({ requestsPerMinute: 600, tokensPerMinute: 100000, maxConcurrent: 1, maxRetries: 0 }));
+		const order: string[] = [];
+		const job = (name: string) => async () => {
+			order.push(name);
+			await new Promise(resolve => setTimeout(resolve, 5));
+		};
+		const done = [
+			scheduler.schedule(10, job('bulk 1'), undefined, 'bulk'),
+			scheduler.schedule(10, job('bulk 2'), undefined, 'bulk'),
+			scheduler.schedule(10, job('prefetch'), undefined, 'prefetch'),
+			scheduler.schedule(10, job('interactive'), undefined, 'interactive'),
+		];
+		await Promise.all(done);
+		assert.deepStrictEqual(order, ['bulk 1', 'interactive', 'prefetch', 'bulk 2']);
+
+		const waits = scheduler.queueWaitStats();
+		assert.strictEqual(waits.bulk.count, 2);
+		assert.strictEqual(waits.interactive.count, 1);
+		assert.ok(waits.bulk.maxMs >= waits.interactive.maxMs);
+	});
+
+	test('Opens the circuit after repeated failures', async () => {
+		const scheduler = new RequestScheduler(limits(0));
+		for (let i = 0; i < 5; i++) {
+			await assert.rejects(scheduler.schedule(10, async () => {
+				throw httpError(503);
+			}));
+		}
+		assert.strictEqual(scheduler.circuit, 'open');
+		let sent = false;
+		await assert.rejects(scheduler.schedule(10, async () => {
+			sent = true;
+		}), CircuitOpenError);
+		assert.strictEqual(sent, false);
+	});
+});
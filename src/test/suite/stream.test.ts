@@ -0,0 +1,33 @@
+import * as assert from 'assert';
+import { Readable } from 'stream';
+
+import { readCompletionStream } from '../../stream';
+
+suite('Completion Stream Test Suite', () => {
+	test('Reassembles choices from events split across chunks', async () => {
+		const event = (index: number, text: string) =>
+			`data: ${JSON.stringify({ choices: [{ index, text, finish_reason: null }] })}\n\n`;
+		const body = event(0, '\n    Sorts') + event(1, 'Other') + event(0, ' the array ✅.') + 'data: [DONE]\n\n';
+		const bytes = Buffer.from(body, 'utf8');
+		// split in the middle of an event and of the multi-byte character
+		const split = bytes.indexOf(Buffer.from('✅', 'utf8')) + 1;
+		const stream = Readable.from([bytes.slice(0, 10), bytes.slice(10, split), bytes.slice(split)]);
+
+		const deltas: string[] = [];
+		const choices = await readCompletionStream(stream, chunk => {
+			deltas.push(`${chunk.index}:${chunk.text}`);
+		});
+
+		assert.deepStrictEqual(choices, ['\n    Sorts the array ✅.', 'Other']);
+		assert.deepStrictEqual(deltas, ['0:\n    Sorts', '1:Other', '0: the array ✅.']);
+	});
+
+	test('Passes on the log probabilities of each chunk', async () => {
+		const event = { choices: [{ index: 0, text: ' Sorts', finish_reason: null, logprobs: { token_logprobs: [-0.5, -0.25] } }] };
+		const logprobs: (number | null)[][] = [];
+		await readCompletionStream(Readable.from([`data: ${JSON.stringify(event)}\n\ndata: [DONE]\n\n`]), chunk => {
+			logprobs.push(chunk.logprobs!);
+		});
+		assert.deepStrictEqual(logprobs, [[-0.5, -0.25]]);
+	});
+});
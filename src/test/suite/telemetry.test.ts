@@ -0,0 +1,55 @@
+import * as assert from 'assert';
+
+import { formatSnapshot, Histogram, Telemetry } from '../../telemetry';
+
+suite('Telemetry Test Suite', () => {
+	test('Computes percentiles of the recorded durations', () => {
+		const histogram = new Histogram();
+		for (let ms = 1; ms <= 100; ms++) {
+			histogram.record(ms);
+		}
+		const stats = histogram.stats();
+		assert.strictEqual(stats.count, 100);
+		assert.strictEqual(stats.meanMs, 50.5);
+		assert.strictEqual(stats.p50Ms, 50);
+		assert.strictEqual(stats.p95Ms, 95);
+		assert.strictEqual(stats.p99Ms, 99);
+		assert.strictEqual(stats.maxMs, 100);
+	});
+
+	test('Keeps only the most recent samples for percentiles', () => {
+		const histogram = new Histogram();
+		for (let i = 0; i < 1000; i++) {
+			histogram.record(1000);
+		}
+		for (let i = 0; i < 1000; i++) {
+			histogram.record(1);
+		}
+		const stats = histogram.stats();
+		assert.strictEqual(stats.count, 2000);
+		assert.strictEqual(stats.p99Ms, 1);
+		assert.strictEqual(stats.maxMs, 1000);
+	});
+
+	test('Sums token usage and hit rates until reset', () => {
+		const telemetry = new Telemetry();
+		telemetry.recordUsage({ prompt_tokens: 100, completion_tokens: 20, total_tokens: 120 });
+		telemetry.recordUsage({ prompt_tokens: 50, completion_tokens: 10 }, true);
+		telemetry.hit('cache', true);
+		telemetry.hit('cache', false);
+		telemetry.hit('cache', false);
+		telemetry.record('total', 800);
+
+		const snapshot = telemetry.snapshot();
+		assert.deepStrictEqual(snapshot.usage, { requests: 2, estimatedRequests: 1, promptTokens: 150, completionTokens: 30, totalTokens: 180 });
+		assert.deepStrictEqual(snapshot.hitRates.cache, { hits: 1, misses: 2, rate: 1 / 3 });
+		assert.strictEqual(snapshot.phases.total.p50Ms, 800);
+		assert.ok(formatSnapshot(snapshot).includes('total 800 / 800 / 800ms'));
+
+		telemetry.reset();
+		const empty = telemetry.snapshot();
+		assert.strictEqual(empty.usage.requests, 0);
+		assert.deepStrictEqual(empty.hitRates, {});
+		assert.strictEqual(empty.phases.total.count, 0);
+	});
+});
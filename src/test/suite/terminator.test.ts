@@ -0,0 +1,45 @@
+import * as assert from 'assert';
+
+import { template } from '../../constants/Template';
+import { DocstringTerminator, findSectionHeaders } from '../../terminator';
+
+const numpyTemplate = template[0].exampleTemplates[0];
+
+function stream(terminator: DocstringTerminator, text: string): string {
+	let kept = '';
+	// feed a few characters at a time, like streamed tokens
+	for (let i = 0; i < text.length && !terminator.done; i += 3) {
+		kept += terminator.push(0, text.slice(i, i + 3));
+	}
+	return kept + terminator.end(0);
+}
+
+suite('Docstring Terminator Test Suite', () => {
+	test('Finds the sections of the templates', () => {
+		assert.deepStrictEqual(findSectionHeaders(numpyTemplate), ['parameters', 'returns', 'examples']);
+		assert.deepStrictEqual(findSectionHeaders(template[0].exampleTemplates[1]), ['parameters', 'returns', 'examples']);
+		assert.deepStrictEqual(findSectionHeaders(template[1].exampleTemplates[2]), []);
+	});
+
+	test('Stops after the final section', () => {
+		const terminator = new DocstringTerminator('python', "'''", numpyTemplate, 1, 200);
+		const kept = stream(terminator, numpyTemplate + '\n    def other(x):\n        pass\n');
+		assert.strictEqual(kept, numpyTemplate + '\n');
+		assert.ok(terminator.tokensSaved > 0);
+	});
+
+	test('Stops at repeated lines and the closing token', () => {
+		const repeating = new DocstringTerminator('python', "'''", numpyTemplate, 1, 200);
+		assert.strictEqual(stream(repeating, '\n    Foo.\n    Bar.\n    Bar.\n    Bar.\n'), '\n    Foo.\n    Bar.\n');
+
+		const closed = new DocstringTerminator('python', "'''", numpyTemplate, 1, 200);
+		assert.strictEqual(stream(closed, "\n    Foo. ''' def"), '\n    Foo. ');
+	});
+
+	test('Keeps complete docstrings untouched', () => {
+		const terminator = new DocstringTerminator('python', "'''", numpyTemplate, 1, 200);
+		const docstring = '\n    Foo.\n\n    Parameters\n    ----------\n    a : int\n        From the list.\n';
+		assert.strictEqual(stream(terminator, docstring), docstring);
+		assert.strictEqual(terminator.tokensSaved, 0);
+	});
+});
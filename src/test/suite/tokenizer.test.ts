@@ -0,0 +1,86 @@
+import * as assert from 'assert';
+
+import { budgetPrompt, fitsContext, skeletonize } from '../../budget';
+import { BpeEncoder, countTokens, estimateTokenCount, isTokenCountExact } from '../../tokenizer';
+
+const longFunction = [
+	'def total(items):',
+	'    result = 0',
+	...Array.from({ length: 40 }, (_, i) => `    result = result + items[${i}] * ${i} - compute_something_expensive(items, ${i})`),
+	'    if result < 0:',
+	'        raise ValueError("negative")',
+	'    return result',
+].join('\n');
+
+suite('Tokenizer Test Suite', () => {
+	test('Applies merge rules in rank order', () => {
+		const encoder = new BpeEncoder(['#version: 0.2', 'h e', 'l l', 'he ll', 'hell o']);
+		assert.strictEqual(encoder.count('hello'), 1);
+		// the leading space of the second word is not merged
+		assert.strictEqual(encoder.count('hello hello'), 3);
+		assert.strictEqual(encoder.count('hexo'), 3);
+	});
+
+	test('Counts tokens with the bundled encodings', () => {
+		// counts of the reference GPT-2 tokenizer
+		assert.strictEqual(countTokens('def total(items):\n    result = 0\n    return result', 'text-davinci-001'), 18);
+		assert.strictEqual(countTokens('        if a[j] > a[j + 1]:\n            swap(a, j)', 'text-davinci-001'), 37);
+		assert.strictEqual(countTokens('Ünïcödé 😀 strings "quoted"\n\n\n  x', 'text-davinci-001'), 19);
+		// the Codex encoding has single tokens for runs of spaces
+		assert.strictEqual(countTokens('    return x', 'code-davinci-002'), 3);
+		assert.strictEqual(countTokens('    return x', 'text-davinci-001'), 5);
+		assert.ok(isTokenCountExact('code-davinci-002'));
+		// unknown engines fall back to the estimate
+		assert.ok(!isTokenCountExact('some-local-model'));
+		assert.strictEqual(countTokens(longFunction, 'some-local-model'), estimateTokenCount(longFunction));
+	});
+
+	test('Estimates token counts of code', () => {
+		assert.strictEqual(estimateTokenCount(''), 0);
+		assert.strictEqual(estimateTokenCount('return x'), 3);
+		assert.ok(estimateTokenCount(longFunction) > 400);
+	});
+
+	test('Reduces long functions to their skeleton', () => {
+		assert.strictEqual(
+			skeletonize(longFunction, 'python'),
+			'def total(items):\n    ...\n    if result < 0:\n        raise ValueError("negative")\n    return result'
+		);
+		// signatures that span several lines are kept whole
+		assert.strictEqual(
+			skeletonize('def f(a,\n      b: Dict[str,\n               int]) -> int:  # (\n    x = a\n    return x', 'python'),
+			'def f(a,\n      b: Dict[str,\n               int]) -> int:  # (\n    ...\n    return x'
+		);
+		assert.strictEqual(
+			skeletonize('function f({ a,\n    b }) {\n    const x = a;\n    function g(c,\n        d) {\n        return c;\n    }\n    return x;\n}', 'javascript'),
+			'function f({ a,\n    b }) {\n    // ...\n    function g(c,\n        d) {\n        return c;\n    }\n    return x;\n}'
+		);
+	});
+
+	test('Fits prompt and completion into the context', () => {
+		const fitting = budgetPrompt(text => text, 'def f():\n    return 1', 'python', 100, 2048);
+		assert.strictEqual(fitting.trimmed, 'none');
+		assert.strictEqual(fitting.maxTokens, 100);
+
+		// a tenth of the context is kept free, as the counts are estimated
+		const skeleton = budgetPrompt(text => text, longFunction, 'python', 100, 200);
+		assert.strictEqual(skeleton.trimmed, 'skeleton');
+		assert.ok(skeleton.promptTokens + skeleton.maxTokens <= 180);
+
+		const truncated = budgetPrompt(text => text, longFunction, 'python', 100, 130);
+		assert.strictEqual(truncated.trimmed, 'truncated');
+		assert.ok(truncated.prompt.startsWith('def total(items):'));
+		assert.strictEqual(truncated.promptTokens, countTokens(truncated.prompt));
+		assert.ok(truncated.promptTokens + truncated.maxTokens <= 117);
+
+		// exact counts use the whole context
+		const exact = budgetPrompt(text => text, longFunction, 'python', 2000, 1000, 'code-davinci-002');
+		assert.strictEqual(exact.promptTokens, countTokens(exact.prompt, 'code-davinci-002'));
+		assert.strictEqual(exact.promptTokens + exact.maxTokens, 1000);
+
+		// code-cushman-001 has 2048 tokens of context
+		const tokens = countTokens(longFunction, 'code-cushman-001');
+		assert.ok(fitsContext(longFunction, 2048 - tokens, 'code-cushman-001'));
+		assert.ok(!fitsContext(longFunction, 2049 - tokens, 'code-cushman-001'));
+	});
+});
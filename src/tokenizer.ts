@@ -0,0 +1,200 @@
+import * as fs from "fs";
+import * as path from "path";
+import { workspace } from "vscode";
+import { logger } from "./logger";
+
+/** Splits text into the pieces that are encoded independently (GPT-2 style) */
+const PRE_TOKENIZE = /'s|'t|'re|'ve|'m|'ll|'d| ?\p{L}+| ?\p{N}+| ?[^\s\p{L}\p{N}]+|\s+(?!\S)|\s+/gu;
+const MAX_CACHED_PIECES = 20000;
+/** The GPT-2 merge rules, which the GPT-3 and Codex encodings build on */
+const MERGES_FILE = path.join(__dirname, "..", "resources", "tokenizer", "vocab.bpe");
+
+export type Encoding = "r50k_base" | "p50k_base";
+
+/** Encoding of known engines (as in OpenAI's tiktoken) */
+const ENGINE_ENCODINGS: { [engine: string]: Encoding } = {
+    "code-davinci-002": "p50k_base",
+    "code-davinci-001": "p50k_base",
+    "code-cushman-002": "p50k_base",
+    "code-cushman-001": "p50k_base",
+    "davinci-codex": "p50k_base",
+    "cushman-codex": "p50k_base",
+    "text-davinci-003": "p50k_base",
+    "text-davinci-002": "p50k_base",
+    "text-davinci-001": "r50k_base",
+    "text-curie-001": "r50k_base",
+    "text-babbage-001": "r50k_base",
+    "text-ada-001": "r50k_base",
+    "davinci": "r50k_base",
+    "curie": "r50k_base",
+    "babbage": "r50k_base",
+    "ada": "r50k_base",
+};
+
+/**
+ * GPT-2's reversible mapping of bytes to printable characters, which the
+ *  merge rules are written in.
+ */
+function bytesToUnicode(): string[] {
+    const bytes: number[] = [];
+    for (let b = "!".charCodeAt(0); b <= "~".charCodeAt(0); b++) { bytes.push(b); }
+    for (let b = "¡".charCodeAt(0); b <= "¬".charCodeAt(0); b++) { bytes.push(b); }
+    for (let b = "®".charCodeAt(0); b <= "ÿ".charCodeAt(0); b++) { bytes.push(b); }
+    const chars: string[] = [];
+    let extra = 0;
+    for (let b = 0; b < 256; b++) {
+        chars[b] = String.fromCharCode(bytes.includes(b) ? b : 256 + extra++);
+    }
+    return chars;
+}
+
+const BYTE_CHARS = bytesToUnicode();
+/** Runs of 2 to 25 spaces, which the Codex encoding adds as single tokens */
+const WHITESPACE_RUNS = Array.from({ length: 24 }, (_, i) => BYTE_CHARS[" ".charCodeAt(0)].repeat(i + 2));
+
+/**
+ * Byte-level BPE encoder for the GPT-2 / GPT-3 / Codex family of tokenizers.
+ *  Pieces are cached, so repeated identifiers and indentation are only
+ *  merged once.
+ */
+export class BpeEncoder {
+    /** rank of every token that results from a merge */
+    private readonly ranks = new Map<string, number>();
+    private readonly cache = new Map<string, number>();
+
+    /**
+     * @param merges - merge rules (`a b`) in order of priority
+     * @param extraTokens - tokens ranked after the merges
+     */
+    constructor(merges: string[], extraTokens: string[] = []) {
+        for (const merge of merges) {
+            if (merge && !merge.startsWith("#version")) {
+                this.ranks.set(merge.replace(" ", ""), this.ranks.size);
+            }
+        }
+        for (const token of extraTokens) {
+            this.ranks.set(token, this.ranks.size);
+        }
+    }
+
+    /**
+     * @returns the number of tokens `text` is encoded to
+     */
+    public count(text: string): number {
+        let count = 0;
+        for (const match of text.matchAll(PRE_TOKENIZE)) {
+            count += this.countPiece(match[0]);
+        }
+        return count;
+    }
+
+    private countPiece(piece: string): number {
+        const cached = this.cache.get(piece);
+        if (cached !== undefined) {
+            return cached;
+        }
+        const symbols = [...Buffer.from(piece, "utf8")].map(b => BYTE_CHARS[b]);
+        const count = this.merge(symbols).length;
+        if (this.cache.size >= MAX_CACHED_PIECES) {
+            this.cache.clear();
+        }
+        this.cache.set(piece, count);
+        return count;
+    }
+
+    /**
+     * Repeatedly merges the leftmost adjacent pair whose merged token has the
+     *  lowest rank.
+     */
+    private merge(symbols: string[]): string[] {
+        while (symbols.length > 1) {
+            let best = -1;
+            let bestRank = Infinity;
+            for (let i = 0; i < symbols.length - 1; i++) {
+                const rank = this.ranks.get(symbols[i] + symbols[i + 1]);
+                if (rank !== undefined && rank < bestRank) {
+                    best = i;
+                    bestRank = rank;
+                }
+            }
+            if (best === -1) {
+                break;
+            }
+            symbols.splice(best, 2, symbols[best] + symbols[best + 1]);
+        }
+        return symbols;
+    }
+}
+
+let merges: string[] | undefined;
+const encoders = new Map<Encoding, BpeEncoder | undefined>();
+
+/**
+ * @returns the encoder of `encoding`, loaded from the bundled merge rules the
+ *  first time it is used, or `undefined` if they cannot be read
+ */
+export function getEncoder(encoding: Encoding): BpeEncoder | undefined {
+    if (!encoders.has(encoding)) {
+        try {
+            merges = merges || fs.readFileSync(MERGES_FILE, "utf8").split(/\r?\n/);
+            encoders.set(encoding, new BpeEncoder(merges, encoding === "p50k_base" ? WHITESPACE_RUNS : []));
+        } catch (error) {
+            logger.warn("getEncoder", `could not load ${MERGES_FILE}: ${error}`);
+            encoders.set(encoding, undefined);
+        }
+    }
+    return encoders.get(encoding);
+}
+
+/**
+ * @returns the encoding of `engine`, or `undefined` if it is not known
+ */
+export function getEncoding(engine: string): Encoding | undefined {
+    return ENGINE_ENCODINGS[engine];
+}
+
+/**
+ * Estimates the token count without merge rules, calibrated on code: words
+ *  are about 4 characters per token, punctuation 2 and indentation runs are
+ *  merged into few tokens.
+ */
+export function estimateTokenCount(text: string): number {
+    let count = 0;
+    for (const match of text.matchAll(PRE_TOKENIZE)) {
+        const piece = match[0];
+        const trimmed = piece.trim();
+        if (!trimmed) {
+            count += Math.ceil(piece.length / 8);
+        } else if (/^[\p{L}\p{N}]/u.test(trimmed)) {
+            count += Math.ceil(trimmed.length / 4);
+        } else {
+            count += Math.ceil(trimmed.length / 2);
+        }
+    }
+    return count;
+}
+
+/**
+ * @returns the configured `doxide.openAI.engine`
+ */
+function configuredEngine(): string {
+    return workspace.getConfiguration("doxide").get("openAI.engine") || "";
+}
+
+/**
+ * @returns whether `countTokens` is exact for `engine`, rather than estimated
+ */
+export function isTokenCountExact(engine = configuredEngine()): boolean {
+    const encoding = getEncoding(engine);
+    return encoding !== undefined && getEncoder(encoding) !== undefined;
+}
+
+/**
+ * @returns the number of tokens of `text` with the encoding of `engine`
+ *  (by default the configured one), estimated if the engine is not known
+ */
+export function countTokens(text: string, engine = configuredEngine()): number {
+    const encoding = getEncoding(engine);
+    const encoder = encoding && getEncoder(encoding);
+    return encoder ? encoder.count(text) : estimateTokenCount(text);
+}